@@ -1,7 +1,12 @@
 import json
+import os
+import re
+import tempfile
 import time
+from datetime import datetime
 import getpass
 
+from .RateLimiter import APIRateLimiter
 from .CredentialsManager import is_api_key_encrypted, decrypt_api_key, CredentialProfile
 from .JsonPayloadTypes import LabelGroupObjectJsonStructure, LabelObjectCreationJsonStructure, \
     LabelObjectJsonStructure, LabelObjectUpdateJsonStructure, PCEObjectsJsonStructure, \
@@ -20,17 +25,22 @@ try:
 except ImportError:
     import requests
 
-from threading import Thread
+from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor, Future
 from queue import Queue
 import illumio_pylo as pylo
 from illumio_pylo import log
-from typing import Union, Dict, Any, List, Optional, Literal
+from typing import Union, Dict, Any, List, Optional, Literal, Iterator, Set
 
 requests.packages.urllib3.disable_warnings()
 
 default_retry_count_if_api_call_limit_reached = 3
 default_retry_wait_time_if_api_call_limit_reached = 10
 default_max_objects_for_sync_calls = 200000
+default_max_events_for_delta_refresh = 10000
+default_max_changes_per_type_for_delta_refresh = 1000
+default_explorer_poll_initial_interval_seconds = 1.0
+default_explorer_poll_backoff_factor = 1.5
 
 
 def get_field_or_die(field_name: str, data):
@@ -59,6 +69,31 @@ all_object_types: Dict[ObjectTypes, ObjectTypes] = {
     'label_dimensions': 'label_dimensions'
 }
 
+# used to find out which object an HREF found in audit events belongs to, sub-objects (ie: rules) resolve to their parent
+object_types_href_patterns: Dict[ObjectTypes, re.Pattern] = {
+    'iplists': re.compile(r'^/orgs/\d+/sec_policy/draft/ip_lists/[^/]+'),
+    'workloads': re.compile(r'^/orgs/\d+/workloads/[^/]+'),
+    'virtual_services': re.compile(r'^/orgs/\d+/sec_policy/draft/virtual_services/[^/]+'),
+    'labels': re.compile(r'^/orgs/\d+/labels/[^/]+'),
+    'labelgroups': re.compile(r'^/orgs/\d+/sec_policy/draft/label_groups/[^/]+'),
+    'services': re.compile(r'^/orgs/\d+/sec_policy/draft/services/[^/]+'),
+    'rulesets': re.compile(r'^/orgs/\d+/sec_policy/draft/rule_sets/[^/]+'),
+    'security_principals': re.compile(r'^/orgs/\d+/security_principals/[^/]+'),
+    'label_dimensions': re.compile(r'^/orgs/\d+/label_dimensions/[^/]+')
+}
+
+object_types_api_paths: Dict[ObjectTypes, str] = {
+    'iplists': '/sec_policy/draft/ip_lists',
+    'workloads': '/workloads',
+    'virtual_services': '/sec_policy/draft/virtual_services',
+    'labels': '/labels',
+    'labelgroups': '/sec_policy/draft/label_groups',
+    'services': '/sec_policy/draft/services',
+    'rulesets': '/sec_policy/draft/rule_sets',
+    'security_principals': '/security_principals',
+    'label_dimensions': '/label_dimensions'
+}
+
 
 class APIConnector:
     """docstring for APIConnector."""
@@ -77,6 +112,10 @@ class APIConnector:
         self.version: Optional['pylo.SoftwareVersion'] = None
         self.version_string: str = "Not Defined"
         self._cached_session = requests.sessions.Session()
+        # shared by all threads using this connector (and its clones) so they draw from the same API calls budget
+        self.rate_limiter: APIRateLimiter = APIRateLimiter()
+        # set when the PCE doesn't support getting the status of a single explorer async query
+        self._explorer_status_by_listing_only = False
 
     @property
     def api_key(self):
@@ -87,6 +126,19 @@ class APIConnector:
             return self._decrypted_api_key
         return self._api_key
 
+    def clone(self) -> 'APIConnector':
+        """
+        Creates a new connector with the same credentials and settings but its own HTTP session
+        """
+        connector = APIConnector(self.fqdn, self.port, self.api_user, self._api_key,
+                                 skip_ssl_cert_check=self.skipSSLCertCheck, org_id=self.org_id, name=self.name)
+        connector._decrypted_api_key = self._decrypted_api_key
+        connector.version = self.version
+        connector.version_string = self.version_string
+        connector.rate_limiter = self.rate_limiter
+        connector._explorer_status_by_listing_only = self._explorer_status_by_listing_only
+        return connector
+
     @staticmethod
     def get_all_object_types_names_except(exception_list: List[ObjectTypes]):
 
@@ -167,6 +219,17 @@ class APIConnector:
             return self.do_get_call(path=path, async_call=False, params=data_copy)
 
         # We will grab the maximum allowed with sync mode (variable default_max_objects_for_sync_calls) and switch to async if it's higher
+        results = self._get_objects_sync_or_none_if_over_limit(path, data_copy)
+        if results is None:
+            return self.do_get_call(path=path, async_call=True, params=data_copy)
+        return results
+
+    def _get_objects_sync_or_none_if_over_limit(self, path: str, data: Dict[str, Any]) -> Optional[Any]:
+        """
+        Grabs objects with a sync call, if the PCE has more than default_max_objects_for_sync_calls of them then None
+        is returned, and an async call should be made instead.
+        """
+        data_copy = data.copy()
         data_copy['max_results'] = default_max_objects_for_sync_calls
         results = self.do_get_call(path=path, async_call=False, params=data_copy, return_headers=True)
         total_count = results[1].get('x-total-count')
@@ -175,9 +238,7 @@ class APIConnector:
         if not total_count.isdigit():
             raise pylo.PyloApiEx('API returned invalid value for "x-total-count": {}'.format(total_count))
         if int(total_count) > default_max_objects_for_sync_calls:
-            # remove the max_results from data
-            del data_copy['max_results']
-            return self.do_get_call(path=path, async_call=True, params=data_copy)
+            return None
         return results[0]
 
     def do_get_call(self, path, json_arguments=None, include_org_id=True, json_output_expected=True, async_call=False, params=None, skip_product_version_check=False,
@@ -222,7 +283,7 @@ class APIConnector:
                  skip_product_version_check=False, params=None,
                  retry_count_if_api_call_limit_reached=default_retry_count_if_api_call_limit_reached,
                  retry_wait_time_if_api_call_limit_reached=default_retry_wait_time_if_api_call_limit_reached,
-                 return_headers: bool = False):
+                 return_headers: bool = False, async_submit_only: bool = False):
 
         if self.version is None and not skip_product_version_check:
             self.collect_pce_infos()
@@ -241,6 +302,8 @@ class APIConnector:
 
             log.info("Request URL: " + url)
 
+            self.rate_limiter.acquire()
+
             try:
                 req = self._cached_session.request(method, url, headers=headers, auth=(self.api_user, self.api_key),
                                                    verify=(not self.skipSSLCertCheck), json=json_arguments,
@@ -256,50 +319,11 @@ class APIConnector:
             # log.info("Request returned code "+ str(req.status_code) + ". Raw output:\n" + req.text[0:2000])
 
             if async_call:
-                if (method == 'GET' or method == 'POST') and req.status_code != 202:
-                    orig_request = req.request  # type: requests.PreparedRequest
-                    raise Exception("Status code for Async call should be 202 but " + str(req.status_code)
-                                    + " " + req.reason + " was returned with the following body: " + req.text +
-                                    "\n\n Request was: " + orig_request.url + "\nHEADERS: " + str(orig_request.headers) +
-                                    "\nBODY:\n" + str(orig_request.body))
-
-                if 'Location' not in req.headers:
-                    raise Exception('Header "Location" was not found in API answer!')
-                if 'Retry-After' not in req.headers:
-                    raise Exception('Header "Retry-After" was not found in API answer!')
-
-                job_location = req.headers['Location']
-                retry_interval = int(req.headers['Retry-After'])
-
-                retry_loop_times = 0
-
-                while True:
-                    log.info(
-                        "Sleeping " + str(retry_interval) + " seconds before polling for job status, elapsed " + str(
-                            retry_interval * retry_loop_times) + " seconds so far")
-                    retry_loop_times += 1
-                    time.sleep(retry_interval)
-                    job_poll = self.do_get_call(job_location, include_org_id=False)
-                    if 'status' not in job_poll:
-                        raise Exception('Job polling request did not return a "status" field')
-                    job_poll_status = job_poll['status']
-
-                    if job_poll_status == 'failed':
-                        if 'result' in job_poll and 'message' in job_poll['result']:
-                            raise Exception('Job polling return with status "Failed": ' + job_poll['result']['message'])
-                        else:
-                            raise Exception('Job polling return with status "Failed": ' + job_poll)
-
-                    if job_poll_status == 'done':
-                        if 'result' not in job_poll:
-                            raise Exception('Job is marked as done but has no "result"')
-                        if 'href' not in job_poll['result']:
-                            raise Exception("Job is marked as done but did not return a href to download resulting Dataset")
-
-                        result_href = job_poll['result']['href']
-                        break
+                job_location, retry_interval = self._async_job_extract_location(method, req)
+                if async_submit_only:
+                    return job_location, retry_interval
 
-                    log.info("Job status is " + job_poll_status)
+                result_href = self._async_job_wait(job_location, retry_interval)
 
                 log.info("Job is done, we will now download the resulting dataset")
                 dataset = self.do_get_call(result_href, include_org_id=False, return_headers=return_headers)
@@ -325,11 +349,17 @@ class APIConnector:
                                         'API has hit DOS protection limit (X calls per minute)', json_out)
 
                                 retry_count_if_api_call_limit_reached = retry_count_if_api_call_limit_reached - 1
+                                # PCE tells us how long to wait, the fixed wait time is only a fallback
+                                wait_time = retry_wait_time_if_api_call_limit_reached
+                                retry_after = req.headers.get('Retry-After')
+                                if retry_after is not None and retry_after.isdigit():
+                                    wait_time = int(retry_after)
                                 log.info(
-                                    "API has returned 'too_many_requests_error', we will sleep for {} seconds and retry {} more times".format(
-                                        retry_wait_time_if_api_call_limit_reached,
+                                    "API has returned 'too_many_requests_error', we will wait for {} seconds and retry {} more times".format(
+                                        wait_time,
                                         retry_count_if_api_call_limit_reached))
-                                time.sleep(retry_wait_time_if_api_call_limit_reached)
+                                # the wait itself happens in rate_limiter.acquire() so all threads sharing it slow down
+                                self.rate_limiter.report_too_many_requests(wait_time)
                                 continue
 
                 if req.status_code == 403:
@@ -337,9 +367,16 @@ class APIConnector:
                         'API returned error status "' + str(req.status_code) + ' ' + req.reason
                         + '" and error message: ' + req.text)
 
+                if req.status_code == 404:
+                    raise pylo.PyloApiObjectNotFoundEx(
+                        'API returned error status "' + str(req.status_code) + ' ' + req.reason
+                        + '" and error message: ' + req.text)
+
                 raise pylo.PyloApiEx('API returned error status "' + str(req.status_code) + ' ' + req.reason
                                      + '" and error message: ' + req.text)
 
+            self.rate_limiter.report_success()
+
             if json_output_expected:
                 log.info("Parsing API answer to JSON (with a size of " + str(int(answer_size)) + "KB)")
                 json_out = req.json()
@@ -359,6 +396,268 @@ class APIConnector:
 
         raise pylo.PyloApiEx("Unexpected API output or race condition")
 
+    @staticmethod
+    def _async_job_extract_location(method: str, req: requests.Response) -> (str, int):
+        """
+        Extracts the job URL and polling interval from the reply to an async job submission.
+        """
+        if (method == 'GET' or method == 'POST') and req.status_code != 202:
+            orig_request = req.request  # type: requests.PreparedRequest
+            raise Exception("Status code for Async call should be 202 but " + str(req.status_code)
+                            + " " + req.reason + " was returned with the following body: " + req.text +
+                            "\n\n Request was: " + orig_request.url + "\nHEADERS: " + str(orig_request.headers) +
+                            "\nBODY:\n" + str(orig_request.body))
+
+        if 'Location' not in req.headers:
+            raise Exception('Header "Location" was not found in API answer!')
+        if 'Retry-After' not in req.headers:
+            raise Exception('Header "Retry-After" was not found in API answer!')
+
+        return req.headers['Location'], int(req.headers['Retry-After'])
+
+    def _async_job_poll(self, job_location: str) -> Optional[str]:
+        """
+        Polls an async job once.
+
+        :return: the href of the resulting dataset if the job is done, None if it is still running
+        """
+        job_poll = self.do_get_call(job_location, include_org_id=False)
+        if 'status' not in job_poll:
+            raise Exception('Job polling request did not return a "status" field')
+        job_poll_status = job_poll['status']
+
+        if job_poll_status == 'failed':
+            if 'result' in job_poll and 'message' in job_poll['result']:
+                raise Exception('Job polling return with status "Failed": ' + job_poll['result']['message'])
+            else:
+                raise Exception('Job polling return with status "Failed": ' + str(job_poll))
+
+        if job_poll_status == 'done':
+            if 'result' not in job_poll:
+                raise Exception('Job is marked as done but has no "result"')
+            if 'href' not in job_poll['result']:
+                raise Exception("Job is marked as done but did not return a href to download resulting Dataset")
+
+            return job_poll['result']['href']
+
+        log.info("Job status is " + job_poll_status)
+        return None
+
+    def _async_job_wait(self, job_location: str, retry_interval: int) -> str:
+        """
+        Polls an async job until it's done.
+
+        :return: the href of the resulting dataset
+        """
+        retry_loop_times = 0
+
+        while True:
+            log.info(
+                "Sleeping " + str(retry_interval) + " seconds before polling for job status, elapsed " + str(
+                    retry_interval * retry_loop_times) + " seconds so far")
+            retry_loop_times += 1
+            time.sleep(retry_interval)
+            result_href = self._async_job_poll(job_location)
+            if result_href is not None:
+                return result_href
+
+    def _do_get_call_streamed(self, path: str, include_org_id=True, params=None,
+                              retry_count_if_api_call_limit_reached=default_retry_count_if_api_call_limit_reached,
+                              retry_wait_time_if_api_call_limit_reached=default_retry_wait_time_if_api_call_limit_reached) -> requests.Response:
+        """
+        Makes a GET call without downloading the body of the reply, which can then be consumed in chunks.
+        Caller is responsible for closing the returned Response.
+        """
+        self.collect_pce_infos()
+
+        url = self._make_api_url(path, include_org_id)
+        headers = {'Accept': 'application/json'}
+
+        while True:
+            log.info("Request URL (streamed): " + url)
+            self.rate_limiter.acquire()
+
+            try:
+                req = self._cached_session.request('GET', url, headers=headers, auth=(self.api_user, self.api_key),
+                                                   verify=(not self.skipSSLCertCheck), params=params, stream=True)
+            except Exception as e:
+                raise pylo.PyloApiEx("PCE connectivity or low level issue: {}".format(e))
+
+            log.info("HTTP GET " + url + " STATUS " + str(req.status_code) + " " + req.reason)
+
+            if req.status_code == 200:
+                self.rate_limiter.report_success()
+                return req
+
+            # error replies are small, reading them entirely is fine
+            error_text = req.text
+            req.close()
+
+            if req.status_code == 429 and 'too_many_requests_error' in error_text:
+                if retry_count_if_api_call_limit_reached < 1:
+                    raise pylo.PyloApiTooManyRequestsEx('API has hit DOS protection limit (X calls per minute)', error_text)
+                retry_count_if_api_call_limit_reached -= 1
+                wait_time = retry_wait_time_if_api_call_limit_reached
+                retry_after = req.headers.get('Retry-After')
+                if retry_after is not None and retry_after.isdigit():
+                    wait_time = int(retry_after)
+                self.rate_limiter.report_too_many_requests(wait_time)
+                continue
+
+            if req.status_code == 403:
+                raise pylo.PyloApiRequestForbiddenEx(
+                    'API returned error status "' + str(req.status_code) + ' ' + req.reason
+                    + '" and error message: ' + error_text)
+
+            raise pylo.PyloApiEx('API returned error status "' + str(req.status_code) + ' ' + req.reason
+                                 + '" and error message: ' + error_text)
+
+    def _do_get_call_to_temporary_file(self, path: str, include_org_id=True, chunk_size: int = 1024 * 1024) -> str:
+        """
+        Makes a GET call and writes the body of the reply to a temporary file while it's downloaded, so it's never
+        held in memory. Caller is responsible for deleting the file.
+
+        :return: path of the file
+        """
+        req = self._do_get_call_streamed(path, include_org_id=include_org_id)
+        try:
+            with tempfile.NamedTemporaryFile('wb', prefix='pylo_', suffix='.json', delete=False) as f:
+                try:
+                    for chunk in req.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                except Exception:
+                    f.close()
+                    os.remove(f.name)
+                    raise
+        finally:
+            req.close()
+
+        return f.name
+
+    @staticmethod
+    def _json_array_items_from_response(req: requests.Response, chunk_size: int = 1024 * 1024):
+        """
+        Yields items of the JSON array returned in the body of the Response, as they are downloaded
+        """
+        try:
+            yield from pylo.json_array_items_from_chunks(req.iter_content(chunk_size=chunk_size))
+        except ValueError as e:
+            raise pylo.PyloApiUnexpectedSyntax("Failed to parse streamed JSON array from '{}': {}".format(req.url, e), None)
+        finally:
+            req.close()
+
+    def _get_objects_streamed_auto_switch_async(self, path: str, data: Dict[str, Any], async_mode: bool) -> Iterator[Any]:
+        """
+        Same as _get_objects_auto_switch_async() but objects are yielded one by one while the dataset is being
+        downloaded instead of being returned as a list.
+        """
+        if not async_mode:
+            data_copy = data.copy()
+            data_copy['max_results'] = default_max_objects_for_sync_calls
+            req = self._do_get_call_streamed(path, params=data_copy)
+            total_count = req.headers.get('x-total-count')
+            if total_count is None or not total_count.isdigit():
+                req.close()
+                raise pylo.PyloApiEx('API returned invalid value for "x-total-count": {}'.format(total_count))
+            if int(total_count) <= default_max_objects_for_sync_calls:
+                yield from self._json_array_items_from_response(req)
+                return
+            req.close()
+
+        job_location, retry_interval = self.async_job_submit(path, params=data)
+        result_href = self._async_job_wait(job_location, retry_interval)
+        log.info("Job is done, we will now stream the resulting dataset")
+        yield from self._json_array_items_from_response(self._do_get_call_streamed(result_href, include_org_id=False))
+
+    def async_job_submit(self, path: str, params=None, include_org_id=True) -> (str, int):
+        """
+        Submits an async GET job without waiting for its completion.
+
+        :return: a tuple with the job location to poll and the polling interval (seconds) suggested by the PCE
+        """
+        return self._do_call('GET', path, include_org_id=include_org_id, async_call=True, params=params,
+                             async_submit_only=True)
+
+    class AsyncJobsScheduler:
+        """
+        Submits several async jobs at once, polls all of them from a single loop and downloads each resulting
+        dataset as soon as its job is done. Total time is therefore bound by the slowest job instead of the sum of them.
+        """
+
+        class Job:
+            __slots__ = ['name', 'location', 'retry_interval', 'next_poll_time']
+
+            def __init__(self, name: str, location: str, retry_interval: int):
+                self.name = name
+                self.location = location
+                self.retry_interval = retry_interval
+                self.next_poll_time = time.monotonic() + retry_interval
+
+        def __init__(self, connector: 'pylo.APIConnector', max_concurrent_downloads: int = 4):
+            self.connector = connector
+            self.max_concurrent_downloads = max_concurrent_downloads
+            self._jobs: Dict[str, 'pylo.APIConnector.AsyncJobsScheduler.Job'] = {}
+            self._lock = Lock()
+
+        def submit(self, name: str, path: str, params=None, include_org_id=True):
+            """
+            Submits a new async job, can be called from several threads
+            """
+            location, retry_interval = self.connector.async_job_submit(path, params=params, include_org_id=include_org_id)
+            log.info("Async job '{}' submitted with location '{}'".format(name, location))
+            with self._lock:
+                if name in self._jobs:
+                    raise pylo.PyloEx("An async job named '{}' was already submitted".format(name))
+                self._jobs[name] = pylo.APIConnector.AsyncJobsScheduler.Job(name, location, retry_interval)
+
+        def count_jobs(self) -> int:
+            return len(self._jobs)
+
+        def wait_for_all(self) -> Dict[str, Any]:
+            """
+            Waits for all submitted jobs to finish and download their datasets
+
+            :return: a dict of datasets by job name
+            """
+            results: Dict[str, Any] = {}
+            if len(self._jobs) == 0:
+                return results
+
+            with self._lock:
+                pending = list(self._jobs.values())
+                self._jobs = {}
+
+            downloads: Dict[str, Future] = {}
+            with ThreadPoolExecutor(max_workers=self.max_concurrent_downloads) as executor:
+                try:
+                    while len(pending) > 0:
+                        now = time.monotonic()
+                        next_poll_time = min(job.next_poll_time for job in pending)
+                        if next_poll_time > now:
+                            time.sleep(next_poll_time - now)
+
+                        for job in [job for job in pending if job.next_poll_time <= time.monotonic()]:
+                            result_href = self.connector._async_job_poll(job.location)
+                            if result_href is None:
+                                job.next_poll_time = time.monotonic() + job.retry_interval
+                                continue
+                            log.info("Async job '{}' is done, downloading its dataset".format(job.name))
+                            pending.remove(job)
+                            downloads[job.name] = executor.submit(self.connector.do_get_call, result_href,
+                                                                  include_org_id=False)
+
+                    for name, download in downloads.items():
+                        results[name] = download.result()
+                except Exception:
+                    for download in downloads.values():
+                        download.cancel()
+                    raise
+
+            return results
+
+    def new_async_jobs_scheduler(self, max_concurrent_downloads: int = 4) -> 'pylo.APIConnector.AsyncJobsScheduler':
+        return pylo.APIConnector.AsyncJobsScheduler(self, max_concurrent_downloads)
+
     def get_software_version(self) -> Optional['pylo.SoftwareVersion']:
         self.collect_pce_infos()
         return self.version
@@ -403,7 +702,17 @@ class APIConnector:
         else:
             raise pylo.PyloEx("Unsupported object type '{}'".format(object_type))
 
-    def get_pce_objects(self, include_deleted_workloads=False, list_of_objects_to_load: Optional[List[str]] = None, force_async_mode=False):
+    def get_pce_objects(self, include_deleted_workloads=False, list_of_objects_to_load: Optional[List[str]] = None, force_async_mode=False,
+                        stream_workloads=False):
+        """
+        Downloads all objects of the requested types from the PCE
+
+        :param include_deleted_workloads:
+        :param list_of_objects_to_load: if None, all object types will be downloaded
+        :param force_async_mode: use async jobs even for object types which could be downloaded with sync calls
+        :param stream_workloads: if True, 'workloads' will be an iterator parsing workloads one by one while they are
+            downloaded (see objects_workload_get_streamed()), it can only be consumed once (ie: by Organization.load_from_json())
+        """
 
         objects_to_load = {}
         if list_of_objects_to_load is not None:
@@ -428,6 +737,14 @@ class APIConnector:
         data: PCEObjectsJsonStructure = pylo.Organization.create_fake_empty_config()
         errors = []
         thread_queue = Queue()
+        # large object types are exported through async jobs which are all polled together by a single scheduler,
+        # this way a thread is not kept busy sleeping while a job is running
+        async_jobs_scheduler = self.new_async_jobs_scheduler(max_concurrent_downloads=threads_count)
+
+        def check_results(object_type: str, results):
+            if not isinstance(results, list):
+                raise pylo.PyloEx("Unexpected result type '{}' while expecting an array of '{}' objects".format(
+                    type(results), object_type), results)
 
         def get_objects(q: Queue, thread_num: int, force_async_mode=False):
             while True:
@@ -436,35 +753,25 @@ class APIConnector:
                     if len(errors) > 0:
                         q.task_done()
                         continue
-                    if object_type == 'workloads':
-                        data['workloads'] = self.objects_workload_get(include_deleted=include_deleted_workloads, async_mode=force_async_mode)
-
-                    elif object_type == 'virtual_services':
-                        data['virtual_services'] = self.objects_virtual_service_get(async_mode=force_async_mode)
 
-                    elif object_type == 'labels':
-                        data['labels'] = self.objects_label_get(async_mode=force_async_mode)
-
-                    elif object_type == 'labelgroups':
-                        data['labelgroups'] = self.objects_labelgroup_get(async_mode=force_async_mode)
-
-                    elif object_type == 'iplists':
-                        data['iplists'] = self.objects_iplist_get(async_mode=force_async_mode)
-
-                    elif object_type == 'services':
-                        data['services'] = self.objects_service_get(async_mode=force_async_mode)
-
-                    elif object_type == 'rulesets':
-                        data['rulesets'] = self.objects_ruleset_get(async_mode=force_async_mode)
-
-                    elif object_type == 'security_principals':
-                        data['security_principals'] = self.objects_securityprincipal_get(async_mode=force_async_mode)
+                    path = object_types_api_paths.get(object_type)
+                    if path is None:
+                        raise pylo.PyloEx("Unsupported object type '{}'".format(object_type))
 
-                    elif object_type == 'label_dimensions':
-                        data['label_dimensions'] = self.objects_label_dimension_get()
+                    params = {}
+                    if object_type == 'workloads' and include_deleted_workloads:
+                        params['include_deleted'] = 'yes'
 
+                    if force_async_mode and object_type != 'label_dimensions':
+                        async_jobs_scheduler.submit(object_type, path, params=params)
                     else:
-                        raise pylo.PyloEx("Unsupported object type '{}'".format(object_type))
+                        results = self._get_objects_sync_or_none_if_over_limit(path, params)
+                        if results is None:
+                            async_jobs_scheduler.submit(object_type, path, params=params)
+                        else:
+                            check_results(object_type, results)
+                            data[object_type] = results
+
                 except Exception as e:
                     errors.append(e)
 
@@ -475,14 +782,149 @@ class APIConnector:
             worker.daemon = True
             worker.start()
 
-        for type in objects_to_load.keys():
-            thread_queue.put((type, errors,))
+        for object_type_to_load in objects_to_load.keys():
+            if object_type_to_load == 'workloads' and stream_workloads:
+                data['workloads'] = self.objects_workload_get_streamed(include_deleted=include_deleted_workloads,
+                                                                       async_mode=force_async_mode)
+                continue
+            thread_queue.put((object_type_to_load, errors,))
 
         thread_queue.join()
 
         if len(errors) > 0:
             raise errors[0]
 
+        for object_type, results in async_jobs_scheduler.wait_for_all().items():
+            check_results(object_type, results)
+            data[object_type] = results
+
+        return data
+
+    def get_pce_objects_hrefs_changed_since(self, since: Union[str, datetime], max_events: int = default_max_events_for_delta_refresh)\
+            -> Optional[Dict[ObjectTypes, Set[str]]]:
+        """
+        Uses audit events to find which objects were created, updated or deleted since a given time.
+
+        :param since: ISO 8601 timestamp or datetime
+        :param max_events: if the PCE has at least that many events since then, None is returned
+        :return: a dict of sets of HREFs by object type, or None if there are too many events to make it worth it
+        """
+        events = self.audit_log_query(max_results=max_events, timestamp_from=since)
+        if len(events) >= max_events:
+            return None
+
+        changes: Dict[ObjectTypes, Set[str]] = {}
+
+        def find_hrefs(json_data):
+            if isinstance(json_data, dict):
+                for key, value in json_data.items():
+                    if key == 'href' and isinstance(value, str):
+                        for object_type, pattern in object_types_href_patterns.items():
+                            match = pattern.match(value)
+                            if match is not None:
+                                changes.setdefault(object_type, set()).add(match.group(0))
+                                break
+                    else:
+                        find_hrefs(value)
+            elif isinstance(json_data, list):
+                for item in json_data:
+                    find_hrefs(item)
+
+        for event in events:
+            if event.get('status') == 'failure':
+                continue
+            for resource_change in event.get('resource_changes') or []:
+                find_hrefs(resource_change.get('resource'))
+
+        return changes
+
+    def get_pce_objects_delta(self, previous_data: PCEObjectsJsonStructure, since: Union[str, datetime],
+                              include_deleted_workloads=False, list_of_objects_to_load: Optional[List[str]] = None,
+                              force_async_mode=False,
+                              max_changes_per_type: int = default_max_changes_per_type_for_delta_refresh) -> PCEObjectsJsonStructure:
+        """
+        Brings objects previously downloaded with get_pce_objects() up to date: only objects created, updated or
+        deleted since 'since' (as reported by audit events) are downloaded again and merged into a copy of previous_data.
+        Object types with more than max_changes_per_type changes, or missing from previous_data, are downloaded in full.
+        If the audit log is too busy then everything is downloaded again.
+
+        Beware that some properties are not tracked by audit events (ie: workloads online status and heartbeats),
+        they are only refreshed for objects which had other changes.
+
+        :param previous_data: objects from a previous get_pce_objects(), it is not modified
+        :param since: time at which previous_data was downloaded (ISO 8601 or datetime), keep a safety margin
+        """
+        if list_of_objects_to_load is not None:
+            all_types = pylo.APIConnector.get_all_object_types()
+            for object_type in list_of_objects_to_load:
+                if object_type not in all_types:
+                    raise pylo.PyloEx("Unknown object type '{}'".format(object_type))
+            objects_to_load = list(list_of_objects_to_load)
+        else:
+            objects_to_load = list(pylo.APIConnector.get_all_object_types().keys())
+
+        self.get_software_version()
+        if self.version.is_greater_or_equal_than(pylo.SoftwareVersion("22.2.0")):
+            if 'label_dimensions' not in objects_to_load:
+                objects_to_load.append('label_dimensions')
+        elif 'label_dimensions' in objects_to_load:
+            objects_to_load.remove('label_dimensions')
+
+        changes = self.get_pce_objects_hrefs_changed_since(since)
+        if changes is None:
+            log.info("Too many audit events since {}, all objects will be downloaded again".format(since))
+            return self.get_pce_objects(include_deleted_workloads=include_deleted_workloads,
+                                        list_of_objects_to_load=list_of_objects_to_load, force_async_mode=force_async_mode)
+
+        data: PCEObjectsJsonStructure = pylo.Organization.create_fake_empty_config()
+        types_to_download_in_full: List[str] = []
+        objects_to_refresh: List[tuple] = []  # (object_type, href)
+
+        for object_type in objects_to_load:
+            previous_objects = previous_data.get(object_type)
+            changed_hrefs = changes.get(object_type, set())
+            if previous_objects is None or len(changed_hrefs) > max_changes_per_type:
+                types_to_download_in_full.append(object_type)
+                continue
+            data[object_type] = previous_objects
+            for href in changed_hrefs:
+                objects_to_refresh.append((object_type, href))
+
+        def get_object_or_none(href: str):
+            try:
+                return self.do_get_call(href, include_org_id=False)
+            except pylo.PyloApiObjectNotFoundEx:
+                return None
+
+        if len(objects_to_refresh) > 0:
+            log.info("Downloading {} objects which changed since {}".format(len(objects_to_refresh), since))
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                refreshed_objects = list(executor.map(get_object_or_none, [href for _, href in objects_to_refresh]))
+
+            objects_by_type_and_href: Dict[str, Dict[str, Any]] = {}
+            for (object_type, href), refreshed_object in zip(objects_to_refresh, refreshed_objects):
+                objects_by_href = objects_by_type_and_href.get(object_type)
+                if objects_by_href is None:
+                    objects_by_href = {obj['href']: obj for obj in data[object_type]}
+                    objects_by_type_and_href[object_type] = objects_by_href
+
+                if refreshed_object is None or \
+                        (object_type == 'workloads' and refreshed_object.get('deleted') and not include_deleted_workloads):
+                    objects_by_href.pop(href, None)
+                else:
+                    objects_by_href[href] = refreshed_object
+
+            for object_type, objects_by_href in objects_by_type_and_href.items():
+                data[object_type] = list(objects_by_href.values())
+
+        if len(types_to_download_in_full) > 0:
+            log.info("Downloading all objects of types: {}".format(pylo.string_list_to_text(types_to_download_in_full)))
+            full_data = self.get_pce_objects(include_deleted_workloads=include_deleted_workloads,
+                                             list_of_objects_to_load=types_to_download_in_full,
+                                             force_async_mode=force_async_mode)
+            for object_type in types_to_download_in_full:
+                data[object_type] = full_data[object_type]
+
         return data
 
     def collect_pce_infos(self):
@@ -744,6 +1186,19 @@ class APIConnector:
 
         return self._get_objects_auto_switch_async(path=path, data=data, async_mode=async_mode, max_results=max_results)
 
+    def objects_workload_get_streamed(self, include_deleted=False, async_mode=False) -> Iterator[WorkloadObjectJsonStructure]:
+        """
+        Same as objects_workload_get() but workloads are parsed and yielded one by one while they are being downloaded,
+        so the raw JSON payload of large PCEs is never held in memory. Nothing is downloaded until iteration starts.
+        """
+        path = '/workloads'
+        data = {}
+
+        if include_deleted:
+            data['include_deleted'] = 'yes'
+
+        return self._get_objects_streamed_auto_switch_async(path=path, data=data, async_mode=async_mode)
+
 
     def objects_workload_agent_upgrade(self, workload_href: str, target_version: str):
         path = '{}/upgrade'.format(workload_href)
@@ -1312,6 +1767,17 @@ class APIConnector:
         return self.do_get_call('/traffic_flows/async_queries', json_output_expected=True, include_org_id=True)
 
     def explorer_async_query_get_specific_request_status(self, request_href: str):
+        """
+        Get the status of a single async query, using its own href rather than listing all async queries of the PCE.
+        PCEs which don't support it are detected on first use and the whole list is used instead.
+        """
+        if not self._explorer_status_by_listing_only:
+            try:
+                return self.do_get_call(request_href, json_output_expected=True, include_org_id=False)
+            except pylo.PyloApiObjectNotFoundEx:
+                log.info("PCE doesn't support getting the status of a single async query, the whole list will be used")
+                self._explorer_status_by_listing_only = True
+
         all_statuses = self.explorer_async_queries_all_status_get()
         for status in all_statuses:
             if status['href'] == request_href:
@@ -1319,28 +1785,19 @@ class APIConnector:
 
         raise pylo.PyloObjectNotFound("Request with ID {} not found".format(request_href))
 
-    def explorer_search(self, filters: Union[Dict, 'pylo.ExplorerFilterSetV1', 'pylo.ExplorerFilterSetV2'],
-                        max_running_time_seconds=1800,check_for_update_interval_seconds=10, draft_mode_enabled=False)\
-            -> Union['pylo.ExplorerResultSetV1', 'pylo.ExplorerResultSetV2']:
+    def explorer_async_query_submit(self, filters: Union[Dict, 'pylo.ExplorerFilterSetV1', 'pylo.ExplorerFilterSetV2']) -> str:
         """
+        Submits an async explorer query without waiting for its completion
 
-        :param filters:
-        :param max_running_time_seconds:
-        :param check_for_update_interval_seconds:
-        :param draft_mode_enabled: only for V2 filters
-        :return:
+        :return: the href of the query, to be polled for its status
         """
-
-        path = "/traffic_flows/async_queries"
-        if isinstance(filters, pylo.ExplorerFilterSetV1):
-            data = filters.generate_json_query()
-        elif isinstance(filters, pylo.ExplorerFilterSetV2):
+        if isinstance(filters, pylo.ExplorerFilterSetV1) or isinstance(filters, pylo.ExplorerFilterSetV2):
             data = filters.generate_json_query()
         else:
             data = filters
 
-        query_queued_json_response = self.do_post_call(path, json_arguments=data, include_org_id=True,
-                                                       json_output_expected=True)
+        query_queued_json_response = self.do_post_call("/traffic_flows/async_queries", json_arguments=data,
+                                                       include_org_id=True, json_output_expected=True)
 
         if 'status' not in query_queued_json_response:
             raise pylo.PyloApiEx("Invalid response from API, missing 'status' property", query_queued_json_response)
@@ -1356,71 +1813,169 @@ class APIConnector:
         if not isinstance(query_href, str):
             raise pylo.PyloApiEx("Invalid response from API, 'href' property is not a string", query_queued_json_response)
 
-        # get current timestamp to ensure we don't wait too long
-        start_time = time.time()
-
-        query_status = None  # Json response from API for specific query
-
-        while True:
-            # check that we don't wait too long
-            if time.time() - start_time > max_running_time_seconds:
-                raise pylo.PyloApiEx("Timeout while waiting for query to complete", query_queued_json_response)
-
-            queries_status_json_response = self.explorer_async_query_get_specific_request_status(query_href)
-            if queries_status_json_response['status'] == "completed":
-                query_status = queries_status_json_response
-                break
-
-            if queries_status_json_response['status'] not in ["queued", "working"]:
-                raise pylo.PyloApiEx("Query failed with status {}".format(queries_status_json_response['status']),
-                                     queries_status_json_response)
+        return query_href
 
-            time.sleep(check_for_update_interval_seconds)
-
-        if query_status is None:
-            raise pylo.PyloEx("Unexpected logic where query_status is None", query_queued_json_response)
+    class ExplorerQueriesPoller:
+        """
+        Submits several explorer queries and waits for all of them from a single loop. Each query is polled on its
+        own href with an exponential backoff (capped at max_poll_interval_seconds) and its results are downloaded as
+        soon as it's done, so dozens of queries cost a few status calls each instead of listing all async queries of
+        the PCE every few seconds.
+        """
 
-        # if draft mode is not enabled we can download the results and pass them over
-        if not draft_mode_enabled or isinstance(filters, pylo.ExplorerFilterSetV1):
-            query_json_response = self.do_get_call(query_href + "/download", json_output_expected=True, include_org_id=False)
+        class Query:
+            __slots__ = ['name', 'href', 'filters', 'draft_mode_enabled', 'stream_to_file', 'stage', 'poll_interval',
+                         'next_poll_time']
 
-            if isinstance(filters, pylo.ExplorerFilterSetV1):
-                result = pylo.ExplorerResultSetV1(query_json_response,
-                                                  owner=self,
-                                                  emulated_process_exclusion=filters.exclude_processes_emulate)
-            else:
-                result = pylo.ExplorerResultSetV2(query_json_response)
+            def __init__(self, name: str, href: str, filters, draft_mode_enabled: bool, stream_to_file: bool):
+                self.name = name
+                self.href = href
+                self.filters = filters
+                self.draft_mode_enabled = draft_mode_enabled and not isinstance(filters, pylo.ExplorerFilterSetV1)
+                self.stream_to_file = stream_to_file and not isinstance(filters, pylo.ExplorerFilterSetV1)
+                self.stage: Literal['query', 'rules'] = 'query'
+                self.poll_interval = default_explorer_poll_initial_interval_seconds
+                self.next_poll_time = time.monotonic() + self.poll_interval
+
+        def __init__(self, connector: 'pylo.APIConnector', max_poll_interval_seconds: float = 10,
+                     max_concurrent_downloads: int = 4):
+            self.connector = connector
+            self.max_poll_interval_seconds = max_poll_interval_seconds
+            self.max_concurrent_downloads = max_concurrent_downloads
+            self._queries: Dict[str, 'pylo.APIConnector.ExplorerQueriesPoller.Query'] = {}
 
-            return result
+        def submit(self, name: str, filters: Union[Dict, 'pylo.ExplorerFilterSetV1', 'pylo.ExplorerFilterSetV2'],
+                   draft_mode_enabled=False, stream_to_file=False):
+            """
+            Submits a new explorer query
 
-        # from here we are in draft mode with V2 filters so we must request API to calculate the draft results
-        draft_mode_trigger_url = query_href + "/update_rules?label_based_rules=false&offset=0&limit=250000"
-        draft_mode_trigger_response = self.do_put_call(draft_mode_trigger_url, json_output_expected=False, include_org_id=False)
+            :param name: used to retrieve its results from wait_for_all()
+            :param draft_mode_enabled: only for V2 filters
+            :param stream_to_file: only for V2 filters, results are downloaded to a temporary file instead of memory
+                                   (see ExplorerResultSetV2.create_from_file())
+            """
+            if name in self._queries:
+                raise pylo.PyloEx("An explorer query named '{}' was already submitted".format(name))
+            query_href = self.connector.explorer_async_query_submit(filters)
+            log.info("Explorer query '{}' submitted with href '{}'".format(name, query_href))
+            self._queries[name] = pylo.APIConnector.ExplorerQueriesPoller.Query(name, query_href, filters,
+                                                                                 draft_mode_enabled, stream_to_file)
+
+        def count_queries(self) -> int:
+            return len(self._queries)
+
+        def _schedule_next_poll(self, query: 'pylo.APIConnector.ExplorerQueriesPoller.Query'):
+            query.next_poll_time = time.monotonic() + query.poll_interval
+            query.poll_interval = min(query.poll_interval * default_explorer_poll_backoff_factor,
+                                      self.max_poll_interval_seconds)
+
+        def _poll(self, query: 'pylo.APIConnector.ExplorerQueriesPoller.Query') -> bool:
+            """
+            :return: True if the query results are ready to be downloaded
+            """
+            status = self.connector.explorer_async_query_get_specific_request_status(query.href)
+
+            if query.stage == 'query':
+                if status['status'] not in ["queued", "working", "completed"]:
+                    raise pylo.PyloApiEx("Query failed with status {}".format(status['status']), status)
+                if status['status'] != "completed":
+                    self._schedule_next_poll(query)
+                    return False
+                if not query.draft_mode_enabled:
+                    return True
 
-        time.sleep(5)  # wait a bit before checking for results
+                # the query is done, now we must request API to calculate the draft results
+                draft_mode_trigger_url = query.href + "/update_rules?label_based_rules=false&offset=0&limit=250000"
+                self.connector.do_put_call(draft_mode_trigger_url, json_output_expected=False, include_org_id=False)
+                query.stage = 'rules'
+                query.poll_interval = default_explorer_poll_initial_interval_seconds
+                self._schedule_next_poll(query)
+                return False
+
+            if status['rules'] == "completed":
+                return True
+            if status['rules'] not in ["queued", "working"]:
+                raise pylo.PyloApiEx("Draft mode results calculation failed with status {}".format(status['rules']), status)
+            self._schedule_next_poll(query)
+            return False
 
-        while True:
-            # check that we don't wait too long
-            if time.time() - start_time > max_running_time_seconds:
-                raise pylo.PyloApiEx("Timeout while waiting for draft mode results to be calculated", draft_mode_trigger_response)
+        def _download(self, query: 'pylo.APIConnector.ExplorerQueriesPoller.Query') \
+                -> Union['pylo.ExplorerResultSetV1', 'pylo.ExplorerResultSetV2']:
+            if query.stream_to_file:
+                filename = self.connector._do_get_call_to_temporary_file(query.href + "/download", include_org_id=False)
+                return pylo.ExplorerResultSetV2.create_from_file(filename, delete_file_on_close=True)
+
+            query_json_response = self.connector.do_get_call(query.href + "/download", json_output_expected=True,
+                                                             include_org_id=False)
+            if isinstance(query.filters, pylo.ExplorerFilterSetV1):
+                return pylo.ExplorerResultSetV1(query_json_response, owner=self.connector,
+                                                emulated_process_exclusion=query.filters.exclude_processes_emulate)
+            return pylo.ExplorerResultSetV2(query_json_response)
+
+        def wait_for_all(self, max_running_time_seconds: float = 1800) \
+                -> Dict[str, Union['pylo.ExplorerResultSetV1', 'pylo.ExplorerResultSetV2']]:
+            """
+            Waits for all submitted queries to finish and downloads their results
 
-            draft_mode_status_response = self.explorer_async_query_get_specific_request_status(query_href)
-            if draft_mode_status_response['rules'] == "completed":
-                query_status = draft_mode_status_response
-                break
+            :return: a dict of result sets by query name
+            """
+            results: Dict[str, Union[pylo.ExplorerResultSetV1, pylo.ExplorerResultSetV2]] = {}
+            pending = list(self._queries.values())
+            self._queries = {}
+            if len(pending) == 0:
+                return results
+
+            deadline = time.monotonic() + max_running_time_seconds
+            downloads: Dict[str, Future] = {}
+            with ThreadPoolExecutor(max_workers=self.max_concurrent_downloads) as executor:
+                try:
+                    while len(pending) > 0:
+                        now = time.monotonic()
+                        if now > deadline:
+                            raise pylo.PyloApiEx("Timeout while waiting for explorer queries to complete: {}".format(
+                                pylo.string_list_to_text([query.name for query in pending])))
+                        next_poll_time = min(query.next_poll_time for query in pending)
+                        if next_poll_time > now:
+                            time.sleep(min(next_poll_time, deadline) - now)
+
+                        for query in [query for query in pending if query.next_poll_time <= time.monotonic()]:
+                            if self._poll(query):
+                                log.info("Explorer query '{}' is done, downloading its results".format(query.name))
+                                pending.remove(query)
+                                downloads[query.name] = executor.submit(self._download, query)
+
+                    for name, download in downloads.items():
+                        results[name] = download.result()
+                except Exception:
+                    for download in downloads.values():
+                        download.cancel()
+                    raise
 
-            if draft_mode_status_response['rules'] not in ["queued", "working"]:
-                raise pylo.PyloApiEx("Draft mode results calculation failed with status {}".format(draft_mode_status_response['status']),
-                                     draft_mode_status_response)
+            return results
 
-            time.sleep(check_for_update_interval_seconds)
+    def new_explorer_queries_poller(self, max_poll_interval_seconds: float = 10,
+                                    max_concurrent_downloads: int = 4) -> 'pylo.APIConnector.ExplorerQueriesPoller':
+        return pylo.APIConnector.ExplorerQueriesPoller(self, max_poll_interval_seconds=max_poll_interval_seconds,
+                                                       max_concurrent_downloads=max_concurrent_downloads)
 
-        if query_status is None:
-            raise pylo.PyloEx("Unexpected logic where query_status is None", query_queued_json_response)
-        query_json_response = self.do_get_call(query_href + "/download", json_output_expected=True, include_org_id=False)
-        result = pylo.ExplorerResultSetV2(query_json_response)
+    def explorer_search(self, filters: Union[Dict, 'pylo.ExplorerFilterSetV1', 'pylo.ExplorerFilterSetV2'],
+                        max_running_time_seconds=1800,check_for_update_interval_seconds=10, draft_mode_enabled=False,
+                        stream_to_file=False) -> Union['pylo.ExplorerResultSetV1', 'pylo.ExplorerResultSetV2']:
+        """
 
-        return result
+        :param filters:
+        :param max_running_time_seconds:
+        :param check_for_update_interval_seconds: maximum interval between two status checks, they start at 1 second
+                                                  and grow exponentially
+        :param draft_mode_enabled: only for V2 filters
+        :param stream_to_file: only for V2 filters, results are downloaded to a temporary file and records are parsed
+                               lazily by ExplorerResultSetV2.iter_records(). Call close() on the result set to delete it.
+        :return:
+        """
+        poller = self.new_explorer_queries_poller(max_poll_interval_seconds=check_for_update_interval_seconds,
+                                                  max_concurrent_downloads=1)
+        poller.submit('query', filters, draft_mode_enabled=draft_mode_enabled, stream_to_file=stream_to_file)
+        return poller.wait_for_all(max_running_time_seconds=max_running_time_seconds)['query']
 
     def cluster_health_get(self, return_object=False):
         path = '/health'
@@ -1458,12 +2013,17 @@ class APIConnector:
                             check_for_update_interval_seconds: int = 10) -> 'pylo.AuditLogQuery':
         return pylo.AuditLogQuery(self, max_results, max_running_time_seconds)
 
-    def audit_log_query(self, max_results=1000, event_type: Optional[str] = None) \
+    def audit_log_query(self, max_results=1000, event_type: Optional[str] = None,
+                        timestamp_from: Optional[Union[str, datetime]] = None) \
             -> List[AuditLogApiReplyEventJsonStructure]:
         url = '/events'
         args = {'max_results': max_results}
         if event_type is not None:
             args['event_type'] = event_type
+        if timestamp_from is not None:
+            if isinstance(timestamp_from, datetime):
+                timestamp_from = timestamp_from.isoformat()
+            args['timestamp[gte]'] = timestamp_from
 
         return self.do_get_call(path=url, params=args)
 
@@ -0,0 +1,101 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Any, Callable, Iterable, List, Awaitable
+
+from requests.adapters import HTTPAdapter
+
+import illumio_pylo as pylo
+from .APIConnector import APIConnector
+
+default_max_concurrent_calls = 16
+
+
+class AsyncAPIConnector:
+    """
+    asyncio flavor of APIConnector. All objects_* and object_* methods from APIConnector are available as coroutines
+    with the same arguments, ie: await async_connector.objects_workload_update(href, data).
+
+    Calls are made through a dedicated session with a keep-alive connection pool of max_concurrent_calls connections,
+    so thousands of calls can be scheduled at once while no more than max_concurrent_calls of them hit the PCE at the
+    same time.
+
+    Example:
+        async with pylo.AsyncAPIConnector(connector, max_concurrent_calls=20) as async_connector:
+            results = await async_connector.gather(
+                async_connector.objects_workload_update(href, data) for href, data in updates.items())
+    """
+
+    def __init__(self, connector: APIConnector, max_concurrent_calls: int = default_max_concurrent_calls):
+        if max_concurrent_calls < 1:
+            raise pylo.PyloEx("max_concurrent_calls must be greater than 0, '{}' was given".format(max_concurrent_calls))
+
+        self.max_concurrent_calls = max_concurrent_calls
+        # a clone is used so the original connector and its session are left untouched
+        self.connector: APIConnector = connector.clone()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent_calls, pool_block=True)
+        self.connector._cached_session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_calls, thread_name_prefix='AsyncAPIConnector')
+
+    @staticmethod
+    def create_from_credentials_in_file(fqdn_or_profile_name: str, credential_file: Optional[str] = None,
+                                        max_concurrent_calls: int = default_max_concurrent_calls) -> Optional['AsyncAPIConnector']:
+        connector = APIConnector.create_from_credentials_in_file(fqdn_or_profile_name, credential_file=credential_file)
+        if connector is None:
+            return None
+        return AsyncAPIConnector(connector, max_concurrent_calls=max_concurrent_calls)
+
+    async def __aenter__(self) -> 'AsyncAPIConnector':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.connector._cached_session.close()
+
+    async def _run(self, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def __getattr__(self, name: str):
+        # only API calls are exposed as coroutines, everything else must be accessed through self.connector
+        if not name.startswith('objects_') and not name.startswith('object_'):
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+        method = getattr(self.connector, name)
+        if not callable(method):
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+        @functools.wraps(method)
+        async def coroutine(*args, **kwargs):
+            return await self._run(method, *args, **kwargs)
+
+        return coroutine
+
+    async def collect_pce_infos(self):
+        await self._run(self.connector.collect_pce_infos)
+
+    async def get_software_version(self) -> Optional['pylo.SoftwareVersion']:
+        return await self._run(self.connector.get_software_version)
+
+    async def do_get_call(self, path, **kwargs):
+        return await self._run(self.connector.do_get_call, path, **kwargs)
+
+    async def do_post_call(self, path, **kwargs):
+        return await self._run(self.connector.do_post_call, path, **kwargs)
+
+    async def do_put_call(self, path, **kwargs):
+        return await self._run(self.connector.do_put_call, path, **kwargs)
+
+    async def do_delete_call(self, path, **kwargs):
+        return await self._run(self.connector.do_delete_call, path, **kwargs)
+
+    @staticmethod
+    async def gather(calls: Iterable[Awaitable], return_exceptions: bool = True) -> List[Any]:
+        """
+        Awaits all provided calls and return their results in the same order. By default, exceptions are returned
+        in place of results so a single failure doesn't cancel the whole batch.
+        """
+        return await asyncio.gather(*calls, return_exceptions=return_exceptions)
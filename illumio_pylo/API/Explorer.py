@@ -1,5 +1,10 @@
+import copy
+import os
 import sys
-from typing import Optional, List, Dict, Literal, TypeVar, Generic, Union, Set
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Optional, List, Dict, Literal, TypeVar, Generic, Union, Set, Tuple, Iterator
 from datetime import datetime, timedelta, timezone
 
 import illumio_pylo as pylo
@@ -7,6 +12,17 @@ from .JsonPayloadTypes import RuleCoverageQueryEntryJsonStructure, ExplorerTraff
     ExplorerTrafficRecordJsonStructure
 from illumio_pylo.API.APIConnector import APIConnector
 
+rule_coverage_default_max_concurrent_batches = 4
+rule_coverage_default_queries_per_batch = 100
+rule_coverage_min_queries_per_batch = 10
+rule_coverage_max_queries_per_batch = 200
+rule_coverage_target_call_duration_seconds = 10.0
+
+explorer_default_start_date = datetime(2010, 10, 13, 11, 27, 28, tzinfo=timezone.utc)
+explorer_default_time_slices_count = 4
+explorer_default_min_time_slice_seconds = 60
+explorer_default_max_concurrent_queries = 8
+
 
 class ExplorerResult:
     _draft_mode_policy_decision: Optional[Literal['allowed', 'blocked', 'blocked_by_boundary']]
@@ -341,7 +357,15 @@ class ExplorerResultSetV1:
         hash_table.load(self._records)
         self._records = hash_table.results()
 
-    def apply_draft_policy_decision_to_all_records(self):
+    def apply_draft_policy_decision_to_all_records(self, org_for_local_evaluation: Optional['pylo.Organization'] = None):
+        """
+        Computes draft policy decisions for all records, using rule_coverage API calls or, when an Organization is
+        provided, locally with a PolicyEvaluator (much faster but boundaries are not evaluated)
+        """
+        if org_for_local_evaluation is not None:
+            pylo.PolicyEvaluator(org_for_local_evaluation).evaluate_explorer_results(self._records)
+            return
+
         draft_manager = RuleCoverageQueryManager(self.owner)
         draft_manager.add_query_from_explorer_results(self._records)
         draft_manager.execute()
@@ -354,6 +378,7 @@ class RuleCoverageQueryManager:
             self.service_hash_to_index: Dict[str, int] = {}
             self.services_array: List[Dict] = []
             self.service_index_to_log_ids: Dict[int, List[int]] = {}
+            self.log_id_to_service_indexes: Dict[int, List[int]] = {}  # reverse index of service_index_to_log_ids
             self.service_index_policy_coverage: Dict[int, List[str]] = {} # for a service ID (used as key) returns a list of matching rules HREF
             self.service_index_to_boundary_policy_coverage: Dict[int, List[str]] = {} # for a service ID (used as key) returns a list of matching boundary rules HREF
 
@@ -370,35 +395,39 @@ class RuleCoverageQueryManager:
                 self.services_array.append(service_record)
 
             service_index = self.service_hash_to_index[service_hash]
+            service_indexes = self.log_id_to_service_indexes.get(log_id)
+            if service_indexes is None:
+                service_indexes = []
+                self.log_id_to_service_indexes[log_id] = service_indexes
+            elif service_index in service_indexes:
+                return
+            service_indexes.append(service_index)
+
             if service_index not in self.service_index_to_log_ids:
                 self.service_index_to_log_ids[service_index] = []
-
-            if log_id not in self.service_index_to_log_ids[service_index]:
-                self.service_index_to_log_ids[service_index].append(log_id)
+            self.service_index_to_log_ids[service_index].append(log_id)
 
         def get_allow_rules_for_log_id(self, log_id: int):
             rules = []
-            for service_id, list_of_log_ids in self.service_index_to_log_ids.items():
-                if log_id in list_of_log_ids:
-                    policy_coverage = self.service_index_policy_coverage[service_id]
-                    for rule in policy_coverage:
-                        rules.append(rule)
+            for service_id in self.log_id_to_service_indexes.get(log_id, ()):
+                policy_coverage = self.service_index_policy_coverage[service_id]
+                for rule in policy_coverage:
+                    rules.append(rule)
             return rules
 
         def get_policy_decision_for_log_id(self, log_id: int) -> Optional[Literal['allowed', 'blocked', 'blocked_by_boundary']]:
             policy_decision = None
             found_boundary_block = False
 
-            for service_id, list_of_log_ids in self.service_index_to_log_ids.items():
-                if log_id in list_of_log_ids:
-                    policy_decision = 'blocked'
-                    policy_coverage = self.service_index_policy_coverage[service_id]
-                    if len(policy_coverage) > 0:
-                        return 'allowed'
+            for service_id in self.log_id_to_service_indexes.get(log_id, ()):
+                policy_decision = 'blocked'
+                policy_coverage = self.service_index_policy_coverage[service_id]
+                if len(policy_coverage) > 0:
+                    return 'allowed'
 
-                    boundary_policy_coverage = self.service_index_to_boundary_policy_coverage[service_id]
-                    if len(boundary_policy_coverage) > 0:
-                        found_boundary_block = True
+                boundary_policy_coverage = self.service_index_to_boundary_policy_coverage.get(service_id)
+                if boundary_policy_coverage is not None and len(boundary_policy_coverage) > 0:
+                    found_boundary_block = True
 
             if found_boundary_block:
                 return 'blocked_by_boundary'
@@ -464,69 +493,57 @@ class RuleCoverageQueryManager:
     class QueryManager:
         def __init__(self, src_type:Literal['ip_list','workload'], dst_type:Literal['ip_list','workload'] ,include_boundary_rules: bool = True):
             self.queries: Dict[str, RuleCoverageQueryManager.ObjectToObjectQuery] = {}
+            # queries which were given each log_id, so decisions don't require looking at all queries for every log
+            self.log_id_to_queries: Dict[int, List[RuleCoverageQueryManager.ObjectToObjectQuery]] = {}
             self.include_boundary_rules = include_boundary_rules
             self.src_type = src_type
             self.dst_type = dst_type
 
-        def execute(self, connector: APIConnector, queries_per_batch: int):
-            # split queries into arrays of size queries_per_batch
-            query_batches: List[List[RuleCoverageQueryManager.ObjectToObjectQuery]] = []
-            query_batch: List[RuleCoverageQueryManager.ObjectToObjectQuery] = []
-            for query in self.queries.values():
-                query_batch.append(query)
-                if len(query_batch) == queries_per_batch:
-                    query_batches.append(query_batch)
-                    query_batch = []
-            if len(query_batch) > 0:
-                query_batches.append(query_batch)
-
-            # print(f'{len(query_batches)} batches of {queries_per_batch} queries')
-
-            for query_batch in query_batches:
-                # print(f'Executing batch of {len(query_batch)} queries')
-                payload = []
-                for query in query_batch:
-                    payload.append(query.generate_api_payload())
-
-                api_response = connector.rule_coverage_query(payload, include_boundary_rules=self.include_boundary_rules)
-                # print(api_response)
-                # print('-------------------------------------------------------')
-
-                edges = api_response.get('edges')
-                if edges is None:
-                    raise pylo.PyloEx('rule_coverage request has returned no "edges"', api_response)
-
-                rules = api_response.get('rules')
-                if rules is None:
-                    raise pylo.PyloEx('rule_coverage request has returned no "rules"', api_response)
-
-                if len(edges) != len(query_batch):
-                    raise pylo.PyloEx("rule_coverage has returned {} records while {} where requested".format(len(edges), len(query_batch)))
-
-                for response_index, edge in enumerate(edges):
-                    query = query_batch[response_index]
-                    # print(f'Processing edge {edge} against query {query.ip_list_href} -> {query.workload_href} -> {len(query.services.services_array)}')
-                    query.process_response(rules, edge)
+        def execute(self, connector: APIConnector, queries_per_batch: int, max_concurrent_batches: int = 1):
+            batch_size_controller = RuleCoverageQueryManager.BatchSizeController(queries_per_batch, queries_per_batch,
+                                                                                 queries_per_batch)
+            RuleCoverageQueryManager.execute_batches(connector, [self], batch_size_controller, max_concurrent_batches)
+
+        def execute_batch(self, connector: APIConnector, query_batch: List['RuleCoverageQueryManager.ObjectToObjectQuery']):
+            payload = []
+            for query in query_batch:
+                payload.append(query.generate_api_payload())
+
+            api_response = connector.rule_coverage_query(payload, include_boundary_rules=self.include_boundary_rules)
+
+            edges = api_response.get('edges')
+            if edges is None:
+                raise pylo.PyloEx('rule_coverage request has returned no "edges"', api_response)
+
+            rules = api_response.get('rules')
+            if rules is None:
+                raise pylo.PyloEx('rule_coverage request has returned no "rules"', api_response)
+
+            if len(edges) != len(query_batch):
+                raise pylo.PyloEx("rule_coverage has returned {} records while {} where requested".format(len(edges), len(query_batch)))
 
-                if self.include_boundary_rules:
-                    deny_edges = api_response.get('deny_edges')
-                    if deny_edges is None:
-                        raise pylo.PyloEx('rule_coverage request has returned no "deny_edges"', api_response)
-                    if len(deny_edges) != len(query_batch):
-                        raise pylo.PyloEx("rule_coverage has returned {} deny_edges while {} where requested".format(len(deny_edges), len(query_batch)))
+            for response_index, edge in enumerate(edges):
+                query = query_batch[response_index]
+                query.process_response(rules, edge)
 
-                    deny_rules = api_response.get('deny_rules')
-                    if deny_rules is None:
-                        raise pylo.PyloEx('rule_coverage request has returned no "deny_rules"', api_response)
+            if self.include_boundary_rules:
+                deny_edges = api_response.get('deny_edges')
+                if deny_edges is None:
+                    raise pylo.PyloEx('rule_coverage request has returned no "deny_edges"', api_response)
+                if len(deny_edges) != len(query_batch):
+                    raise pylo.PyloEx("rule_coverage has returned {} deny_edges while {} where requested".format(len(deny_edges), len(query_batch)))
 
-                    for response_index, edge in enumerate(deny_edges):
-                        query = query_batch[response_index]
-                        # print(f'Processing deny_edge {edge} against query {query.src_workload_href} -> {query.dst_workload_href} -> {len(query.services.services_array)}')
-                        query.process_response_boundary_deny(deny_rules, edge)
+                deny_rules = api_response.get('deny_rules')
+                if deny_rules is None:
+                    raise pylo.PyloEx('rule_coverage request has returned no "deny_rules"', api_response)
+
+                for response_index, edge in enumerate(deny_edges):
+                    query = query_batch[response_index]
+                    query.process_response_boundary_deny(deny_rules, edge)
 
         def get_allow_rules_for_log_id(self, log_id: int) -> List[str]:
             rules = []
-            for query in self.queries.values():
+            for query in self.log_id_to_queries.get(log_id, ()):
                 results = query.get_allow_rules_for_log_id(log_id)
                 if results is not None:
                     for rule_dict in results:
@@ -541,11 +558,12 @@ class RuleCoverageQueryManager:
             policy_decision: Optional[Literal["allowed", "blocked", "blocked_by_boundary"]] = None
             found_blocked_by_boundary = False
 
-            for query in self.queries.values():
-                policy_decision = query.get_policy_decision_for_log_id(log_id) or policy_decision
+            for query in self.log_id_to_queries.get(log_id, ()):
+                query_decision = query.get_policy_decision_for_log_id(log_id)
+                policy_decision = query_decision or policy_decision
                 if policy_decision == 'allowed':
                     return policy_decision
-                if query.get_policy_decision_for_log_id(log_id) == 'blocked_by_boundary':
+                if query_decision == 'blocked_by_boundary':
                     found_blocked_by_boundary = True
 
             if found_blocked_by_boundary:
@@ -555,14 +573,109 @@ class RuleCoverageQueryManager:
 
         def add_query(self, log_id: int, src_href: str, dst_href: str, service_record):
             hash_key = src_href + dst_href
-            if hash_key not in self.queries:
-                self.queries[hash_key] = RuleCoverageQueryManager.ObjectToObjectQuery(src_href, self.src_type, dst_href, self.dst_type)
+            query = self.queries.get(hash_key)
+            if query is None:
+                query = RuleCoverageQueryManager.ObjectToObjectQuery(src_href, self.src_type, dst_href, self.dst_type)
+                self.queries[hash_key] = query
+
+            query.add_service(service_record, log_id)
 
-            self.queries[hash_key].add_service(service_record, log_id)
+            log_id_queries = self.log_id_to_queries.get(log_id)
+            if log_id_queries is None:
+                self.log_id_to_queries[log_id] = [query]
+            elif query not in log_id_queries:
+                log_id_queries.append(query)
 
 
-    def __init__(self, owner: APIConnector):
+    class BatchSizeController:
+        """
+        Adapts the number of queries sent in each rule_coverage call to PCE response times: batches grow while calls
+        are answered quicker than target_call_duration and shrink when they are slower. Thread safe.
+        """
+
+        def __init__(self, initial_size: int = rule_coverage_default_queries_per_batch,
+                     min_size: int = rule_coverage_min_queries_per_batch,
+                     max_size: int = rule_coverage_max_queries_per_batch,
+                     target_call_duration: float = rule_coverage_target_call_duration_seconds):
+            self._lock = Lock()
+            self.min_size = min_size
+            self.max_size = max_size
+            self.target_call_duration = target_call_duration
+            self.batch_size: int = max(min_size, min(max_size, initial_size))
+
+        def report_call(self, batch_size: int, duration: float):
+            """
+            To be called after each rule_coverage call with the size of its batch and how long it took (seconds)
+            """
+            if duration <= 0:
+                return
+            with self._lock:
+                # size which would have taken target_call_duration, smoothed and growing by at most 2x at a time
+                wanted_size = min(batch_size * self.target_call_duration / duration, self.batch_size * 2)
+                new_size = int((self.batch_size + wanted_size) / 2)
+                self.batch_size = max(self.min_size, min(self.max_size, new_size))
+
+    @staticmethod
+    def execute_batches(connector: APIConnector, managers: List['RuleCoverageQueryManager.QueryManager'],
+                        batch_size_controller: 'RuleCoverageQueryManager.BatchSizeController',
+                        max_concurrent_batches: int):
+        """
+        Executes queries of all managers with up to max_concurrent_batches rule_coverage calls running at the same
+        time. Each batch is sized by batch_size_controller when it is picked by a worker. API calls go through the
+        connector's rate limiter so workers share its budget.
+        """
+        if max_concurrent_batches < 1:
+            raise pylo.PyloEx("max_concurrent_batches must be greater than 0, '{}' was given".format(max_concurrent_batches))
+
+        pending: List[Tuple[RuleCoverageQueryManager.QueryManager, List[RuleCoverageQueryManager.ObjectToObjectQuery]]] = \
+            [(manager, list(manager.queries.values())) for manager in managers if len(manager.queries) > 0]
+        pending_lock = Lock()
+        position = 0
+        stop_requested = False
+
+        def next_batch() -> Optional[Tuple[RuleCoverageQueryManager.QueryManager, List[RuleCoverageQueryManager.ObjectToObjectQuery]]]:
+            nonlocal position
+            with pending_lock:
+                while len(pending) > 0 and not stop_requested:
+                    manager, queries = pending[0]
+                    if position >= len(queries):
+                        pending.pop(0)
+                        position = 0
+                        continue
+                    batch = queries[position:position + batch_size_controller.batch_size]
+                    position += len(batch)
+                    return manager, batch
+                return None
+
+        def worker():
+            nonlocal stop_requested
+            try:
+                while True:
+                    next_item = next_batch()
+                    if next_item is None:
+                        return
+                    manager, batch = next_item
+                    start_time = time.monotonic()
+                    manager.execute_batch(connector, batch)
+                    batch_size_controller.report_call(len(batch), time.monotonic() - start_time)
+            except Exception:
+                # other workers stop picking new batches
+                stop_requested = True
+                raise
+
+        if max_concurrent_batches == 1:
+            worker()
+            return
+
+        with ThreadPoolExecutor(max_workers=max_concurrent_batches, thread_name_prefix='RuleCoverage') as executor:
+            workers = [executor.submit(worker) for _ in range(max_concurrent_batches)]
+            for future in workers:
+                future.result()
+
+    def __init__(self, owner: APIConnector, max_concurrent_batches: int = rule_coverage_default_max_concurrent_batches):
         self.owner = owner
+        self.max_concurrent_batches = max_concurrent_batches
+        self.batch_size_controller = RuleCoverageQueryManager.BatchSizeController()
         self.iplist_to_workload_query_manager = RuleCoverageQueryManager.QueryManager('ip_list', 'workload')
         self.workload_to_iplist_query_manager = RuleCoverageQueryManager.QueryManager('workload', 'ip_list')
         self.workload_to_workload_query_manager = RuleCoverageQueryManager.QueryManager('workload', 'workload')
@@ -623,21 +736,9 @@ class RuleCoverageQueryManager:
                + len(self.workload_to_workload_query_manager.queries)
 
     def count_real_queries(self):
-        _log_ids = {}
-        for query in self.iplist_to_workload_query_manager.queries.values():
-            for log_ids in query.services.service_index_to_log_ids.values():
-                for log_id in log_ids:
-                    _log_ids[log_id] = True
-
-        for query in self.workload_to_iplist_query_manager.queries.values():
-            for log_ids in query.services.service_index_to_log_ids.values():
-                for log_id in log_ids:
-                    _log_ids[log_id] = True
-
-        for query in self.workload_to_workload_query_manager.queries.values():
-            for log_ids in query.services.service_index_to_log_ids.values():
-                for log_id in log_ids:
-                    _log_ids[log_id] = True
+        _log_ids = set(self.iplist_to_workload_query_manager.log_id_to_queries)
+        _log_ids.update(self.workload_to_iplist_query_manager.log_id_to_queries)
+        _log_ids.update(self.workload_to_workload_query_manager.log_id_to_queries)
 
         return len(_log_ids)
 
@@ -690,10 +791,11 @@ class RuleCoverageQueryManager:
             log.set_draft_mode_policy_decision(decision)
 
     def execute(self):
-        queries_per_batch = 100
-        self.iplist_to_workload_query_manager.execute(self.owner, queries_per_batch)
-        self.workload_to_iplist_query_manager.execute(self.owner, queries_per_batch)
-        self.workload_to_workload_query_manager.execute(self.owner, queries_per_batch)
+        # batches of the 3 managers are executed by the same pool of workers
+        RuleCoverageQueryManager.execute_batches(self.owner, [self.iplist_to_workload_query_manager,
+                                                              self.workload_to_iplist_query_manager,
+                                                              self.workload_to_workload_query_manager],
+                                                 self.batch_size_controller, self.max_concurrent_batches)
 
         self.apply_policy_decisions_to_logs()
 
@@ -1331,7 +1433,7 @@ class ExplorerFilterSetV2:
         if self._time_from is not None:
             filters["start_date"] = self._time_from.strftime('%Y-%m-%dT%H:%M:%SZ')
         else:
-            filters["start_date"] = "2010-10-13T11:27:28.824Z",
+            filters["start_date"] = explorer_default_start_date.strftime('%Y-%m-%dT%H:%M:%SZ')
 
         if self._time_to is not None:
             filters["end_date"] = self._time_to.strftime('%Y-%m-%dT%H:%M:%SZ')
@@ -1650,6 +1752,19 @@ class ExplorerResultV2:
 
         return result
 
+    def get_source_iplists_from_ip(self, org_for_resolution: 'pylo.Organization') -> Dict[str, 'pylo.IPList']:
+        """
+        Finds IPLists containing the source IP from the local IPListStore index rather than relying on the IPLists
+        reported by the PCE, which can be incomplete (ie: IPLists created after the flow was seen)
+        """
+        return {iplist.href: iplist for iplist in org_for_resolution.IPListStore.find_iplists_containing_ip(self.source_ip)}
+
+    def get_destination_iplists_from_ip(self, org_for_resolution: 'pylo.Organization') -> Dict[str, 'pylo.IPList']:
+        """
+        Finds IPLists containing the destination IP from the local IPListStore index, see get_source_iplists_from_ip()
+        """
+        return {iplist.href: iplist for iplist in org_for_resolution.IPListStore.find_iplists_containing_ip(self.destination_ip)}
+
     def pd_is_potentially_blocked(self):
         return self.policy_decision_string == 'potentially_blocked'
 
@@ -1662,6 +1777,9 @@ class ExplorerResultV2:
     def cast_is_unicast(self):
         return self._cast_type is not None
 
+    def set_draft_mode_policy_decision(self, decision: Literal['allowed', 'blocked', 'blocked_by_boundary']):
+        self._draft_mode_policy_decision = decision
+
     def draft_mode_policy_decision_is_blocked(self) -> Optional[bool]:
         """
         @return: None if draft_mode was not enabled
@@ -1692,15 +1810,145 @@ class ExplorerResultV2:
 
 class ExplorerResultSetV2:
     def __init__(self, data_array: ExplorerTrafficRecordsApiReplyPayloadJsonStructure):
-        self.raw_json = data_array
-        self.records: List[ExplorerResultV2] = []
+        self._raw_json: Optional[ExplorerTrafficRecordsApiReplyPayloadJsonStructure] = data_array
+        self._records: Optional[List[ExplorerResultV2]] = []
         for record_json in data_array:
             record = ExplorerResultV2(record_json)
-            self.records.append(record)
+            self._records.append(record)
+
+        self.filename: Optional[str] = None
+        self._delete_file_on_close = False
+        self._records_count: Optional[int] = None
+
+    @staticmethod
+    def create_from_file(filename: str, delete_file_on_close: bool = False) -> 'ExplorerResultSetV2':
+        """
+        Creates a result set backed by a file holding the JSON array returned by the API. Records are only parsed
+        when they are iterated with iter_records(), so memory usage doesn't grow with the number of records unless
+        'records', 'raw_json' or get_all_records() are used, which load all of them.
+
+        :param delete_file_on_close: if True, the file is deleted by close()
+        """
+        result_set = ExplorerResultSetV2([])
+        result_set._raw_json = None
+        result_set._records = None
+        result_set.filename = filename
+        result_set._delete_file_on_close = delete_file_on_close
+        return result_set
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Deletes the backing file if this result set was created with delete_file_on_close=True. Records which were
+        already loaded remain available.
+        """
+        if self.filename is not None and self._delete_file_on_close:
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+            self._delete_file_on_close = False
+
+    def is_loaded(self) -> bool:
+        return self._records is not None
+
+    def iter_records(self, chunk_size: int = 1024 * 1024) -> Iterator[ExplorerResultV2]:
+        """
+        Yields records one by one. For a file backed result set which was not loaded yet, they are parsed from the
+        file while it's read, so a new ExplorerResultV2 object is created for each record at every iteration.
+        """
+        if self._records is not None:
+            yield from self._records
+            return
+
+        count = 0
+        with open(self.filename, 'rb') as f:
+            try:
+                for record_json in pylo.json_array_items_from_chunks(iter(lambda: f.read(chunk_size), b'')):
+                    count += 1
+                    yield ExplorerResultV2(record_json)
+            except ValueError as e:
+                raise pylo.PyloEx("Failed to parse explorer results from file '{}': {}".format(self.filename, e))
+        self._records_count = count
+
+    def _load(self):
+        records = list(self.iter_records())
+        self._raw_json = [record.raw_json for record in records]
+        self._records = records
+
+    @property
+    def records(self) -> List[ExplorerResultV2]:
+        if self._records is None:
+            self._load()
+        return self._records
+
+    @property
+    def raw_json(self) -> ExplorerTrafficRecordsApiReplyPayloadJsonStructure:
+        if self._records is None:
+            self._load()
+        return self._raw_json
 
     def get_all_records(self) -> List[ExplorerResultV2]:
         return self.records
 
+    def count_records(self) -> int:
+        if self._records is not None:
+            return len(self._records)
+        if self._records_count is None:
+            for _ in self.iter_records():
+                pass
+        return self._records_count
+
+    @staticmethod
+    def _record_merge_key(record: ExplorerResultV2) -> tuple:
+        return (record.source_ip, record.destination_ip, record.source_workload_href, record.destination_workload_href,
+                tuple(sorted(record.service_json.items())), record.policy_decision_string,
+                record.draft_mode_policy_decision_to_str(), record._cast_type, record.raw_json.get('flow_direction'))
+
+    @staticmethod
+    def merge(result_sets: List['ExplorerResultSetV2']) -> 'ExplorerResultSetV2':
+        """
+        Merges results of several queries (ie: time slices of the same query) into a single result set. Records of the
+        same flow are deduplicated: their connections are summed up and their detection timestamps widened. Merged
+        records are copies, the result sets given are left untouched.
+        """
+        merged = ExplorerResultSetV2([])
+        records_by_key: Dict[tuple, ExplorerResultV2] = {}
+
+        for result_set in result_sets:
+            for record in result_set.iter_records():
+                key = ExplorerResultSetV2._record_merge_key(record)
+                existing_record = records_by_key.get(key)
+                if existing_record is None:
+                    # raw_json is copied too as its counters and timestamps are replaced when other records are merged
+                    record = copy.copy(record)
+                    record.raw_json = dict(record.raw_json)
+                    records_by_key[key] = record
+                    merged.records.append(record)
+                    merged.raw_json.append(record.raw_json)
+                    continue
+
+                existing_record.num_connections += record.num_connections
+                if record.first_detected < existing_record.first_detected:
+                    existing_record.first_detected = record.first_detected
+                if record.last_detected > existing_record.last_detected:
+                    existing_record.last_detected = record.last_detected
+                existing_record.raw_json['num_connections'] = existing_record.num_connections
+                existing_record.raw_json['timestamp_range'] = {'first_detected': existing_record.first_detected,
+                                                               'last_detected': existing_record.last_detected}
+
+        return merged
+
+    def apply_draft_policy_decision_to_all_records(self, org: 'pylo.Organization'):
+        """
+        Computes draft policy decisions locally with a PolicyEvaluator, overriding the ones returned by the PCE (if
+        the query was made in draft mode)
+        """
+        pylo.PolicyEvaluator(org).evaluate_explorer_results(self.records)
+
 
 class ExplorerQueryV2:
     def __init__(self, connector: APIConnector, max_results: int = 1500, draft_mode_enabled=False, max_running_time_seconds: int = 1800,
@@ -1711,16 +1959,93 @@ class ExplorerQueryV2:
         self.check_for_update_interval_seconds = check_for_update_interval_seconds
         self.draft_mode_enabled = draft_mode_enabled
 
-    def execute(self) -> Union[ExplorerResultSetV2]:
+    def execute(self, stream_to_file: bool = False) -> Union[ExplorerResultSetV2]:
         """
         Execute the query and stores the results in the 'results' property.
         It will also return said results for convenience.
+        :param stream_to_file: if True, results are downloaded to a temporary file and parsed lazily by
+                               ExplorerResultSetV2.iter_records(), call close() on the results to delete the file
         :return:
         """
         self.results = self.api.explorer_search(self.filters, max_running_time_seconds=self.max_running_time_seconds,
                                                 check_for_update_interval_seconds=self.check_for_update_interval_seconds,
-                                                draft_mode_enabled=self.draft_mode_enabled)
+                                                draft_mode_enabled=self.draft_mode_enabled,
+                                                stream_to_file=stream_to_file)
 
 
         return self.results
 
+    def execute_with_time_slices(self, slices_count: int = explorer_default_time_slices_count,
+                                 min_slice_seconds: int = explorer_default_min_time_slice_seconds,
+                                 max_concurrent_queries: int = explorer_default_max_concurrent_queries) -> ExplorerResultSetV2:
+        """
+        Same as execute() but the time window of the filters is split into slices which are queried concurrently,
+        so more than max_results flows can be retrieved. Any slice which returns max_results records (and may
+        therefore have lost flows) is split again into slices_count smaller slices, down to min_slice_seconds.
+        Results of all slices are merged and deduplicated into a single result set. Slices don't overlap: their end
+        is inclusive and the next one starts one second later, so connections are never counted twice.
+
+        :param slices_count: number of slices the time window (and then each saturated slice) is split into
+        :param min_slice_seconds: saturated slices shorter than this are kept as they are, with a warning
+        :param max_concurrent_queries: maximum number of explorer queries running at the same time on the PCE
+        """
+        if slices_count < 2:
+            raise pylo.PyloEx("slices_count must be greater than 1, '{}' was given".format(slices_count))
+
+        time_from = self.filters._time_from if self.filters._time_from is not None else explorer_default_start_date
+        time_to = self.filters._time_to if self.filters._time_to is not None else datetime.now(timezone.utc)
+        if time_from.tzinfo is None:
+            time_from = time_from.replace(tzinfo=timezone.utc)
+        if time_to.tzinfo is None:
+            time_to = time_to.replace(tzinfo=timezone.utc)
+        # the API works with a 1 second resolution so slices boundaries are aligned on seconds
+        time_from = time_from.replace(microsecond=0)
+        time_to = time_to.replace(microsecond=0)
+
+        def duration_seconds(slice_from: datetime, slice_to: datetime) -> int:
+            # both ends are inclusive
+            return int((slice_to - slice_from).total_seconds()) + 1
+
+        def split(slice_from: datetime, slice_to: datetime) -> List[Tuple[datetime, datetime]]:
+            slice_seconds = -(-duration_seconds(slice_from, slice_to) // slices_count)
+            slices = []
+            current_from = slice_from
+            while current_from <= slice_to:
+                current_to = min(slice_to, current_from + timedelta(seconds=slice_seconds - 1))
+                slices.append((current_from, current_to))
+                current_from = current_to + timedelta(seconds=1)
+            return slices
+
+        pending_slices = split(time_from, time_to)
+        completed_results: List[ExplorerResultSetV2] = []
+        deadline = time.monotonic() + self.max_running_time_seconds
+
+        while len(pending_slices) > 0:
+            slices_batch = pending_slices[:max_concurrent_queries]
+            pending_slices = pending_slices[max_concurrent_queries:]
+
+            poller = self.api.new_explorer_queries_poller(max_poll_interval_seconds=self.check_for_update_interval_seconds)
+            for index, (slice_from, slice_to) in enumerate(slices_batch):
+                slice_filters = copy.copy(self.filters)
+                slice_filters._time_from = slice_from
+                slice_filters._time_to = slice_to
+                poller.submit(str(index), slice_filters, draft_mode_enabled=self.draft_mode_enabled)
+
+            results = poller.wait_for_all(max_running_time_seconds=max(0.0, deadline - time.monotonic()))
+
+            for index, (slice_from, slice_to) in enumerate(slices_batch):
+                result = results[str(index)]
+                if result.count_records() < self.filters.max_results:
+                    completed_results.append(result)
+                elif duration_seconds(slice_from, slice_to) <= max(1, min_slice_seconds):
+                    pylo.log.warn("Explorer query time slice {} -> {} has reached max_results={} and is too short to be "
+                                  "split again, some flows may be missing".format(slice_from, slice_to, self.filters.max_results))
+                    completed_results.append(result)
+                else:
+                    pylo.log.info("Explorer query time slice {} -> {} has reached max_results={}, splitting it".
+                                  format(slice_from, slice_to, self.filters.max_results))
+                    pending_slices.extend(split(slice_from, slice_to))
+
+        self.results = ExplorerResultSetV2.merge(completed_results)
+        return self.results
+
@@ -0,0 +1,140 @@
+import time
+from collections import deque
+from threading import Lock
+from typing import Optional, Deque, Callable
+
+from illumio_pylo import log
+
+default_minimum_calls_per_minute = 10
+default_rate_decrease_factor = 0.75
+default_rate_increase_per_minute = 20.0  # calls per minute added for each minute elapsed without 429
+default_burst_seconds = 5
+
+
+class APIRateLimiter:
+    """
+    Thread safe token bucket pacing API calls made to a PCE. It can be shared by several threads and connectors
+    using the same API user, so they all draw from the same budget.
+
+    No pacing is applied until the PCE replies with a 'too_many_requests_error'. At that point the budget is learnt
+    from the number of calls made during the last minute and then adjusted with an additive increase/multiplicative
+    decrease strategy: each new 429 cuts the rate, then it grows back by rate_increase_per_minute for each minute
+    elapsed without 429 (whatever the number of calls made). Retry-After headers are honored by blocking every caller
+    until the delay has expired.
+    """
+
+    def __init__(self, calls_per_minute: Optional[float] = None,
+                 minimum_calls_per_minute: float = default_minimum_calls_per_minute,
+                 maximum_calls_per_minute: Optional[float] = None,
+                 burst_seconds: float = default_burst_seconds,
+                 rate_increase_per_minute: float = default_rate_increase_per_minute,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        :param calls_per_minute: initial budget, None means unlimited until the first 429 is received
+        :param minimum_calls_per_minute: the budget will never be lowered below this value
+        :param maximum_calls_per_minute: the budget will never be raised above this value, None for no limit
+        :param burst_seconds: how many seconds worth of calls can be made in a single burst
+        :param rate_increase_per_minute: calls per minute added to the budget for each minute elapsed without 429
+        :param clock: monotonic time source in seconds, meant to be replaced in tests
+        :param sleep: function used to wait, meant to be replaced in tests
+        """
+        self._lock = Lock()
+        self._clock = clock
+        self._sleep = sleep
+        self.calls_per_minute: Optional[float] = calls_per_minute
+        self.minimum_calls_per_minute = minimum_calls_per_minute
+        self.maximum_calls_per_minute = maximum_calls_per_minute
+        self.burst_seconds = burst_seconds
+        self.rate_increase_per_minute = rate_increase_per_minute
+        self._tokens: float = self._bucket_capacity()
+        self._last_refill_time = clock()
+        self._last_increase_time = self._last_refill_time
+        self._blocked_until: float = 0.0
+        self._recent_calls: Deque[float] = deque()
+        self.too_many_requests_count = 0
+
+    def _bucket_capacity(self) -> float:
+        if self.calls_per_minute is None:
+            return 0.0
+        return max(1.0, self.calls_per_minute / 60 * self.burst_seconds)
+
+    def _refill(self, now: float):
+        if self.calls_per_minute is not None:
+            self._tokens = min(self._bucket_capacity(),
+                               self._tokens + (now - self._last_refill_time) * self.calls_per_minute / 60)
+        self._last_refill_time = now
+
+    def acquire(self):
+        """
+        Blocks until a call can be made without exceeding the budget
+        """
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+
+            # tracks calls of the last minute to estimate the budget when the first 429 shows up
+            self._recent_calls.append(now)
+            while self._recent_calls[0] < now - 60:
+                self._recent_calls.popleft()
+
+            wait_time = max(0.0, self._blocked_until - now)
+
+            if self.calls_per_minute is not None:
+                # tokens can go negative, which reserves a slot in the future for this caller
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait_time = max(wait_time, -self._tokens * 60 / self.calls_per_minute)
+
+        if wait_time > 0:
+            log.debug("Rate limiter is pacing API calls, waiting {:.2f} seconds".format(wait_time))
+            self._sleep(wait_time)
+
+    def report_success(self):
+        """
+        To be called after each successful API call so the budget can grow back with the time elapsed since the last
+        429 or the last increase
+        """
+        if self.calls_per_minute is None:
+            return
+        with self._lock:
+            now = self._clock()
+            elapsed = now - self._last_increase_time
+            if elapsed <= 0:
+                return
+            # tokens earned so far are accounted for at the previous rate before it's raised
+            self._refill(now)
+            self._last_increase_time = now
+            self.calls_per_minute += self.rate_increase_per_minute * elapsed / 60
+            if self.maximum_calls_per_minute is not None:
+                self.calls_per_minute = min(self.calls_per_minute, self.maximum_calls_per_minute)
+
+    def report_too_many_requests(self, retry_after: Optional[float] = None):
+        """
+        To be called when the PCE replied with a 'too_many_requests_error'
+
+        :param retry_after: delay in seconds requested by the PCE (Retry-After header), if any
+        """
+        with self._lock:
+            now = self._clock()
+            self.too_many_requests_count += 1
+            self._last_increase_time = now
+
+            if self.calls_per_minute is None:
+                # first time we hit the limit: what went through during the last minute is our best estimate
+                while len(self._recent_calls) > 0 and self._recent_calls[0] < now - 60:
+                    self._recent_calls.popleft()
+                new_rate = len(self._recent_calls) * default_rate_decrease_factor
+            else:
+                new_rate = self.calls_per_minute * default_rate_decrease_factor
+
+            self.calls_per_minute = max(self.minimum_calls_per_minute, new_rate)
+            if self.maximum_calls_per_minute is not None:
+                self.calls_per_minute = min(self.calls_per_minute, self.maximum_calls_per_minute)
+            self._tokens = 0.0
+            self._last_refill_time = now
+
+            if retry_after is not None and retry_after > 0:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+
+            log.info("API call limit reached, rate limiter budget is now {:.1f} calls per minute".format(self.calls_per_minute))
@@ -41,4 +41,9 @@ class PyloApiRequestForbiddenEx(PyloApiEx):
         PyloApiEx(arg, json_object)
 
 
+class PyloApiObjectNotFoundEx(PyloApiEx):
+    def __init__(self, arg, json_object=None):
+        PyloApiEx(arg, json_object)
+
+
 
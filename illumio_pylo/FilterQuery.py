@@ -12,10 +12,14 @@ Example queries:
 """
 
 from abc import ABC, abstractmethod
+from array import array
 from dataclasses import dataclass
 from datetime import datetime, date
+from collections import OrderedDict
 from enum import Enum, auto
-from typing import Any, Callable, Dict, Generic, List, Optional, TypeVar, Union
+from functools import lru_cache
+from operator import eq, ne, lt, gt, le, ge
+from typing import Any, Callable, Dict, Generic, Iterable, List, Optional, TypeVar, Union
 import re
 
 import illumio_pylo as pylo
@@ -201,6 +205,11 @@ class QueryLexer:
         return tokens
 
 
+Predicate = Callable[[Any], bool]
+# candidate objects found through indexes, keyed by id() so any object type can be used
+Candidates = Dict[int, Any]
+
+
 class QueryNode(ABC):
     """Base class for all AST nodes"""
 
@@ -209,6 +218,24 @@ class QueryNode(ABC):
         """Evaluate this node against an object"""
         pass
 
+    @abstractmethod
+    def compile(self, registry: 'FilterRegistry') -> Predicate:
+        """Compile this node into a predicate, meant to be evaluated against many objects"""
+        pass
+
+    @abstractmethod
+    def evaluate_mask(self, table: 'ColumnarTable') -> int:
+        """Evaluate this node against all objects of a ColumnarTable at once, returns a bitmask of matching rows"""
+        pass
+
+    def plan(self, registry: 'FilterRegistry', store: Any) -> Optional[Candidates]:
+        """
+        Find candidates for this node through the registry's indexes of the given store (ie: a WorkloadStore).
+        Candidates are a superset of matching objects, None means this node cannot be served by indexes and all
+        objects must be evaluated.
+        """
+        return None
+
 
 class AndNode(QueryNode):
     """Represents an AND operation between two nodes"""
@@ -220,6 +247,28 @@ class AndNode(QueryNode):
     def evaluate(self, obj: Any, registry: 'FilterRegistry') -> bool:
         return self.left.evaluate(obj, registry) and self.right.evaluate(obj, registry)
 
+    def compile(self, registry: 'FilterRegistry') -> Predicate:
+        left = self.left.compile(registry)
+        right = self.right.compile(registry)
+        return lambda obj: left(obj) and right(obj)
+
+    def evaluate_mask(self, table: 'ColumnarTable') -> int:
+        left = self.left.evaluate_mask(table)
+        if left == 0:
+            return 0
+        return left & self.right.evaluate_mask(table)
+
+    def plan(self, registry: 'FilterRegistry', store: Any) -> Optional[Candidates]:
+        left = self.left.plan(registry, store)
+        right = self.right.plan(registry, store)
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if len(left) > len(right):
+            left, right = right, left
+        return {key: obj for key, obj in left.items() if key in right}
+
     def __repr__(self):
         return f"AndNode({self.left}, {self.right})"
 
@@ -234,6 +283,28 @@ class OrNode(QueryNode):
     def evaluate(self, obj: Any, registry: 'FilterRegistry') -> bool:
         return self.left.evaluate(obj, registry) or self.right.evaluate(obj, registry)
 
+    def compile(self, registry: 'FilterRegistry') -> Predicate:
+        left = self.left.compile(registry)
+        right = self.right.compile(registry)
+        return lambda obj: left(obj) or right(obj)
+
+    def evaluate_mask(self, table: 'ColumnarTable') -> int:
+        left = self.left.evaluate_mask(table)
+        if left == table.all_rows_mask:
+            return left
+        return left | self.right.evaluate_mask(table)
+
+    def plan(self, registry: 'FilterRegistry', store: Any) -> Optional[Candidates]:
+        left = self.left.plan(registry, store)
+        if left is None:
+            return None
+        right = self.right.plan(registry, store)
+        if right is None:
+            return None
+        result = left.copy()
+        result.update(right)
+        return result
+
     def __repr__(self):
         return f"OrNode({self.left}, {self.right})"
 
@@ -247,6 +318,13 @@ class NotNode(QueryNode):
     def evaluate(self, obj: Any, registry: 'FilterRegistry') -> bool:
         return not self.operand.evaluate(obj, registry)
 
+    def compile(self, registry: 'FilterRegistry') -> Predicate:
+        operand = self.operand.compile(registry)
+        return lambda obj: not operand(obj)
+
+    def evaluate_mask(self, table: 'ColumnarTable') -> int:
+        return table.all_rows_mask & ~self.operand.evaluate_mask(table)
+
     def __repr__(self):
         return f"NotNode({self.operand})"
 
@@ -262,6 +340,15 @@ class ConditionNode(QueryNode):
     def evaluate(self, obj: Any, registry: 'FilterRegistry') -> bool:
         return registry.evaluate_condition(obj, self.field, self.operator, self.value)
 
+    def compile(self, registry: 'FilterRegistry') -> Predicate:
+        return registry.compile_condition(self.field, self.operator, self.value)
+
+    def evaluate_mask(self, table: 'ColumnarTable') -> int:
+        return table.condition_mask(self.field, self.operator, self.value)
+
+    def plan(self, registry: 'FilterRegistry', store: Any) -> Optional[Candidates]:
+        return registry.lookup_condition(self.field, self.operator, self.value, store)
+
     def __repr__(self):
         return f"ConditionNode({self.field} {self.operator.name} {self.value!r})"
 
@@ -387,6 +474,19 @@ class QueryParser:
         return ConditionNode(field, operator, value)
 
 
+# number of parsed (and compiled, per registry) queries kept in cache, least recently used ones are evicted first
+query_cache_size = 256
+
+
+@lru_cache(maxsize=query_cache_size)
+def parse_query(query_string: str) -> QueryNode:
+    """Tokenize and parse a query string into an AST. Results are cached by query text as ASTs are never modified."""
+    lexer = QueryLexer(query_string)
+    tokens = lexer.tokenize()
+    parser = QueryParser(tokens)
+    return parser.parse()
+
+
 class ValueType(Enum):
     """Supported value types for filter fields"""
     STRING = auto()
@@ -400,6 +500,15 @@ class ValueType(Enum):
 
 T = TypeVar('T')
 
+_comparison_functions: Dict[TokenType, Callable[[Any, Any], bool]] = {
+    TokenType.EQ: eq,
+    TokenType.NEQ: ne,
+    TokenType.LT: lt,
+    TokenType.GT: gt,
+    TokenType.LTE: le,
+    TokenType.GTE: ge,
+}
+
 
 @dataclass
 class FilterField(Generic[T]):
@@ -409,6 +518,10 @@ class FilterField(Generic[T]):
     getter: Callable[[T], Any]
     description: str = ""
     supported_operators: Optional[List[TokenType]] = None
+    # optional index: receives the store holding the objects, an operator and a converted value, returns a superset of
+    # the matching objects of that store or None if that condition cannot be served by the index. Candidates (objects
+    # keyed by id()) can be returned as-is to avoid a copy, they won't be modified
+    index_lookup: Optional[Callable[[Any, TokenType, Any], Optional[Union[Iterable[T], Candidates]]]] = None
 
     def __post_init__(self):
         if self.supported_operators is None:
@@ -443,10 +556,25 @@ class FilterRegistry(ABC, Generic[T]):
 
     def __init__(self):
         self._fields: Dict[str, FilterField[T]] = {}
+        self._compiled_queries: OrderedDict[str, Predicate] = OrderedDict()
 
     def register_field(self, field: FilterField[T]):
         """Register a filterable field"""
         self._fields[field.name.lower()] = field
+        self._compiled_queries.clear()
+
+    def compile_query(self, query_string: str, ast: QueryNode) -> Predicate:
+        """Compile the AST of a query, predicates are kept in an LRU cache keyed by query text"""
+        predicate = self._compiled_queries.get(query_string)
+        if predicate is not None:
+            self._compiled_queries.move_to_end(query_string)
+            return predicate
+
+        predicate = ast.compile(self)
+        self._compiled_queries[query_string] = predicate
+        if len(self._compiled_queries) > query_cache_size:
+            self._compiled_queries.popitem(last=False)
+        return predicate
 
     def get_field(self, name: str) -> Optional[FilterField[T]]:
         """Get a field by name (case-insensitive)"""
@@ -456,8 +584,8 @@ class FilterRegistry(ABC, Generic[T]):
         """Get all registered fields"""
         return self._fields.copy()
 
-    def evaluate_condition(self, obj: T, field_name: str, operator: TokenType, value: Any) -> bool:
-        """Evaluate a single condition against an object"""
+    def _get_field_for_operator(self, field_name: str, operator: TokenType) -> FilterField[T]:
+        """Get a field by name and check that it supports the operator"""
         field = self.get_field(field_name)
         if field is None:
             raise pylo.PyloEx(f"Unknown field '{field_name}'. Available fields: {', '.join(self._fields.keys())}")
@@ -468,14 +596,125 @@ class FilterRegistry(ABC, Generic[T]):
                 f"Supported operators: {[op.name for op in field.supported_operators]}"
             )
 
-        # Get the actual value from the object
-        actual_value = field.getter(obj)
+        return field
 
-        # Convert value if needed based on field type
-        converted_value = self._convert_value(value, field.value_type)
+    def evaluate_condition(self, obj: T, field_name: str, operator: TokenType, value: Any) -> bool:
+        """Evaluate a single condition against an object"""
+        # comparison semantics are only defined in compile_value_comparison()
+        return self.compile_condition(field_name, operator, value)(obj)
 
-        # Perform the comparison
-        return self._compare(actual_value, operator, converted_value, field.value_type)
+    def lookup_condition(self, field_name: str, operator: TokenType, value: Any, store: Any) -> Optional[Candidates]:
+        """
+        Find candidates for a single condition using the field's index on the given store, if it has one. Returns None
+        if the condition cannot be served by an index.
+        """
+        field = self._get_field_for_operator(field_name, operator)
+        if field.index_lookup is None:
+            return None
+
+        expected = self._convert_value(value, field.value_type)
+        # conditions matching empty values are not indexed
+        if expected is None or (isinstance(expected, str) and expected.lower() == 'none'):
+            return None
+
+        if field.value_type == ValueType.BOOLEAN and operator == TokenType.NEQ:
+            operator = TokenType.EQ
+            expected = not expected
+
+        objects = field.index_lookup(store, operator, expected)
+        if objects is None or isinstance(objects, dict):
+            return objects
+        return {id(obj): obj for obj in objects}
+
+    def compile_condition(self, field_name: str, operator: TokenType, value: Any) -> Predicate:
+        """
+        Compile a single condition into a predicate. Field lookup, operator validation, value conversion and regex
+        compilation happen once here instead of for each object.
+        """
+        field = self._get_field_for_operator(field_name, operator)
+        getter = field.getter
+        compare = self.compile_value_comparison(field, operator, value)
+        return lambda obj: compare(getter(obj))
+
+    def compile_value_comparison(self, field: FilterField[T], operator: TokenType, value: Any) -> Callable[[Any], bool]:
+        """
+        Compile the comparison of a condition into a function receiving the field's value rather than the object
+        """
+        value_type = field.value_type
+        expected = self._convert_value(value, value_type)
+
+        # result when the field has no value on the object
+        expected_is_none = expected is None or (isinstance(expected, str) and expected.lower() == 'none')
+        if operator == TokenType.EQ:
+            none_result = expected_is_none
+        elif operator == TokenType.NEQ:
+            none_result = not expected_is_none
+        else:
+            none_result = False
+
+        def always_false(actual: Any) -> bool:
+            return False
+
+        compare: Callable[[Any], bool] = always_false
+
+        if value_type == ValueType.STRING:
+            expected_lower = expected.lower() if isinstance(expected, str) else str(expected).lower()
+
+            def to_lower(actual: Any) -> str:
+                return actual.lower() if isinstance(actual, str) else str(actual).lower()
+
+            if operator == TokenType.EQ:
+                compare = lambda actual: to_lower(actual) == expected_lower
+            elif operator == TokenType.NEQ:
+                compare = lambda actual: to_lower(actual) != expected_lower
+            elif operator == TokenType.CONTAINS:
+                compare = lambda actual: expected_lower in to_lower(actual)
+            elif operator == TokenType.MATCHES:
+                try:
+                    pattern = re.compile(expected, re.IGNORECASE)
+                except re.error as e:
+                    raise pylo.PyloEx(f"Invalid regex pattern '{expected}': {e}")
+                compare = lambda actual: pattern.search(actual) is not None
+
+        elif value_type in (ValueType.INT, ValueType.FLOAT, ValueType.BOOLEAN):
+            comparison_function = _comparison_functions.get(operator)
+            if value_type == ValueType.BOOLEAN and operator not in (TokenType.EQ, TokenType.NEQ):
+                comparison_function = None
+            if comparison_function is not None:
+                compare = lambda actual: comparison_function(actual, expected)
+
+        elif value_type in (ValueType.DATE, ValueType.DATETIME):
+            comparison_function = _comparison_functions.get(operator)
+            if comparison_function is not None:
+                if isinstance(expected, date) and not isinstance(expected, datetime):
+                    # datetime values must be truncated to be compared with a date
+                    def compare(actual: Any) -> bool:
+                        if isinstance(actual, datetime):
+                            actual = actual.date()
+                        return comparison_function(actual, expected)
+                else:
+                    compare = lambda actual: comparison_function(actual, expected)
+
+        elif value_type == ValueType.IP_ADDRESS:
+            if operator in (TokenType.EQ, TokenType.CONTAINS):
+                def compare(actual: Any) -> bool:
+                    if isinstance(actual, (list, tuple)):
+                        return expected in actual
+                    if operator == TokenType.EQ:
+                        return actual == expected
+                    return expected in str(actual)
+            elif operator == TokenType.NEQ:
+                def compare(actual: Any) -> bool:
+                    if isinstance(actual, (list, tuple)):
+                        return expected not in actual
+                    return actual != expected
+
+        def compare_or_none(actual: Any) -> bool:
+            if actual is None:
+                return none_result
+            return compare(actual)
+
+        return compare_or_none
 
     def _convert_value(self, value: Any, value_type: ValueType) -> Any:
         """Convert a parsed value to the appropriate type"""
@@ -520,94 +759,6 @@ class FilterRegistry(ABC, Generic[T]):
 
         return value
 
-    def _compare(self, actual: Any, operator: TokenType, expected: Any, value_type: ValueType) -> bool:
-        """Compare actual value with expected value using the operator"""
-        # Handle None values
-        if actual is None:
-            if operator == TokenType.EQ:
-                return expected is None or (isinstance(expected, str) and expected.lower() == 'none')
-            elif operator == TokenType.NEQ:
-                return expected is not None and not (isinstance(expected, str) and expected.lower() == 'none')
-            return False
-
-        # String comparisons (case-insensitive by default)
-        if value_type == ValueType.STRING:
-            actual_lower = actual.lower() if isinstance(actual, str) else str(actual).lower()
-            expected_lower = expected.lower() if isinstance(expected, str) else str(expected).lower()
-
-            if operator == TokenType.EQ:
-                return actual_lower == expected_lower
-            elif operator == TokenType.NEQ:
-                return actual_lower != expected_lower
-            elif operator == TokenType.CONTAINS:
-                return expected_lower in actual_lower
-            elif operator == TokenType.MATCHES:
-                try:
-                    return bool(re.search(expected, actual, re.IGNORECASE))
-                except re.error as e:
-                    raise pylo.PyloEx(f"Invalid regex pattern '{expected}': {e}")
-
-        # Numeric comparisons
-        elif value_type in (ValueType.INT, ValueType.FLOAT):
-            if operator == TokenType.EQ:
-                return actual == expected
-            elif operator == TokenType.NEQ:
-                return actual != expected
-            elif operator == TokenType.LT:
-                return actual < expected
-            elif operator == TokenType.GT:
-                return actual > expected
-            elif operator == TokenType.LTE:
-                return actual <= expected
-            elif operator == TokenType.GTE:
-                return actual >= expected
-
-        # Boolean comparisons
-        elif value_type == ValueType.BOOLEAN:
-            if operator == TokenType.EQ:
-                return actual == expected
-            elif operator == TokenType.NEQ:
-                return actual != expected
-
-        # Date/DateTime comparisons
-        elif value_type in (ValueType.DATE, ValueType.DATETIME):
-            # Convert actual to comparable format if it's a datetime and expected is a date
-            if isinstance(actual, datetime) and isinstance(expected, date) and not isinstance(expected, datetime):
-                actual = actual.date()
-
-            if operator == TokenType.EQ:
-                return actual == expected
-            elif operator == TokenType.NEQ:
-                return actual != expected
-            elif operator == TokenType.LT:
-                return actual < expected
-            elif operator == TokenType.GT:
-                return actual > expected
-            elif operator == TokenType.LTE:
-                return actual <= expected
-            elif operator == TokenType.GTE:
-                return actual >= expected
-
-        # IP Address comparisons
-        elif value_type == ValueType.IP_ADDRESS:
-            # Handle list of IPs (from interfaces)
-            if isinstance(actual, (list, tuple)):
-                if operator == TokenType.EQ:
-                    return expected in actual
-                elif operator == TokenType.NEQ:
-                    return expected not in actual
-                elif operator == TokenType.CONTAINS:
-                    return expected in actual
-            else:
-                if operator == TokenType.EQ:
-                    return actual == expected
-                elif operator == TokenType.NEQ:
-                    return actual != expected
-                elif operator == TokenType.CONTAINS:
-                    return expected in str(actual)
-
-        return False
-
 
 class FilterQuery(Generic[T]):
     """
@@ -623,31 +774,173 @@ class FilterQuery(Generic[T]):
         self.registry = registry
         self._ast: Optional[QueryNode] = None
         self._query_string: Optional[str] = None
+        self._predicate: Optional[Predicate] = None
 
     def parse(self, query_string: str) -> 'FilterQuery[T]':
         """Parse a query string into an AST"""
         self._query_string = query_string
-        lexer = QueryLexer(query_string)
-        tokens = lexer.tokenize()
-        parser = QueryParser(tokens)
-        self._ast = parser.parse()
+        self._ast = parse_query(query_string)
+        self._predicate = None
         return self
 
-    def evaluate(self, obj: T) -> bool:
-        """Evaluate the parsed query against a single object"""
+    def compile(self) -> Predicate:
+        """Compile the parsed query into a single predicate, the result is cached until another query is parsed"""
         if self._ast is None:
             raise pylo.PyloEx("No query has been parsed. Call parse() first.")
-        return self._ast.evaluate(obj, self.registry)
+        if self._predicate is None:
+            self._predicate = self.registry.compile_query(self._query_string, self._ast)
+        return self._predicate
+
+    def plan(self, store: Any) -> Optional[List[T]]:
+        """
+        Find candidates for the parsed query through the registry's indexes of the given store (ie: a WorkloadStore).
+        They're a superset of the matching objects which still have to be evaluated with compile(). None means indexes
+        cannot help and all objects must be evaluated.
+        """
+        if self._ast is None:
+            raise pylo.PyloEx("No query has been parsed. Call parse() first.")
+        candidates = self._ast.plan(self.registry, store)
+        if candidates is None:
+            return None
+        return list(candidates.values())
+
+    def evaluate(self, obj: T) -> bool:
+        """Evaluate the parsed query against a single object"""
+        return self.compile()(obj)
 
     def execute(self, query_string: str, objects: List[T]) -> List[T]:
         """Parse a query and execute it against a list of objects"""
-        self.parse(query_string)
-        return [obj for obj in objects if self.evaluate(obj)]
+        predicate = self.parse(query_string).compile()
+        return [obj for obj in objects if predicate(obj)]
 
     def execute_to_dict(self, query_string: str, objects: Dict[str, T]) -> Dict[str, T]:
         """Parse a query and execute it against a dict of objects"""
+        predicate = self.parse(query_string).compile()
+        return {key: obj for key, obj in objects.items() if predicate(obj)}
+
+    def execute_columnar(self, query_string: str, table: 'ColumnarTable[T]') -> List[T]:
+        """Parse a query and execute it against all objects of a ColumnarTable with bitmask operations"""
         self.parse(query_string)
-        return {key: obj for key, obj in objects.items() if self.evaluate(obj)}
+        return table.mask_to_objects(self._ast.evaluate_mask(table))
+
+
+class ColumnarTable(Generic[T]):
+    """
+    Column oriented snapshot of objects for analytic queries. Each field of the registry becomes a dictionary encoded
+    column: distinct values (label names, versions, timestamps, flags...) are interned once and every row holds the
+    code of its value in an array. A condition is then evaluated once per distinct value rather than once per object,
+    and its result is a bitmask (Python int, bit N for row N) which AND/OR/NOT nodes combine with bitwise operations.
+
+    Columns are built on first use unless listed in preload_fields, values are those found at that time.
+
+    Usage:
+        table = ColumnarTable(registry, workloads)
+        results = FilterQuery(registry).execute_columnar("last_heartbeat < '2024-01-01' and env == 'prod'", table)
+    """
+
+    # columns with more distinct values than this are evaluated by scanning row codes instead of OR'ing value masks
+    max_distinct_values_for_masks = 256
+
+    class Column:
+        __slots__ = ['values', 'codes', '_masks']
+
+        def __init__(self, values: List[Any], codes: array):
+            self.values: List[Any] = values
+            self.codes: array = codes
+            self._masks: Optional[List[int]] = None
+
+        def get_value_mask(self, code: int) -> int:
+            if self._masks is None:
+                # masks of all values are built in a single pass
+                positions_by_code: List[List[int]] = [[] for _ in self.values]
+                for position, row_code in enumerate(self.codes):
+                    positions_by_code[row_code].append(position)
+                self._masks = [ColumnarTable.positions_to_mask(positions, len(self.codes))
+                               for positions in positions_by_code]
+            return self._masks[code]
+
+    def __init__(self, registry: FilterRegistry[T], objects: Iterable[T], preload_fields: Optional[Iterable[str]] = None):
+        self.registry: FilterRegistry[T] = registry
+        self.objects: List[T] = list(objects)
+        self.all_rows_mask: int = (1 << len(self.objects)) - 1
+        self._columns: Dict[str, ColumnarTable.Column] = {}
+
+        if preload_fields is not None:
+            for field_name in preload_fields:
+                self.get_column(field_name)
+
+    @staticmethod
+    def positions_to_mask(positions: Iterable[int], size: int) -> int:
+        buffer = bytearray((size + 7) // 8)
+        for position in positions:
+            buffer[position >> 3] |= 1 << (position & 7)
+        return int.from_bytes(buffer, 'little')
+
+    @staticmethod
+    def mask_to_positions(mask: int) -> List[int]:
+        positions = []
+        for byte_index, byte in enumerate(mask.to_bytes((mask.bit_length() + 7) // 8, 'little')):
+            if byte == 0:
+                continue
+            base = byte_index << 3
+            for bit in range(8):
+                if byte & (1 << bit):
+                    positions.append(base + bit)
+        return positions
+
+    def get_column(self, field_name: str) -> 'ColumnarTable.Column':
+        column = self._columns.get(field_name.lower())
+        if column is not None:
+            return column
+
+        field = self.registry.get_field(field_name)
+        if field is None:
+            raise pylo.PyloEx(f"Unknown field '{field_name}'. Available fields: {', '.join(self.registry.get_all_fields().keys())}")
+
+        codes_by_value: Dict[Any, int] = {}
+        values: List[Any] = []
+        codes = array('I')
+        getter = field.getter
+        for obj in self.objects:
+            value = getter(obj)
+            if isinstance(value, list):
+                value = tuple(value)
+            code = codes_by_value.get(value)
+            if code is None:
+                code = len(values)
+                codes_by_value[value] = code
+                values.append(value)
+            codes.append(code)
+
+        column = ColumnarTable.Column(values, codes)
+        self._columns[field_name.lower()] = column
+        return column
+
+    def condition_mask(self, field_name: str, operator: TokenType, value: Any) -> int:
+        """Evaluate a single condition against all rows, returns a bitmask of matching rows"""
+        field = self.registry._get_field_for_operator(field_name, operator)
+        compare = self.registry.compile_value_comparison(field, operator, value)
+        column = self.get_column(field_name)
+
+        matching_codes = [code for code, column_value in enumerate(column.values) if compare(column_value)]
+        if len(matching_codes) == 0:
+            return 0
+        if len(matching_codes) == len(column.values):
+            return self.all_rows_mask
+
+        if len(column.values) <= self.max_distinct_values_for_masks:
+            mask = 0
+            for code in matching_codes:
+                mask |= column.get_value_mask(code)
+            return mask
+
+        matching_codes_set = set(matching_codes)
+        return self.positions_to_mask(
+            (position for position, code in enumerate(column.codes) if code in matching_codes_set), len(column.codes))
+
+    def mask_to_objects(self, mask: int) -> List[T]:
+        objects = self.objects
+        return [objects[position] for position in self.mask_to_positions(mask)]
 
 
 # =============================================================================
@@ -676,28 +969,32 @@ class WorkloadFilterRegistry(FilterRegistry['pylo.Workload']):
             name='name',
             value_type=ValueType.STRING,
             getter=lambda w: w.get_name(),
-            description='Workload name (forced_name if set, otherwise hostname)'
+            description='Workload name (forced_name if set, otherwise hostname)',
+            index_lookup=self._make_index_lookup_name(('forced_name', 'hostname'))
         ))
 
         self.register_field(FilterField(
             name='hostname',
             value_type=ValueType.STRING,
             getter=lambda w: w.hostname,
-            description='Workload hostname'
+            description='Workload hostname',
+            index_lookup=self._make_index_lookup_name(('hostname',))
         ))
 
         self.register_field(FilterField(
             name='forced_name',
             value_type=ValueType.STRING,
             getter=lambda w: w.forced_name,
-            description='Manually set workload name'
+            description='Manually set workload name',
+            index_lookup=self._make_index_lookup_name(('forced_name',))
         ))
 
         self.register_field(FilterField(
             name='href',
             value_type=ValueType.STRING,
             getter=lambda w: w.href,
-            description='Workload HREF'
+            description='Workload HREF',
+            index_lookup=self._index_lookup_href
         ))
 
         self.register_field(FilterField(
@@ -719,21 +1016,24 @@ class WorkloadFilterRegistry(FilterRegistry['pylo.Workload']):
             name='managed',
             value_type=ValueType.BOOLEAN,
             getter=lambda w: not w.unmanaged,
-            description='Whether the workload is managed (has VEN)'
+            description='Whether the workload is managed (has VEN)',
+            index_lookup=self._make_index_lookup_flag('managed')
         ))
 
         self.register_field(FilterField(
             name='unmanaged',
             value_type=ValueType.BOOLEAN,
             getter=lambda w: w.unmanaged,
-            description='Whether the workload is unmanaged'
+            description='Whether the workload is unmanaged',
+            index_lookup=self._make_index_lookup_flag('unmanaged')
         ))
 
         self.register_field(FilterField(
             name='deleted',
             value_type=ValueType.BOOLEAN,
             getter=lambda w: w.deleted,
-            description='Whether the workload is deleted'
+            description='Whether the workload is deleted',
+            index_lookup=self._make_index_lookup_flag('deleted')
         ))
 
         # OS fields
@@ -756,7 +1056,8 @@ class WorkloadFilterRegistry(FilterRegistry['pylo.Workload']):
             name='ip_address',
             value_type=ValueType.IP_ADDRESS,
             getter=lambda w: [iface.ip for iface in w.interfaces if iface.ip],
-            description='Workload IP addresses (checks all interfaces)'
+            description='Workload IP addresses (checks all interfaces)',
+            index_lookup=self._index_lookup_ip
         ))
 
         # Alias for ip_address
@@ -764,7 +1065,8 @@ class WorkloadFilterRegistry(FilterRegistry['pylo.Workload']):
             name='ip',
             value_type=ValueType.IP_ADDRESS,
             getter=lambda w: [iface.ip for iface in w.interfaces if iface.ip],
-            description='Workload IP addresses (alias for ip_address)'
+            description='Workload IP addresses (alias for ip_address)',
+            index_lookup=self._index_lookup_ip
         ))
 
         # VEN/Agent fields
@@ -826,10 +1128,69 @@ class WorkloadFilterRegistry(FilterRegistry['pylo.Workload']):
         self.register_field(FilterField(
             name='reference_count',
             value_type=ValueType.INT,
-            getter=lambda w: w.count_references(),
+            getter=self._count_workload_references,
             description='Number of references to this workload'
         ))
 
+    # index lookups receive the WorkloadStore being queried rather than using self._org: registries are cached by org
+    # id so they can be shared by several Organizations
+
+    @staticmethod
+    def _index_lookup_href(store: 'pylo.WorkloadStore', operator: TokenType, expected: str) \
+            -> Optional[Iterable['pylo.Workload']]:
+        if operator != TokenType.EQ:
+            return None
+        items = store.itemsByHRef
+        # hrefs are compared case-insensitively but PCE hrefs are lowercase
+        workload = items.get(expected) or items.get(expected.lower())
+        return [workload] if workload is not None else []
+
+    @staticmethod
+    def _make_index_lookup_name(sources: tuple):
+        def lookup(store: 'pylo.WorkloadStore', operator: TokenType, expected: str) -> Optional[Iterable['pylo.Workload']]:
+            if operator != TokenType.EQ:
+                return None
+            result = []
+            for source in sources:
+                result.extend(store._get_name_index(source, False, False).get(expected.lower(), []))
+            return result
+        return lookup
+
+    @staticmethod
+    def _make_index_lookup_flag(flag: str):
+        def lookup(store: 'pylo.WorkloadStore', operator: TokenType, expected: bool) -> Optional[Candidates]:
+            if operator != TokenType.EQ:
+                return None
+            return store._get_flag_index()[(flag, expected)]
+        return lookup
+
+    @staticmethod
+    def _index_lookup_ip(store: 'pylo.WorkloadStore', operator: TokenType, expected: str) \
+            -> Optional[Iterable['pylo.Workload']]:
+        # 'contains' is an exact match against the list of interface IPs
+        if operator not in (TokenType.EQ, TokenType.CONTAINS):
+            return None
+        return store.find_workloads_matching_ip(expected)
+
+    @staticmethod
+    def _make_index_lookup_label(label_type: str):
+        def lookup(store: 'pylo.WorkloadStore', operator: TokenType, expected: str) -> Optional[Iterable['pylo.Workload']]:
+            if operator != TokenType.EQ:
+                return None
+            result = {}
+            expected_lower = expected.lower()
+            for label in store.owner.LabelStore.get_labels(label_type):
+                if label.name.lower() == expected_lower:
+                    result.update(store.find_workloads_matching_label(label))
+            return result.values()
+        return lookup
+
+    def _count_workload_references(self, workload) -> int:
+        # references to a workload are only all known once lazily loaded stores (ie: rulesets) have been built, the
+        # workload's own Organization is used as registries are shared by all Organizations with the same id
+        workload.owner.owner.load_all_lazy_objects()
+        return workload.count_references()
+
     def _register_label_fields(self):
         """
         Register label fields dynamically.
@@ -849,13 +1210,15 @@ class WorkloadFilterRegistry(FilterRegistry['pylo.Workload']):
                 return lambda w: w.get_label(lt).name if w.get_label(lt) else None
 
             getter = make_getter(label_type)
+            index_lookup = self._make_index_lookup_label(label_type)
 
             # Register with 'label.' prefix
             self.register_field(FilterField(
                 name=f'label.{label_type}',
                 value_type=ValueType.STRING,
                 getter=getter,
-                description=f'{label_type.capitalize()} label name'
+                description=f'{label_type.capitalize()} label name',
+                index_lookup=index_lookup
             ))
 
             # Register shorthand alias (just the label type name)
@@ -863,7 +1226,8 @@ class WorkloadFilterRegistry(FilterRegistry['pylo.Workload']):
                 name=label_type,
                 value_type=ValueType.STRING,
                 getter=getter,
-                description=f'{label_type.capitalize()} label name (alias for label.{label_type})'
+                description=f'{label_type.capitalize()} label name (alias for label.{label_type})',
+                index_lookup=index_lookup
             ))
 
 
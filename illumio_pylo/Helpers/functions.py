@@ -3,6 +3,8 @@ import os
 import re
 import time
 import functools
+import codecs
+from typing import Iterable, Iterator, Union, Any
 
 
 def nice_json(json_obj):
@@ -159,3 +161,95 @@ def clock_elapsed_str(name: str = 'default'):
     return "%d:%02d:%02d.%03d" % \
         functools.reduce(lambda ll, b: divmod(ll[0], b) + ll[1:],
                          [(t * 1000,), 1000, 60, 60])
+
+
+def _json_error_may_be_truncation(error: json.JSONDecodeError, buffer_length: int) -> bool:
+    # a truncated item either ends in the middle of a string or fails within a few characters of the end of the buffer
+    # (ie: 'tru', '-', '\\u00', an object missing its ',' or '}'...), other errors are in the data itself
+    return error.msg.startswith('Unterminated string') or buffer_length - error.pos <= 6
+
+
+def json_array_items_from_chunks(chunks: Iterable[Union[str, bytes]]) -> Iterator[Any]:
+    """
+    Incrementally parses a JSON array received in chunks (ie: a streamed HTTP download) and yields its items one by one
+    as soon as they are complete, so the whole raw payload never has to be held in memory.
+
+    :param chunks: pieces of the JSON text, bytes are expected to be UTF-8 encoded
+    :raises ValueError: if the data is not a valid JSON array
+    """
+    decoder = json.JSONDecoder()
+    bytes_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    # 'start' before '[', 'item_or_end' after '[', 'item' after ',', 'separator' after an item, 'end' after ']'
+    state = 'start'
+
+    def parse_buffer(final: bool) -> Iterator[Any]:
+        """
+        Yields items which are complete in the buffer. Unless final is True, it stops at data which may continue in
+        the next chunk.
+        """
+        nonlocal position, state
+        buffer_length = len(buffer)
+
+        while True:
+            while position < buffer_length and buffer[position] in ' \t\r\n':
+                position += 1
+            if position >= buffer_length:
+                return
+            character = buffer[position]
+
+            if state == 'end':
+                raise ValueError("Unexpected data after the end of the JSON array: '{}'".format(
+                    buffer[position:position + 20]))
+
+            if state == 'start':
+                if character != '[':
+                    raise ValueError("JSON data is not an array, it starts with '{}'".format(character))
+                state = 'item_or_end'
+                position += 1
+                continue
+
+            if character == ']':
+                if state == 'item':
+                    raise ValueError("Unexpected ']' after ',' in JSON array")
+                state = 'end'
+                position += 1
+                continue
+
+            if state == 'separator':
+                if character != ',':
+                    raise ValueError("Unexpected character '{}' between JSON array items".format(character))
+                state = 'item'
+                position += 1
+                continue
+
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if final or not _json_error_may_be_truncation(e, buffer_length):
+                    raise ValueError("Invalid item in JSON array: {}".format(e))
+                return  # item is incomplete, wait for more data
+
+            if not final and not isinstance(item, (dict, list, str)):
+                # a number or literal could continue in the next chunk: '1' + '2', '1.' + '5', '1e' + '3'...
+                if end >= buffer_length or re.fullmatch(r'[.eE][-+]?', buffer[end:]) is not None:
+                    return
+
+            position = end
+            state = 'separator'
+            yield item
+
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = bytes_decoder.decode(chunk)
+        buffer = buffer[position:] + chunk
+        position = 0
+        yield from parse_buffer(final=False)
+
+    buffer = buffer[position:] + bytes_decoder.decode(b'', final=True)
+    position = 0
+    yield from parse_buffer(final=True)
+
+    if state != 'end':
+        raise ValueError("JSON array is incomplete, data ended before its closing ']'")
@@ -1,6 +1,10 @@
 from .API.JsonPayloadTypes import IPListObjectJsonStructure
 from illumio_pylo import log, IP4Map
 from .Helpers import *
+from array import array
+from bisect import bisect_right
+import socket
+from typing import Tuple, Union
 
 
 class IPList(pylo.ReferenceTracker):
@@ -65,11 +69,13 @@ class IPList(pylo.ReferenceTracker):
             new_map = pylo.IP4Map()
             self._ip4map = new_map
 
+            # subtraction doesn't need a sorted map so sorting is done only once at the end
             for entry in self.raw_entries:
                 if entry[0] == '!':
                     new_map.subtract_from_text(entry[1:], ignore_ipv6=True)
                 else:
-                    new_map.add_from_text(entry, ignore_ipv6=True)
+                    new_map.add_from_text(entry, skip_recalculation=True, ignore_ipv6=True)
+            new_map.sort_and_recalculate()
 
         return self._ip4map
 
@@ -81,11 +87,66 @@ class IPList(pylo.ReferenceTracker):
 
 
 class IPListStore:
+
+    class IPIndex:
+        """
+        Sorted-boundary index of the IPv4 space covered by IPLists (exclusions taken into account): all interval
+        boundaries of all IPLists split the space into segments, each segment pointing to the (interned) tuple of
+        IPLists covering it. Finding the IPLists containing an IP is then a binary search.
+        """
+        __slots__ = ['boundaries', 'segment_iplists', 'iplists_tuples']
+
+        def __init__(self, iplists: Iterable['pylo.IPList']):
+            events: List[Tuple[int, int, int]] = []
+            iplists = list(iplists)
+            for iplist_index, iplist in enumerate(iplists):
+                for entry_start, entry_end in iplist.get_ip4map()._entries:
+                    events.append((entry_start, 1, iplist_index))
+                    events.append((entry_end + 1, -1, iplist_index))
+            events.sort()
+
+            # segment N starts at boundaries[N] and ends right before boundaries[N+1]. 64 bits are needed as the last
+            # boundary can be 2^32 (right after 255.255.255.255)
+            self.boundaries: array = array('Q')
+            self.segment_iplists: array = array('I')
+            self.iplists_tuples: List[Tuple['pylo.IPList', ...]] = [()]
+            tuple_ids: Dict[frozenset, int] = {frozenset(): 0}
+
+            active: Dict[int, int] = {}
+            event_count = len(events)
+            event_index = 0
+            while event_index < event_count:
+                position = events[event_index][0]
+                while event_index < event_count and events[event_index][0] == position:
+                    _, delta, iplist_index = events[event_index]
+                    count = active.get(iplist_index, 0) + delta
+                    if count == 0:
+                        del active[iplist_index]
+                    else:
+                        active[iplist_index] = count
+                    event_index += 1
+
+                key = frozenset(active)
+                tuple_id = tuple_ids.get(key)
+                if tuple_id is None:
+                    tuple_id = len(self.iplists_tuples)
+                    tuple_ids[key] = tuple_id
+                    self.iplists_tuples.append(tuple(iplists[i] for i in sorted(key)))
+                self.boundaries.append(position)
+                self.segment_iplists.append(tuple_id)
+
+        def lookup(self, ip: int) -> Tuple['pylo.IPList', ...]:
+            segment = bisect_right(self.boundaries, ip) - 1
+            if segment < 0:
+                return ()
+            return self.iplists_tuples[self.segment_iplists[segment]]
+
     items_by_href: Dict[str, 'pylo.IPList']
 
     def __init__(self, owner: 'pylo.Organization'):
         self.owner = owner
         self.items_by_href = {}
+        self._ip_index: Optional[IPListStore.IPIndex] = None
 
     def count(self) -> int:
         return len(self.items_by_href)
@@ -116,6 +177,49 @@ class IPListStore:
 
             log.debug("Found iplist '%s' with href '%s'", new_iplist_name, new_iplist_href)
 
+        self._ip_index = None
+
+    def get_ip_index(self) -> 'IPListStore.IPIndex':
+        if self._ip_index is None:
+            self._ip_index = IPListStore.IPIndex(self.items_by_href.values())
+        return self._ip_index
+
+    @staticmethod
+    def _ipv4_to_int(ip: str) -> Optional[int]:
+        try:
+            return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+        except OSError:
+            # IPv6 or invalid address, IPLists are only indexed for IPv4
+            return None
+
+    def find_iplists_containing_ip(self, ip: Union[str, int]) -> Tuple['pylo.IPList', ...]:
+        """
+        Find all IPLists containing an IPv4 address (exclusions are taken into account). IPv6 addresses never match.
+
+        :param ip: IP address as a string or an integer
+        """
+        if isinstance(ip, str):
+            ip = self._ipv4_to_int(ip)
+            if ip is None:
+                return ()
+        return self.get_ip_index().lookup(ip)
+
+    def find_iplists_containing_ips(self, ips: Iterable[str]) -> Dict[str, Tuple['pylo.IPList', ...]]:
+        """
+        Batch flavor of find_iplists_containing_ip(), each distinct IP is looked up only once
+
+        :return: a dict with IPs as keys and tuples of IPLists containing them as values
+        """
+        index = self.get_ip_index()
+        ipv4_to_int = self._ipv4_to_int
+        results: Dict[str, Tuple['pylo.IPList', ...]] = {}
+        for ip in ips:
+            if ip in results:
+                continue
+            ip_int = ipv4_to_int(ip)
+            results[ip] = () if ip_int is None else index.lookup(ip_int)
+        return results
+
     def find_by_href(self, href: str) -> Optional['pylo.IPList']:
         return self.items_by_href.get(href)
 
@@ -2,7 +2,9 @@ from .Exception import PyloEx
 from .Helpers.functions import is_valid_ipv6, string_list_to_text
 import ipaddress
 import copy
-from typing import Optional, List
+from array import array
+from bisect import bisect_right
+from typing import Optional, List, Iterable, Iterator, Tuple, Union, Dict
 
 
 def sort_first(val):
@@ -12,11 +14,33 @@ def sort_first(val):
 start = 0
 end = 1
 
-masks = []
-mask = 0
-for i in range(32):
-    mask |= 1 << i
-    masks.append(mask)
+# smallest array type able to hold IPv4 addresses
+uint32_typecode = 'I' if array('I').itemsize >= 4 else 'L'
+
+
+def ip4_int_to_string(ip: int) -> str:
+    return '{}.{}.{}.{}'.format(ip >> 24, (ip >> 16) & 0xFF, (ip >> 8) & 0xFF, ip & 0xFF)
+
+
+def ip4_range_to_cidr_strings(range_start: int, range_end: int, skip_netmask_for_32=False) -> List[str]:
+    """
+    Decomposes an IPv4 range into the minimal list of CIDR blocks, working on integers only: each block is the largest
+    one aligned on its start address (lowest bit set) which doesn't go past the end of the range.
+    """
+    result = []
+    while range_start <= range_end:
+        # largest block aligned on range_start, 0.0.0.0 is aligned on everything
+        block_size = range_start & -range_start if range_start != 0 else 1 << 32
+        remaining = range_end - range_start + 1
+        while block_size > remaining:
+            block_size >>= 1
+        prefix_length = 33 - block_size.bit_length()
+        if prefix_length == 32 and skip_netmask_for_32:
+            result.append(ip4_int_to_string(range_start))
+        else:
+            result.append('{}/{}'.format(ip4_int_to_string(range_start), prefix_length))
+        range_start += block_size
+    return result
 
 
 class IP4Map:
@@ -70,10 +94,24 @@ class IP4Map:
         if ignore_ipv6 and new_entry is None:
             return
 
+        self._entries.append(new_entry)
         if not skip_recalculation:
-            self._entries.append(new_entry)
             self.sort_and_recalculate()
 
+    def add_many_from_text(self, entries: Iterable[str], ignore_ipv6=True):
+        """
+        Adds many entries at once, the map is sorted and recalculated only once at the end
+        """
+        for entry in entries:
+            self.add_from_text(entry, skip_recalculation=True, ignore_ipv6=ignore_ipv6)
+        self.sort_and_recalculate()
+
+    def to_array_map(self) -> 'IP4ArrayMap':
+        builder = IP4ArrayMap.Builder()
+        for entry in self._entries:
+            builder.add_range(entry[start], entry[end])
+        return builder.build()
+
     def add_another_map(self, another_map: 'IP4Map', skip_recalculation=False):
         for entry in another_map._entries:
             self._entries.append(entry)
@@ -219,49 +257,33 @@ class IP4Map:
 
         return ranges
 
-    def to_list_of_cidr_string(self, skip_netmask_for_32=False):
-
+    def to_list_of_cidr_string(self, skip_netmask_for_32=False) -> List[str]:
         result = []
-
         for entry in self._entries:
-
-            net_start = entry[start]
-            net_end = entry[end]
-
-            previous_loop_end = net_start
-
-            while net_start <= net_end:
-
-                if net_start == net_end:
-                    if skip_netmask_for_32:
-                        result.append('{}'.format(ipaddress.IPv4Address(net_start)))
-                    else:
-                        result.append('{}'.format(ipaddress.IPv4Address(net_start), 32))
-                    break
-
-                for netmask in range(1, 32, 1):
-                    new_end = net_start | masks[netmask]
-                    # print("{}/{}/{}/{}".format(ipaddress.IPv4Address(net_start), ipaddress.IPv4Address(net_end), ipaddress.IPv4Address(new_end), 32 - netmask))
-
-                    if new_end > net_end:
-                        result.append('{}/{}'.format(ipaddress.IPv4Address(net_start), 33 - netmask))
-                        net_start = previous_loop_end + 1
-                        previous_loop_end = net_start
-                        # print("breaking loop with {}/{}".format(ipaddress.IPv4Address(net_start), ipaddress.IPv4Address(previous_loop_end)))
-                        break
-
-                    if new_end == net_end:
-                        if skip_netmask_for_32 and netmask == 0:
-                            result.append('{}'.format(ipaddress.IPv4Address(net_start)))
-                        else:
-                            result.append('{}/{}'.format(ipaddress.IPv4Address(net_start), 32 - netmask))
-                        net_start = net_end+1
-                        break
-                    else:
-                        previous_loop_end = new_end
-
+            result.extend(ip4_range_to_cidr_strings(entry[start], entry[end], skip_netmask_for_32))
         return result
 
+    @staticmethod
+    def batch_to_list_of_cidr_string(maps: Iterable[Union['IP4Map', 'IP4ArrayMap']], skip_netmask_for_32=False) -> List[List[str]]:
+        """
+        Returns the CIDR lists of many maps at once, in the same order. Ranges shared by several maps are decomposed
+        only once.
+        """
+        cidrs_by_range: Dict[Tuple[int, int], List[str]] = {}
+        results = []
+        for ip_map in maps:
+            ranges = ((entry[start], entry[end]) for entry in ip_map._entries) if isinstance(ip_map, IP4Map) \
+                else ip_map.ranges()
+            map_result = []
+            for ip_range in ranges:
+                cidrs = cidrs_by_range.get(ip_range)
+                if cidrs is None:
+                    cidrs = ip4_range_to_cidr_strings(ip_range[0], ip_range[1], skip_netmask_for_32)
+                    cidrs_by_range[ip_range] = cidrs
+                map_result.extend(cidrs)
+            results.append(map_result)
+        return results
+
     def count_ips(self) -> int:
         count = 0
         for entry in self._entries:
@@ -272,6 +294,12 @@ class IP4Map:
     def count_entries(self) -> int:
         return len(self._entries)
 
+    def ranges(self) -> Iterator[Tuple[int, int]]:
+        """
+        Yields the (first, last) IPs of each entry as integers, both inclusive
+        """
+        return ((entry[0], entry[1]) for entry in self._entries)
+
     def print_to_std(self, header=None, padding='', list_marker=' - '):
         if header is not None:
             print('{}{}({} entries)'.format(
@@ -286,6 +314,214 @@ class IP4Map:
                 print('{}{}{}-{}'.format(padding, list_marker, ipaddress.IPv4Address(entry[0]), ipaddress.IPv4Address(entry[1])))
 
 
+class IP4ArrayMap:
+    """
+    Array backed and immutable flavor of IP4Map: ranges are stored as sorted arrays of uint32 starts and ends, with
+    overlapping and adjacent ranges merged. Set operations (union, intersection, subtraction, containment) are done with
+    a single linear pass over both maps and return new maps, lookups of single IPs use a binary search.
+
+    Use IP4ArrayMap.Builder to build a map from many entries, they are sorted and merged only once.
+    """
+
+    __slots__ = ['_starts', '_ends']
+
+    class Builder:
+        """
+        Collects ranges without normalizing them, build() sorts and merges them all at once
+        """
+        __slots__ = ['_ranges']
+
+        def __init__(self):
+            self._ranges: List[Tuple[int, int]] = []
+
+        def add_range(self, range_start: int, range_end: int) -> 'IP4ArrayMap.Builder':
+            if range_start > range_end:
+                raise PyloEx("Invalid IP range with start address > end address: {}-{}".format(
+                    ipaddress.IPv4Address(range_start), ipaddress.IPv4Address(range_end)))
+            self._ranges.append((range_start, range_end))
+            return self
+
+        def add_from_text(self, entry: str, ignore_ipv6=True) -> 'IP4ArrayMap.Builder':
+            new_entry = IP4Map.ip_entry_from_text(entry, ignore_ipv6=ignore_ipv6)
+            if new_entry is not None:
+                self._ranges.append((new_entry[start], new_entry[end]))
+            return self
+
+        def add_many_from_text(self, entries: Iterable[str], ignore_ipv6=True) -> 'IP4ArrayMap.Builder':
+            for entry in entries:
+                self.add_from_text(entry, ignore_ipv6=ignore_ipv6)
+            return self
+
+        def add_map(self, another_map: Union['IP4ArrayMap', IP4Map]) -> 'IP4ArrayMap.Builder':
+            if isinstance(another_map, IP4Map):
+                self._ranges.extend((entry[start], entry[end]) for entry in another_map._entries)
+            else:
+                self._ranges.extend(zip(another_map._starts, another_map._ends))
+            return self
+
+        def count_entries(self) -> int:
+            return len(self._ranges)
+
+        def build(self) -> 'IP4ArrayMap':
+            return IP4ArrayMap._from_unsorted_ranges(self._ranges)
+
+    def __init__(self):
+        self._starts: array = array(uint32_typecode)
+        self._ends: array = array(uint32_typecode)
+
+    @staticmethod
+    def _from_unsorted_ranges(ranges: List[Tuple[int, int]]) -> 'IP4ArrayMap':
+        result = IP4ArrayMap()
+        if len(ranges) == 0:
+            return result
+
+        ranges = sorted(ranges)
+        starts = result._starts
+        ends = result._ends
+        cursor_start, cursor_end = ranges[0]
+        for range_start, range_end in ranges:
+            if range_start > cursor_end + 1:
+                starts.append(cursor_start)
+                ends.append(cursor_end)
+                cursor_start = range_start
+                cursor_end = range_end
+            elif range_end > cursor_end:
+                cursor_end = range_end
+        starts.append(cursor_start)
+        ends.append(cursor_end)
+
+        return result
+
+    @staticmethod
+    def _from_sorted_ranges(starts: Iterable[int], ends: Iterable[int]) -> 'IP4ArrayMap':
+        result = IP4ArrayMap()
+        result._starts.extend(starts)
+        result._ends.extend(ends)
+        return result
+
+    @staticmethod
+    def from_text_entries(entries: Iterable[str], ignore_ipv6=True) -> 'IP4ArrayMap':
+        return IP4ArrayMap.Builder().add_many_from_text(entries, ignore_ipv6=ignore_ipv6).build()
+
+    @staticmethod
+    def from_ip4map(ip4map: IP4Map) -> 'IP4ArrayMap':
+        return IP4ArrayMap.Builder().add_map(ip4map).build()
+
+    def to_ip4map(self) -> IP4Map:
+        result = IP4Map()
+        result._entries = [[range_start, range_end] for range_start, range_end in zip(self._starts, self._ends)]
+        return result
+
+    def ranges(self) -> Iterator[Tuple[int, int]]:
+        return zip(self._starts, self._ends)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, IP4ArrayMap):
+            return NotImplemented
+        return self._starts == other._starts and self._ends == other._ends
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def is_empty(self) -> bool:
+        return len(self._starts) == 0
+
+    def count_entries(self) -> int:
+        return len(self._starts)
+
+    def count_ips(self) -> int:
+        return sum(self._ends) - sum(self._starts) + len(self._starts)
+
+    def union(self, another_map: 'IP4ArrayMap') -> 'IP4ArrayMap':
+        return IP4ArrayMap.Builder().add_map(self).add_map(another_map).build()
+
+    def intersection(self, another_map: 'IP4ArrayMap') -> 'IP4ArrayMap':
+        a_starts, a_ends = self._starts, self._ends
+        b_starts, b_ends = another_map._starts, another_map._ends
+        new_starts = []
+        new_ends = []
+        i = j = 0
+        while i < len(a_starts) and j < len(b_starts):
+            range_start = max(a_starts[i], b_starts[j])
+            range_end = min(a_ends[i], b_ends[j])
+            if range_start <= range_end:
+                new_starts.append(range_start)
+                new_ends.append(range_end)
+            if a_ends[i] < b_ends[j]:
+                i += 1
+            else:
+                j += 1
+        return IP4ArrayMap._from_sorted_ranges(new_starts, new_ends)
+
+    def subtract(self, another_map: 'IP4ArrayMap') -> 'IP4ArrayMap':
+        b_starts, b_ends = another_map._starts, another_map._ends
+        b_count = len(b_starts)
+        new_starts = []
+        new_ends = []
+        j = 0
+        for range_start, range_end in zip(self._starts, self._ends):
+            cursor = range_start
+            while j < b_count and b_ends[j] < cursor:
+                j += 1
+            while j < b_count and b_starts[j] <= range_end:
+                if b_starts[j] > cursor:
+                    new_starts.append(cursor)
+                    new_ends.append(b_starts[j] - 1)
+                cursor = max(cursor, b_ends[j] + 1)
+                if b_ends[j] >= range_end:
+                    # this range may also overlap with the next one of self
+                    break
+                j += 1
+            if cursor <= range_end:
+                new_starts.append(cursor)
+                new_ends.append(range_end)
+        return IP4ArrayMap._from_sorted_ranges(new_starts, new_ends)
+
+    def contains(self, another_map: 'IP4ArrayMap') -> bool:
+        """
+        Returns True if all IPs of another_map are in this map. An empty map is not contained in any map, like IP4Map.
+        """
+        if len(self._starts) == 0 or len(another_map._starts) == 0:
+            return False
+        starts, ends = self._starts, self._ends
+        for range_start, range_end in zip(another_map._starts, another_map._ends):
+            index = bisect_right(starts, range_start) - 1
+            if index < 0 or ends[index] < range_end:
+                return False
+        return True
+
+    def overlaps(self, another_map: 'IP4ArrayMap') -> bool:
+        a_starts, a_ends = self._starts, self._ends
+        b_starts, b_ends = another_map._starts, another_map._ends
+        i = j = 0
+        while i < len(a_starts) and j < len(b_starts):
+            if a_starts[i] <= b_ends[j] and b_starts[j] <= a_ends[i]:
+                return True
+            if a_ends[i] < b_ends[j]:
+                i += 1
+            else:
+                j += 1
+        return False
+
+    def match_single_ip(self, ip: Union[str, int]) -> bool:
+        if isinstance(ip, str):
+            ip = int(ipaddress.IPv4Address(ip))
+        index = bisect_right(self._starts, ip) - 1
+        return index >= 0 and self._ends[index] >= ip
+
+    def to_string_list(self, separator=','):
+        return self.to_ip4map().to_string_list(separator=separator)
+
+    def to_list_of_string(self):
+        return self.to_ip4map().to_list_of_string()
+
+    def to_list_of_cidr_string(self, skip_netmask_for_32=False) -> List[str]:
+        result = []
+        for range_start, range_end in zip(self._starts, self._ends):
+            result.extend(ip4_range_to_cidr_strings(range_start, range_end, skip_netmask_for_32))
+        return result
+
+
 # test = IP4Map()
 # test.add_from_text('10.0.0.0/16')
 # test.add_from_text('10.0.0.0-10.2.50.50')
@@ -58,3 +58,4 @@ class LabelCommon:
             self.owner.owner.connector.objects_label_update(self.href, data={'value': new_name})
 
         self.name = new_name
+        self.owner.generation += 1
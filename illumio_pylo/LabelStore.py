@@ -1,3 +1,4 @@
+from array import array
 from hashlib import md5
 import random
 from typing import Set, Union
@@ -52,7 +53,139 @@ class LabelStore:
                         result.append(label)
             return result
 
-    __slots__ = ['owner', '_items_by_href', '_dimensions', '_dimensions_dict', '_label_types_cache', '_label_types_as_set_cache', 'label_resolution_cache']
+    class LabelResolutionCache:
+        """
+        Resolves label scopes (one or more labels, of any dimension) to the workloads using them. Every label gets an
+        integer ID and each workload an integer position, then:
+         - labels used by a large share of workloads get a bitset (Python int) of the workloads using them
+         - other labels get a sorted array of workload positions
+         - each dimension has a column holding the label ID of every workload, used to filter small candidate lists
+        Memory is therefore bounded by (workloads * dimensions) instead of growing with the number of label
+        combinations, and scopes are resolved on demand by bitset intersection.
+        """
+
+        # a label is stored as a bitset if it's used by more than 1/dense_label_ratio of the workloads
+        dense_label_ratio = 32
+
+        __slots__ = ['workloads', 'label_ids', 'label_counts', 'columns', 'bitsets', 'postings']
+
+        def __init__(self, label_types: List[str], workloads: Iterable['pylo.Workload']):
+            self.workloads: List['pylo.Workload'] = list(workloads)
+            self.label_ids: Dict['pylo.Label', int] = {}
+            self.label_counts: List[int] = []
+            # for each dimension, the label ID of each workload (-1 when it has no label of that dimension)
+            self.columns: Dict[str, array] = {}
+            self.bitsets: Dict[int, int] = {}
+            self.postings: Dict[int, array] = {}
+
+            workloads_count = len(self.workloads)
+            positions_by_label_id: List[List[int]] = []
+
+            for label_type in label_types:
+                self.columns[label_type] = array('i', [-1]) * workloads_count
+
+            for position, workload in enumerate(self.workloads):
+                for label in workload.get_labels():
+                    column = self.columns.get(label.type)
+                    if column is None:
+                        # label type is not a known dimension, still supported
+                        column = array('i', [-1]) * workloads_count
+                        self.columns[label.type] = column
+                    label_id = self.label_ids.get(label)
+                    if label_id is None:
+                        label_id = len(positions_by_label_id)
+                        self.label_ids[label] = label_id
+                        positions_by_label_id.append([])
+                    positions_by_label_id[label_id].append(position)
+                    column[position] = label_id
+
+            for label_id, positions in enumerate(positions_by_label_id):
+                self.label_counts.append(len(positions))
+                if len(positions) * self.dense_label_ratio > workloads_count:
+                    self.bitsets[label_id] = self._positions_to_bitset(positions, workloads_count)
+                else:
+                    self.postings[label_id] = array('I', positions)
+
+        @staticmethod
+        def _positions_to_bitset(positions: Iterable[int], size: int) -> int:
+            buffer = bytearray((size + 7) // 8)
+            for position in positions:
+                buffer[position >> 3] |= 1 << (position & 7)
+            return int.from_bytes(buffer, 'little')
+
+        @staticmethod
+        def _bitset_to_positions(bitset: int) -> List[int]:
+            positions = []
+            for byte_index, byte in enumerate(bitset.to_bytes((bitset.bit_length() + 7) // 8, 'little')):
+                if byte == 0:
+                    continue
+                base = byte_index << 3
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        positions.append(base + bit)
+            return positions
+
+        def _label_to_bitset(self, label_id: int) -> int:
+            bitset = self.bitsets.get(label_id)
+            if bitset is not None:
+                return bitset
+            return self._positions_to_bitset(self.postings[label_id], len(self.workloads))
+
+        def resolve(self, labels: Iterable[Union['pylo.Label', 'pylo.LabelGroup']]) -> List['pylo.Workload']:
+            """
+            Finds workloads matching a scope: for each dimension they must use one of the labels provided, dimensions
+            without labels are not filtered ('All'). LabelGroups are expanded.
+            """
+            label_ids_by_type: Dict[str, Set[int]] = {}
+            for label in labels:
+                if label is None:
+                    continue
+                if label.is_group():
+                    members = label.expand_nested_to_dict_by_href().values()
+                else:
+                    members = (label,)
+                ids = label_ids_by_type.setdefault(label.type, set())
+                for member in members:
+                    label_id = self.label_ids.get(member)
+                    if label_id is not None:
+                        ids.add(label_id)
+
+            if len(label_ids_by_type) == 0:
+                return list(self.workloads)
+
+            # resolve the most selective dimension first
+            selectivity = sorted(((sum(self.label_counts[label_id] for label_id in ids), label_type, ids)
+                                  for label_type, ids in label_ids_by_type.items()), key=lambda entry: entry[0])
+            smallest_count, smallest_type, smallest_ids = selectivity[0]
+            if smallest_count == 0:
+                return []
+
+            if smallest_count * self.dense_label_ratio <= len(self.workloads):
+                # few candidates: walk them and filter them by looking up the other dimensions' columns
+                positions = []
+                for label_id in smallest_ids:
+                    posting = self.postings.get(label_id)
+                    positions.extend(posting if posting is not None else
+                                     self._bitset_to_positions(self.bitsets[label_id]))
+                positions.sort()
+                for _, label_type, ids in selectivity[1:]:
+                    column = self.columns[label_type]
+                    positions = [position for position in positions if column[position] in ids]
+            else:
+                result_bitset = -1
+                for _, label_type, ids in selectivity:
+                    dimension_bitset = 0
+                    for label_id in ids:
+                        dimension_bitset |= self._label_to_bitset(label_id)
+                    result_bitset &= dimension_bitset
+                    if result_bitset == 0:
+                        return []
+                positions = self._bitset_to_positions(result_bitset)
+
+            return [self.workloads[position] for position in positions]
+
+    __slots__ = ['owner', '_items_by_href', '_dimensions', '_dimensions_dict', '_label_types_cache', '_label_types_as_set_cache', 'label_resolution_cache',
+                 'generation']
 
     def __init__(self, owner: 'pylo.Organization') -> None:
         self.owner: "pylo.Organization" = owner
@@ -62,7 +195,9 @@ class LabelStore:
         self._label_types_cache: Optional[List[str]] = None
         self._label_types_as_set_cache: Optional[Set[str]] = None
 
-        self.label_resolution_cache: Optional[Dict[str, List[pylo.Workload]]] = None
+        self.label_resolution_cache: Optional[LabelStore.LabelResolutionCache] = None
+        # bumped whenever labels are added or changed through the library, used to invalidate caches of query results
+        self.generation: int = 0
 
     @property
     def label_types(self) -> List[str]:
@@ -142,7 +277,8 @@ class LabelStore:
                 raise Exception("A Label with href '%s' already exists in the table", new_label_href)
 
             self._items_by_href[new_label_href] = new_label
-            
+            self.generation += 1
+
             log.debug("Found Label '%s' with href '%s' and type '%s'", new_label_name, new_label_href, new_label_type)
 
     def load_label_groups_from_json(self, json_list: List[LabelGroupObjectJsonStructure]):
@@ -163,6 +299,7 @@ class LabelStore:
                 raise Exception("A Label with href '%s' already exists in the table", new_label_href)
 
             self._items_by_href[new_label_href] = new_label
+            self.generation += 1
 
             new_label.raw_json = json_label
 
@@ -330,93 +467,39 @@ class LabelStore:
         pylo.log.warn("find_label_by_name_and_type is deprecated, use find_label_by_name instead")
         return self.find_label_by_name(name, label_type=label_type, case_sensitive=case_sensitive)
 
-    cache_label_all_string = '-All-'
-    cache_label_all_separator = '|'
-
     def generate_label_resolution_cache(self):
         """
-        Mostly for internal use. This method will generate a cache of all possible combinations of labels.
+        Mostly for internal use. This method will generate the cache used to resolve label scopes to workloads, see
+        LabelStore.LabelResolutionCache. It's invalidated by WorkloadStore whenever workloads are added or changed.
         """
-        self.label_resolution_cache = {}
-
-        roles = list(self.get_labels_as_dict_by_href('role').keys())
-        roles.append(self.cache_label_all_string)
-        for role in roles:
-            apps = list(self.get_labels_as_dict_by_href('app').keys())
-            apps.append(self.cache_label_all_string)
-            for app in apps:
-                envs = list(self.get_labels_as_dict_by_href('env').keys())
-                envs.append(self.cache_label_all_string)
-                for env in envs:
-                    locs = list(self.get_labels_as_dict_by_href('loc').keys())
-                    locs.append(self.cache_label_all_string)
-                    for loc in locs:
-                        group_name = role + LabelStore.cache_label_all_separator + app + LabelStore.cache_label_all_separator + env + LabelStore.cache_label_all_separator + loc
-                        self.label_resolution_cache[group_name] = []
-
-        all_string_and_sep = LabelStore.cache_label_all_string + LabelStore.cache_label_all_separator
-
-        masks = []
-        for i in range(2**4):
-            binary = bin(i)[2:].zfill(4)
-            mask = [bool(bit) for bit in binary]
-            masks.append(mask)
-
-        for workload in self.owner.WorkloadStore.itemsByHRef.values():
-            if workload.deleted:
-                continue
-
-            already_processed = {}
-
-            for mask in masks:
-                if workload.role_label is not None and mask[0]:
-                    group_name = workload.role_label.name + LabelStore.cache_label_all_separator
-                else:
-                    group_name = all_string_and_sep
-                if workload.app_label is not None and mask[1]:
-                    group_name += workload.app_label.name + LabelStore.cache_label_all_separator
-                else:
-                    group_name += all_string_and_sep
-                if workload.env_label is not None and mask[2]:
-                    group_name += workload.env_label.name + LabelStore.cache_label_all_separator
-                else:
-                    group_name += all_string_and_sep
-                if workload.loc_label is not None and mask[3]:
-                    group_name += workload.loc_label.name
-                else:
-                    group_name += LabelStore.cache_label_all_string
-
-                if group_name not in already_processed:
-                    self.label_resolution_cache[group_name].append(workload)
-                already_processed[group_name] = True
+        self.label_resolution_cache = LabelStore.LabelResolutionCache(
+            self.label_types,
+            (workload for workload in self.owner.WorkloadStore.itemsByHRef.values() if not workload.deleted))
+
+    def get_workloads_by_label_scope(self, role: Optional['pylo.Label'] = None, app: Optional['pylo.Label'] = None,
+                                     env: Optional['pylo.Label'] = None, loc: Optional['pylo.Label'] = None,
+                                     other_labels: Optional[Iterable[Union['pylo.Label', 'pylo.LabelGroup']]] = None) \
+            -> List['pylo.Workload']:
+        """
+        Find all (non-deleted) workloads matching a scope. None means 'All' for that dimension. Labels of other
+        dimensions can be provided with other_labels.
+        """
+        labels = [role, app, env, loc]
+        if other_labels is not None:
+            labels.extend(other_labels)
+        return self.get_workloads_matching_label_scope(labels)
 
-    def get_workloads_by_label_scope(self, role: 'pylo.Label', app: 'pylo.Label', env: 'pylo.Label', loc: 'pylo.Label'):
+    def get_workloads_matching_label_scope(self, labels: Iterable[Optional[Union['pylo.Label', 'pylo.LabelGroup']]]) \
+            -> List['pylo.Workload']:
+        """
+        Find all (non-deleted) workloads matching a scope made of labels of any dimension: workloads must use one of the
+        labels provided for each dimension, dimensions without labels are not filtered. LabelGroups are expanded and
+        None values ignored.
+        """
         if self.label_resolution_cache is None:
             self.generate_label_resolution_cache()
 
-        if role is None:
-            role = LabelStore.cache_label_all_string
-        else:
-            role = role.name
-
-        if app is None:
-            app = LabelStore.cache_label_all_string
-        else:
-            app = app.name
-
-        if env is None:
-            env = LabelStore.cache_label_all_string
-        else:
-            env = env.name
-
-        if loc is None:
-            loc = LabelStore.cache_label_all_string
-        else:
-            loc = loc.name
-
-        group_name = role + LabelStore.cache_label_all_separator + app + LabelStore.cache_label_all_separator + env + LabelStore.cache_label_all_separator + loc
-
-        return self.label_resolution_cache[group_name]
+        return self.label_resolution_cache.resolve(labels)
 
     def create_label(self, name: str, label_type: str) -> 'pylo.Label':
         """Create a label *locally* (not on the server). Mostly for internal use.
@@ -432,6 +515,7 @@ class LabelStore:
             raise Exception("A Label with href '%s' already exists in the table", new_label_href)
 
         self._items_by_href[new_label_href] = new_label
+        self.generation += 1
 
         return new_label
 
@@ -452,6 +536,7 @@ class LabelStore:
             raise Exception("A Label with href '%s' already exists in the table", new_label_href)
 
         self._items_by_href[new_label_href] = new_label
+        self.generation += 1
 
         return new_label
 
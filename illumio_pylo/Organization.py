@@ -1,6 +1,6 @@
-from typing import Optional, List, Callable
-import json
+from typing import Optional, List, Callable, Dict
 import os
+import datetime
 import getpass
 import illumio_pylo as pylo
 from .API.JsonPayloadTypes import PCEObjectsJsonStructure, PCECacheFileJsonStructure
@@ -9,47 +9,151 @@ from .API.CredentialsManager import get_credentials_from_file
 
 class Organization:
 
-    __slots__ = ['id', 'connector', 'LabelStore', 'IPListStore', 'WorkloadStore', 'VirtualServiceStore', 'AgentStore',
-                 'ServiceStore', 'RulesetStore', 'SecurityPrincipalStore', 'pce_version']
+    __slots__ = ['id', 'connector', '_label_store', '_iplist_store', '_workload_store', '_virtual_service_store',
+                 '_agent_store', '_service_store', '_ruleset_store', '_security_principal_store', 'pce_version',
+                 '_lazy_json_by_type']
+
+    # order in which object types are loaded, objects may only reference types which come before them
+    objects_types_loading_order: List['pylo.ObjectTypes'] = ['labels', 'labelgroups', 'iplists', 'services', 'workloads',
+                                                             'virtual_services', 'security_principals', 'rulesets']
 
     def __init__(self, org_id):
         self.id: int = org_id
         self.connector: Optional['pylo.APIConnector'] = None
-        self.LabelStore: 'pylo.LabelStore' = pylo.LabelStore(self)
-        self.IPListStore: 'pylo.IPListStore' = pylo.IPListStore(self)
-        self.WorkloadStore: 'pylo.WorkloadStore' = pylo.WorkloadStore(self)
-        self.VirtualServiceStore: 'pylo.VirtualServiceStore' = pylo.VirtualServiceStore(self)
-        self.AgentStore: 'pylo.AgentStore' = pylo.AgentStore(self)
-        self.ServiceStore: 'pylo.ServiceStore' = pylo.ServiceStore(self)
-        self.RulesetStore: 'pylo.RulesetStore' = pylo.RulesetStore(self)
-        self.SecurityPrincipalStore: 'pylo.SecurityPrincipalStore' = pylo.SecurityPrincipalStore(self)
+        self._label_store: 'pylo.LabelStore' = pylo.LabelStore(self)
+        self._iplist_store: 'pylo.IPListStore' = pylo.IPListStore(self)
+        self._workload_store: 'pylo.WorkloadStore' = pylo.WorkloadStore(self)
+        self._virtual_service_store: 'pylo.VirtualServiceStore' = pylo.VirtualServiceStore(self)
+        self._agent_store: 'pylo.AgentStore' = pylo.AgentStore(self)
+        self._service_store: 'pylo.ServiceStore' = pylo.ServiceStore(self)
+        self._ruleset_store: 'pylo.RulesetStore' = pylo.RulesetStore(self)
+        self._security_principal_store: 'pylo.SecurityPrincipalStore' = pylo.SecurityPrincipalStore(self)
         self.pce_version: Optional['pylo.SoftwareVersion'] = None
+        # JSON data of object types which are loaded on first access of their store (see load_from_json(lazy=True))
+        self._lazy_json_by_type: Dict[str, List] = {}
+
+    @property
+    def LabelStore(self) -> 'pylo.LabelStore':
+        if self._lazy_json_by_type:
+            self._load_lazy_objects('labels', 'labelgroups')
+        return self._label_store
+
+    @property
+    def IPListStore(self) -> 'pylo.IPListStore':
+        if self._lazy_json_by_type:
+            self._load_lazy_objects('iplists')
+        return self._iplist_store
+
+    @property
+    def WorkloadStore(self) -> 'pylo.WorkloadStore':
+        if self._lazy_json_by_type:
+            self._load_lazy_objects('workloads')
+        return self._workload_store
+
+    @property
+    def VirtualServiceStore(self) -> 'pylo.VirtualServiceStore':
+        if self._lazy_json_by_type:
+            self._load_lazy_objects('virtual_services')
+        return self._virtual_service_store
+
+    @property
+    def AgentStore(self) -> 'pylo.AgentStore':
+        # agents are created while loading workloads
+        if self._lazy_json_by_type:
+            self._load_lazy_objects('workloads')
+        return self._agent_store
+
+    @property
+    def ServiceStore(self) -> 'pylo.ServiceStore':
+        if self._lazy_json_by_type:
+            self._load_lazy_objects('services')
+        return self._service_store
+
+    @property
+    def RulesetStore(self) -> 'pylo.RulesetStore':
+        if self._lazy_json_by_type:
+            self._load_lazy_objects('rulesets')
+        return self._ruleset_store
+
+    @property
+    def SecurityPrincipalStore(self) -> 'pylo.SecurityPrincipalStore':
+        if self._lazy_json_by_type:
+            self._load_lazy_objects('security_principals')
+        return self._security_principal_store
+
+    def _load_lazy_objects(self, *object_types: 'pylo.ObjectTypes'):
+        for object_type in object_types:
+            # popped first so stores accessed while loading (to resolve references) won't try to load it again
+            json_data = self._lazy_json_by_type.pop(object_type, None)
+            if json_data is None:
+                continue
+            pylo.log.debug("Lazy loading of '{}' objects".format(object_type))
+            self._load_objects_from_json(object_type, json_data)
+
+    def _load_objects_from_json(self, object_type: 'pylo.ObjectTypes', json_data):
+        if object_type == 'labels':
+            self._label_store.load_labels_from_json(json_data)
+        elif object_type == 'labelgroups':
+            self._label_store.load_label_groups_from_json(json_data)
+        elif object_type == 'iplists':
+            self._iplist_store.load_iplists_from_json(json_data)
+        elif object_type == 'services':
+            self._service_store.load_services_from_json(json_data)
+        elif object_type == 'workloads':
+            self._workload_store.load_workloads_from_json(json_data)
+        elif object_type == 'virtual_services':
+            self._virtual_service_store.load_virtualservices_from_json(json_data)
+        elif object_type == 'security_principals':
+            self._security_principal_store.load_principals_from_json(json_data)
+        elif object_type == 'rulesets':
+            self._ruleset_store.load_rulesets_from_json(json_data)
+        else:
+            raise pylo.PyloEx("Unsupported object type '{}'".format(object_type))
 
-    def load_from_cached_file(self, fqdn: str, no_exception_if_file_does_not_exist=False) -> bool:
-        # filename should be like 'cache_xxx.yyy.zzz.json'
-        filename = 'cache_' + fqdn + '.json'
+    def load_all_lazy_objects(self):
+        """
+        Loads all object types which are still pending from a lazy load_from_json(). References between objects
+        (ie: workloads used in rules) are only complete once this is done.
+        """
+        self._load_lazy_objects(*self.objects_types_loading_order)
 
-        if os.path.isfile(filename):
-            # now we try to open that JSON file
-            with open(filename) as json_file:
-                data: PCECacheFileJsonStructure = json.load(json_file)
-                if 'pce_version' not in data:
-                    raise pylo.PyloEx("Cannot find PCE version in cache file")
-                self.pce_version = pylo.SoftwareVersion(data['pce_version'])
-                if 'data' not in data:
-                    raise pylo.PyloEx("Cache file '%s' was found and successfully loaded but no 'data' object could be found" % filename)
-                self.load_from_json(data['data'])
-                return True
+    def is_lazy_loading_pending(self, object_type: 'pylo.ObjectTypes') -> bool:
+        return object_type in self._lazy_json_by_type
+
+    def load_from_cached_file(self, fqdn: str, no_exception_if_file_does_not_exist=False,
+                              list_of_objects_to_load: Optional[List['pylo.ObjectTypes']] = None,
+                              lazy: bool = False) -> bool:
+        """
+        Load the organization from a cache file generated by 'pce-objects-cache-updater'. Both binary and JSON
+        formats are supported, the most recent one is used if both exist.
+        :param fqdn:
+        :param no_exception_if_file_does_not_exist:
+        :param list_of_objects_to_load: only these object types will be loaded (binary cache skips other sections entirely)
+        :param lazy: see load_from_json()
+        :return:
+        """
+        filename = pylo.PceCacheFile.find_most_recent_file(fqdn)
+
+        if filename is not None:
+            data: PCECacheFileJsonStructure = pylo.PceCacheFile.read(filename, list_of_objects_to_load=list_of_objects_to_load)
+            if 'pce_version' not in data:
+                raise pylo.PyloEx("Cannot find PCE version in cache file")
+            self.pce_version = pylo.SoftwareVersion(data['pce_version'])
+            if 'data' not in data:
+                raise pylo.PyloEx("Cache file '%s' was found and successfully loaded but no 'data' object could be found" % filename)
+            self.load_from_json(data['data'], list_of_objects_to_load=list_of_objects_to_load, lazy=lazy)
+            return True
 
         if no_exception_if_file_does_not_exist:
             return False
 
-        raise pylo.PyloEx("Cache file '%s' was not found!" % filename)
+        raise pylo.PyloEx("Cache file '%s' was not found!" % pylo.PceCacheFile.get_filename(fqdn))
 
     @staticmethod
-    def get_from_cache_file(fqdn: str) -> 'pylo.Organization':
+    def get_from_cache_file(fqdn: str, list_of_objects_to_load: Optional[List['pylo.ObjectTypes']] = None,
+                            lazy: bool = False) -> 'pylo.Organization':
         org = pylo.Organization(1)
-        org.load_from_cached_file(fqdn)
+        org.load_from_cached_file(fqdn, list_of_objects_to_load=list_of_objects_to_load, lazy=lazy)
         return org
 
     @staticmethod
@@ -122,10 +226,16 @@ class Organization:
                            list_of_objects_to_load=list_of_objects_to_load)
 
     def load_from_json(self, data: PCEObjectsJsonStructure,
-                       list_of_objects_to_load: Optional[List['pylo.ObjectTypes']] = None)\
+                       list_of_objects_to_load: Optional[List['pylo.ObjectTypes']] = None,
+                       lazy: bool = False)\
             -> None:
         """
         Load the organization from a JSON structure, mostly for developers use only
+
+        :param data:
+        :param list_of_objects_to_load:
+        :param lazy: if True, objects of each type are only built the first time their store is accessed. Until all
+            stores have been accessed (or load_all_lazy_objects() is called), references between objects are incomplete
         """
         object_to_load = {}
         if list_of_objects_to_load is not None:
@@ -145,59 +255,33 @@ class Organization:
 
         self.LabelStore.load_label_dimensions(data.get('label_dimensions'))
 
-        if 'labels' in object_to_load:
-            if 'labels' not in data:
-                raise Exception("'labels' was not found in json data")
-            self.LabelStore.load_labels_from_json(data['labels'])
-
-        if 'labelgroups' in object_to_load:
-            if 'labelgroups' not in data:
-                raise Exception("'labelgroups' was not found in json data")
-            self.LabelStore.load_label_groups_from_json(data['labelgroups'])
-
-        if 'iplists' in object_to_load:
-            if 'iplists' not in data:
-                raise Exception("'iplists' was not found in json data")
-            self.IPListStore.load_iplists_from_json(data['iplists'])
-
-        if 'services' in object_to_load:
-            if 'services' not in data:
-                raise Exception("'services' was not found in json data")
-            self.ServiceStore.load_services_from_json(data['services'])
-
-        if 'workloads' in object_to_load:
-            if 'workloads' not in data:
-                raise Exception("'workloads' was not found in json data")
-            self.WorkloadStore.load_workloads_from_json(data['workloads'])
-
-        if 'virtual_services' in object_to_load:
-            if 'virtual_services' not in data:
-                raise Exception("'virtual_services' was not found in json data")
-            self.VirtualServiceStore.load_virtualservices_from_json(data['virtual_services'])
-
-        if 'security_principals' in object_to_load:
-            if 'security_principals' not in data:
-                raise Exception("'security_principals' was not found in json data")
-            self.SecurityPrincipalStore.load_principals_from_json(data['security_principals'])
-
-        if 'rulesets' in object_to_load:
-            if 'rulesets' not in data:
-                raise Exception("'rulesets' was not found in json data")
-            self.RulesetStore.load_rulesets_from_json(data['rulesets'])
+        for object_type in self.objects_types_loading_order:
+            if object_type not in object_to_load:
+                continue
+            if object_type not in data:
+                raise Exception("'{}' was not found in json data".format(object_type))
+            if lazy:
+                self._lazy_json_by_type[object_type] = data[object_type]
+            else:
+                self._load_objects_from_json(object_type, data[object_type])
 
     def load_from_api(self, con: pylo.APIConnector, include_deleted_workloads=False,
-                      list_of_objects_to_load: Optional[List['pylo.ObjectTypes']] = None):
+                      list_of_objects_to_load: Optional[List['pylo.ObjectTypes']] = None,
+                      stream_workloads=False):
         """
         Load the organization from the API with the API Connector provided. Mostly intended for developers use only
         :param con:
         :param include_deleted_workloads:
         :param list_of_objects_to_load:
+        :param stream_workloads: workloads are loaded one by one while they are downloaded, which keeps memory usage low on large PCEs
         :return:
         """
         self.pce_version = con.get_software_version()
         self.connector = con
         return self.load_from_json(self.get_config_from_api(con, include_deleted_workloads=include_deleted_workloads,
-                                                            list_of_objects_to_load=list_of_objects_to_load))
+                                                            list_of_objects_to_load=list_of_objects_to_load,
+                                                            stream_workloads=stream_workloads),
+                                   list_of_objects_to_load=list_of_objects_to_load)
 
     @staticmethod
     def create_fake_empty_config() -> PCEObjectsJsonStructure:
@@ -211,17 +295,48 @@ class Organization:
         return data
 
     def get_config_from_api(self, con: pylo.APIConnector, include_deleted_workloads=False,
-                            list_of_objects_to_load: Optional[List[str]] = None) -> PCEObjectsJsonStructure:
+                            list_of_objects_to_load: Optional[List[str]] = None,
+                            stream_workloads=False) -> PCEObjectsJsonStructure:
         """
         Get the config/objects from the API using the API connector provided
         :param con:
         :param include_deleted_workloads:
         :param list_of_objects_to_load:
+        :param stream_workloads: see APIConnector.get_pce_objects()
         :return:
         """
         self.connector = con
         return con.get_pce_objects(include_deleted_workloads=include_deleted_workloads,
-                                   list_of_objects_to_load=list_of_objects_to_load)
+                                   list_of_objects_to_load=list_of_objects_to_load,
+                                   stream_workloads=stream_workloads)
+
+    @staticmethod
+    def get_config_delta_from_api(con: pylo.APIConnector, previous_cache: PCECacheFileJsonStructure,
+                                  include_deleted_workloads=False, force_async_mode=False,
+                                  safety_margin_seconds: int = 3600) -> PCEObjectsJsonStructure:
+        """
+        Get the config/objects from the API by only downloading objects which changed since a cache file was generated
+        (see APIConnector.get_pce_objects_delta()). Everything is downloaded again if the PCE version has changed.
+        :param con:
+        :param previous_cache: content of a cache file generated by 'pce-objects-cache-updater'
+        :param include_deleted_workloads:
+        :param force_async_mode:
+        :param safety_margin_seconds: changes are looked up from that many seconds before the cache generation date,
+            to cover changes which happened while the cache was being downloaded
+        :return:
+        """
+        if previous_cache.get('pce_version') != con.get_software_version_string() \
+                or previous_cache.get('generation_date') is None:
+            pylo.log.info("PCE version has changed since cache was generated, all objects will be downloaded again")
+            return con.get_pce_objects(include_deleted_workloads=include_deleted_workloads, force_async_mode=force_async_mode)
+
+        since = datetime.datetime.fromisoformat(previous_cache['generation_date'])
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        since -= datetime.timedelta(seconds=safety_margin_seconds)
+
+        return con.get_pce_objects_delta(previous_cache['data'], since, include_deleted_workloads=include_deleted_workloads,
+                                         force_async_mode=force_async_mode)
 
     def stats_to_str(self, padding='') -> str:
         """ Dumps basic stats about the organization
@@ -246,17 +361,30 @@ class Organization:
                    self.LabelStore.count_labels(),
                    labels_str)
 
-        stats += os.linesep + "{}- Workloads: Managed: {} / Unmanaged: {} / Deleted: {}". \
-            format(padding,
-                   self.WorkloadStore.count_managed_workloads(),
-                   self.WorkloadStore.count_unmanaged_workloads(True),
-                   self.WorkloadStore.count_deleted_workloads())
-
-        stats += os.linesep + "{}- {} IPlists in total.". \
-            format(padding,
-                   self.IPListStore.count())
+        # stats must not trigger the loading of lazy stores, raw JSON is used for them instead
+        if self.is_lazy_loading_pending('workloads'):
+            stats += os.linesep + "{}- {} Workloads (not loaded yet)". \
+                format(padding, len(self._lazy_json_by_type['workloads']))
+        else:
+            stats += os.linesep + "{}- Workloads: Managed: {} / Unmanaged: {} / Deleted: {}". \
+                format(padding,
+                       self.WorkloadStore.count_managed_workloads(),
+                       self.WorkloadStore.count_unmanaged_workloads(True),
+                       self.WorkloadStore.count_deleted_workloads())
+
+        if self.is_lazy_loading_pending('iplists'):
+            stats += os.linesep + "{}- {} IPlists in total (not loaded yet).". \
+                format(padding, len(self._lazy_json_by_type['iplists']))
+        else:
+            stats += os.linesep + "{}- {} IPlists in total.". \
+                format(padding,
+                       self.IPListStore.count())
 
-        stats += os.linesep + "{}- {} RuleSets and {} Rules.". \
-            format(padding, self.RulesetStore.count_rulesets(), self.RulesetStore.count_rules())
+        if self.is_lazy_loading_pending('rulesets'):
+            stats += os.linesep + "{}- {} RuleSets (not loaded yet).". \
+                format(padding, len(self._lazy_json_by_type['rulesets']))
+        else:
+            stats += os.linesep + "{}- {} RuleSets and {} Rules.". \
+                format(padding, self.RulesetStore.count_rulesets(), self.RulesetStore.count_rules())
 
         return stats
@@ -0,0 +1,150 @@
+import gc
+import json
+import marshal
+import os
+import struct
+import zlib
+from typing import Optional, List, Dict, Literal
+
+import illumio_pylo as pylo
+from .API.JsonPayloadTypes import PCECacheFileJsonStructure, PCEObjectsJsonStructure
+
+CacheFileFormat = Literal['json', 'binary']
+
+
+class PceCacheFile:
+    """
+    Reads and writes PCE objects cache files. Two formats are supported:
+     - json: the whole cache is a single JSON document
+     - binary: a header followed by one compressed section per object type. It's a lot faster to load, and only the
+       sections needed by a command have to be decoded.
+
+    Binary layout: magic bytes | header size (uint32 LE) | header (JSON) | sections.
+    The header holds the schema version, marshal version, pce_version, generation_date and, for each object type,
+    the offset (from the end of the header), size and objects count of its section.
+    """
+
+    binary_magic = b'PYLOCACHE'
+    binary_schema_version = 1
+    binary_compression_level = 3
+
+    @staticmethod
+    def get_filename(name: str, file_format: CacheFileFormat = 'json') -> str:
+        # filename should be like 'cache_xxx.yyy.zzz.json' or 'cache_xxx.yyy.zzz.bin'
+        if file_format == 'binary':
+            return 'cache_' + name + '.bin'
+        return 'cache_' + name + '.json'
+
+    @staticmethod
+    def find_most_recent_file(name: str) -> Optional[str]:
+        """
+        Looks for an existing cache file for this PCE, the most recent one is returned if both formats exist
+        """
+        candidates = []
+        for file_format in ('binary', 'json'):
+            filename = PceCacheFile.get_filename(name, file_format)
+            if os.path.isfile(filename):
+                candidates.append((os.path.getmtime(filename), filename))
+
+        if len(candidates) == 0:
+            return None
+
+        return max(candidates)[1]
+
+    @staticmethod
+    def is_binary_file(filename: str) -> bool:
+        with open(filename, 'rb') as f:
+            return f.read(len(PceCacheFile.binary_magic)) == PceCacheFile.binary_magic
+
+    @staticmethod
+    def write(filename: str, content: PCECacheFileJsonStructure, file_format: CacheFileFormat = 'json'):
+        if file_format == 'binary':
+            PceCacheFile.write_binary(filename, content)
+        elif file_format == 'json':
+            with open(filename, 'w') as outfile:
+                json.dump(content, outfile)
+        else:
+            raise pylo.PyloEx("Unsupported cache file format '{}'".format(file_format))
+
+    @staticmethod
+    def read(filename: str, list_of_objects_to_load: Optional[List['pylo.ObjectTypes']] = None) -> PCECacheFileJsonStructure:
+        """
+        Reads a cache file of any format. For binary files, only sections listed in list_of_objects_to_load (and label
+        dimensions which are always needed) are decoded, others are returned as empty lists.
+        """
+        if PceCacheFile.is_binary_file(filename):
+            return PceCacheFile.read_binary(filename, list_of_objects_to_load)
+
+        with open(filename) as json_file:
+            return json.load(json_file)
+
+    @staticmethod
+    def write_binary(filename: str, content: PCECacheFileJsonStructure):
+        if 'data' not in content:
+            raise pylo.PyloEx("Cache content has no 'data' object")
+
+        sections: Dict[str, bytes] = {}
+        header = {'schema_version': PceCacheFile.binary_schema_version,
+                  'marshal_version': marshal.version,
+                  'pce_version': content.get('pce_version'),
+                  'generation_date': content.get('generation_date'),
+                  'sections': {}}
+
+        offset = 0
+        for object_type, objects in content['data'].items():
+            # marshal is used instead of JSON/pickle because it's the fastest to decode for plain dict/list/str/int
+            section = zlib.compress(marshal.dumps(objects), PceCacheFile.binary_compression_level)
+            sections[object_type] = section
+            header['sections'][object_type] = {'offset': offset, 'size': len(section), 'count': len(objects)}
+            offset += len(section)
+
+        header_bytes = json.dumps(header).encode('utf-8')
+
+        with open(filename, 'wb') as f:
+            f.write(PceCacheFile.binary_magic)
+            f.write(struct.pack('<I', len(header_bytes)))
+            f.write(header_bytes)
+            for section in sections.values():
+                f.write(section)
+
+    @staticmethod
+    def read_binary_header(f) -> Dict:
+        if f.read(len(PceCacheFile.binary_magic)) != PceCacheFile.binary_magic:
+            raise pylo.PyloEx("File '{}' is not a binary PCE cache file".format(f.name))
+
+        header_size = struct.unpack('<I', f.read(4))[0]
+        header = json.loads(f.read(header_size).decode('utf-8'))
+
+        if header.get('schema_version') != PceCacheFile.binary_schema_version:
+            raise pylo.PyloEx("Cache file '{}' uses schema version {} while version {} is expected, please regenerate it".
+                              format(f.name, header.get('schema_version'), PceCacheFile.binary_schema_version))
+        if header.get('marshal_version', 0) > marshal.version:
+            raise pylo.PyloEx("Cache file '{}' was generated by a more recent Python version, please regenerate it".
+                              format(f.name))
+
+        return header
+
+    @staticmethod
+    def read_binary(filename: str, list_of_objects_to_load: Optional[List['pylo.ObjectTypes']] = None) -> PCECacheFileJsonStructure:
+        with open(filename, 'rb') as f:
+            header = PceCacheFile.read_binary_header(f)
+            sections_start = f.tell()
+
+            data: PCEObjectsJsonStructure = pylo.Organization.create_fake_empty_config()
+            # decoding creates millions of small containers which would trigger the garbage collector over and over
+            gc_was_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                for object_type, section in header['sections'].items():
+                    if list_of_objects_to_load is not None and object_type not in list_of_objects_to_load \
+                            and object_type != 'label_dimensions':
+                        continue
+                    f.seek(sections_start + section['offset'])
+                    data[object_type] = marshal.loads(zlib.decompress(f.read(section['size'])))
+            finally:
+                if gc_was_enabled:
+                    gc.enable()
+
+        return {'pce_version': header['pce_version'],
+                'generation_date': header['generation_date'],
+                'data': data}
@@ -0,0 +1,259 @@
+from typing import Optional, List, Dict, Set, Union, Literal, Iterable, Tuple
+
+import illumio_pylo as pylo
+
+
+PolicyEvaluatorEndpoint = Union['pylo.Workload', str]  # a Workload or an IP address
+
+
+class PolicyEvaluator:
+    """
+    Computes draft policy decisions locally from the Rulesets, Labels, IPLists and Services loaded in an Organization.
+    It's an offline replacement for the rule_coverage API calls made by RuleCoverageQueryManager: flows are evaluated
+    in bulk without any round-trip to the PCE.
+
+    Allow rules are compiled once for each of their ruleset's scopes and indexed by provider (Label, Workload or
+    IPList), so only a handful of candidate rules are checked for each flow. Matching follows rule_coverage semantics
+    with labels resolved as workloads:
+     - labels of the same type are OR'ed while labels of different types are AND'ed
+     - intra-scope rules apply scope labels to both consumers and providers, extra-scope rules only to providers
+     - workloads only match Labels, Workloads and 'All Workloads' actors while IP addresses only match IPLists
+
+    Boundaries (deny rules), virtual services and security principals are not part of the Organization model so they
+    are not evaluated: decisions are either 'allowed' or 'blocked'.
+    """
+
+    class ActorsMatcher:
+        """
+        Consumers or providers of a rule, with scope labels applied
+        """
+
+        __slots__ = ['labels_by_type', 'workloads', 'iplists']
+
+        def __init__(self):
+            # None means Labels and 'All Workloads' cannot match, an empty dict means any workload matches
+            self.labels_by_type: Optional[Dict[str, Set['pylo.Label']]] = None
+            self.workloads: Set['pylo.Workload'] = set()
+            self.iplists: Set['pylo.IPList'] = set()
+
+        def matches_workload(self, workload: 'pylo.Workload') -> bool:
+            if workload in self.workloads:
+                return True
+            if self.labels_by_type is None:
+                return False
+            for label_type, labels in self.labels_by_type.items():
+                if workload.get_label(label_type) not in labels:
+                    return False
+            return True
+
+        def matches_iplists(self, iplists: Iterable['pylo.IPList']) -> bool:
+            for iplist in iplists:
+                if iplist in self.iplists:
+                    return True
+            return False
+
+    class CompiledRule:
+
+        __slots__ = ['rule', 'consumers', 'providers', 'port_map']
+
+        def __init__(self, rule: 'pylo.Rule', consumers: 'PolicyEvaluator.ActorsMatcher',
+                     providers: 'PolicyEvaluator.ActorsMatcher'):
+            self.rule = rule
+            self.consumers = consumers
+            self.providers = providers
+            self.port_map: 'pylo.PortMap' = rule.services.get_port_map()
+
+    class Result:
+
+        __slots__ = ['decision', 'rules']
+
+        def __init__(self, rules: List['pylo.Rule']):
+            self.rules: List['pylo.Rule'] = rules
+            self.decision: Literal['allowed', 'blocked'] = 'allowed' if len(rules) > 0 else 'blocked'
+
+        def is_allowed(self) -> bool:
+            return self.decision == 'allowed'
+
+        def get_rules_href(self) -> List[str]:
+            return [rule.href for rule in self.rules]
+
+    def __init__(self, org: 'pylo.Organization'):
+        self.org = org
+        self._rules: List['PolicyEvaluator.CompiledRule'] = []
+        self._rules_any_provider_workload: List['PolicyEvaluator.CompiledRule'] = []
+        self._rules_by_provider_label: Dict['pylo.Label', List['PolicyEvaluator.CompiledRule']] = {}
+        self._rules_by_provider_workload: Dict['pylo.Workload', List['PolicyEvaluator.CompiledRule']] = {}
+        self._rules_by_provider_iplist: Dict['pylo.IPList', List['PolicyEvaluator.CompiledRule']] = {}
+
+        # flows are often repeated with the same endpoints so matching rules are cached per pair of endpoints
+        self._rules_by_endpoints_cache: Dict[Tuple, List['PolicyEvaluator.CompiledRule']] = {}
+        self._iplists_by_ip_cache: Dict[str, Tuple['pylo.IPList', ...]] = {}
+
+        for ruleset in org.RulesetStore.rulesets:
+            if ruleset.disabled:
+                continue
+            scopes = [PolicyEvaluator._expand_labels(scope_entry.labels) for scope_entry in ruleset.scopes.scope_entries]
+            if len(scopes) == 0:
+                scopes = [{}]
+            for rule in ruleset.rules:
+                if not rule.enabled:
+                    continue
+                for scope_labels in scopes:
+                    self._add_rule(rule, scope_labels)
+
+    @staticmethod
+    def _expand_labels(labels: Iterable[Union['pylo.Label', 'pylo.LabelGroup']]) -> Dict[str, Set['pylo.Label']]:
+        result: Dict[str, Set['pylo.Label']] = {}
+        for label in labels:
+            members = label.expand_nested_to_array() if label.is_group() else [label]
+            result.setdefault(label.type, set()).update(members)
+        return result
+
+    @staticmethod
+    def _create_actors_matcher(container: 'pylo.RuleHostContainer',
+                               scope_labels: Optional[Dict[str, Set['pylo.Label']]]) -> 'PolicyEvaluator.ActorsMatcher':
+        matcher = PolicyEvaluator.ActorsMatcher()
+        matcher.workloads.update(container.get_workloads())
+        matcher.iplists.update(container.get_iplists())
+
+        if container.contains_all_workloads():
+            labels_by_type = {}
+        elif container.has_labels():
+            labels_by_type = PolicyEvaluator._expand_labels(container.get_labels())
+        else:
+            return matcher
+
+        if scope_labels is not None:
+            for label_type, labels in scope_labels.items():
+                if label_type in labels_by_type:
+                    labels_by_type[label_type] = labels_by_type[label_type] & labels
+                else:
+                    labels_by_type[label_type] = labels
+
+        for labels in labels_by_type.values():
+            if len(labels) == 0:
+                return matcher
+
+        matcher.labels_by_type = labels_by_type
+        return matcher
+
+    def _add_rule(self, rule: 'pylo.Rule', scope_labels: Dict[str, Set['pylo.Label']]):
+        consumers = self._create_actors_matcher(rule.consumers, None if rule.is_extra_scope() else scope_labels)
+        providers = self._create_actors_matcher(rule.providers, scope_labels)
+        compiled_rule = PolicyEvaluator.CompiledRule(rule, consumers, providers)
+        self._rules.append(compiled_rule)
+
+        if providers.labels_by_type is not None:
+            if len(providers.labels_by_type) == 0:
+                self._rules_any_provider_workload.append(compiled_rule)
+            else:
+                # the most selective label type is enough to find candidates, matches_workload() checks the others
+                index_labels = min(providers.labels_by_type.values(), key=len)
+                for label in index_labels:
+                    self._rules_by_provider_label.setdefault(label, []).append(compiled_rule)
+        for workload in providers.workloads:
+            self._rules_by_provider_workload.setdefault(workload, []).append(compiled_rule)
+        for iplist in providers.iplists:
+            self._rules_by_provider_iplist.setdefault(iplist, []).append(compiled_rule)
+
+    def count_compiled_rules(self) -> int:
+        return len(self._rules)
+
+    def _get_iplists_for_ip(self, ip: str) -> Tuple['pylo.IPList', ...]:
+        iplists = self._iplists_by_ip_cache.get(ip)
+        if iplists is None:
+            iplists = self.org.IPListStore.find_iplists_containing_ip(ip)
+            self._iplists_by_ip_cache[ip] = iplists
+        return iplists
+
+    def _get_rules_for_endpoints(self, source: PolicyEvaluatorEndpoint,
+                                 destination: PolicyEvaluatorEndpoint) -> List['PolicyEvaluator.CompiledRule']:
+        cache_key = (source, destination)
+        rules = self._rules_by_endpoints_cache.get(cache_key)
+        if rules is not None:
+            return rules
+
+        candidates: Dict[int, PolicyEvaluator.CompiledRule] = {}
+        if isinstance(destination, str):
+            for iplist in self._get_iplists_for_ip(destination):
+                for compiled_rule in self._rules_by_provider_iplist.get(iplist, ()):
+                    candidates[id(compiled_rule)] = compiled_rule
+        else:
+            for compiled_rule in self._rules_any_provider_workload:
+                candidates[id(compiled_rule)] = compiled_rule
+            for compiled_rule in self._rules_by_provider_workload.get(destination, ()):
+                candidates[id(compiled_rule)] = compiled_rule
+            for label in destination.get_labels():
+                for compiled_rule in self._rules_by_provider_label.get(label, ()):
+                    candidates[id(compiled_rule)] = compiled_rule
+
+        source_iplists = self._get_iplists_for_ip(source) if isinstance(source, str) else None
+
+        rules = []
+        for compiled_rule in candidates.values():
+            if source_iplists is None:
+                if not compiled_rule.consumers.matches_workload(source):
+                    continue
+            elif not compiled_rule.consumers.matches_iplists(source_iplists):
+                continue
+            if not isinstance(destination, str) and not compiled_rule.providers.matches_workload(destination):
+                continue
+            rules.append(compiled_rule)
+
+        self._rules_by_endpoints_cache[cache_key] = rules
+        return rules
+
+    def evaluate(self, source: PolicyEvaluatorEndpoint, destination: PolicyEvaluatorEndpoint, protocol: int,
+                 port: Optional[int] = None) -> 'PolicyEvaluator.Result':
+        """
+        Computes the draft policy decision for a single flow
+
+        :param source: a Workload or an IP address
+        :param destination: a Workload or an IP address
+        :param protocol: IP protocol number (6 for TCP, 17 for UDP ...)
+        :param port: destination port for TCP and UDP
+        """
+        rules = []
+        seen_rules: Set['pylo.Rule'] = set()
+        for compiled_rule in self._get_rules_for_endpoints(source, destination):
+            if compiled_rule.rule in seen_rules or not compiled_rule.port_map.matches(protocol, port):
+                continue
+            seen_rules.add(compiled_rule.rule)
+            rules.append(compiled_rule.rule)
+
+        return PolicyEvaluator.Result(rules)
+
+    def evaluate_explorer_results(self, records: Iterable[Union['pylo.API.Explorer.ExplorerResult', 'pylo.ExplorerResultV2']],
+                                  set_draft_mode_policy_decision: bool = True) -> List['PolicyEvaluator.Result']:
+        """
+        Computes draft policy decisions for Explorer records in bulk, identical flows are only evaluated once
+
+        :param records: records from ExplorerResultSetV1 or ExplorerResultSetV2
+        :param set_draft_mode_policy_decision: if True, the decision is also stored in each record
+        :return: results in the same order as records
+        """
+        workload_store = self.org.WorkloadStore
+        results_cache: Dict[Tuple, PolicyEvaluator.Result] = {}
+        results: List[PolicyEvaluator.Result] = []
+
+        for record in records:
+            if record.source_workload_href is not None:
+                source = workload_store.find_by_href_or_create_tmp(record.source_workload_href, '*DELETED*')
+            else:
+                source = record.source_ip
+            if record.destination_workload_href is not None:
+                destination = workload_store.find_by_href_or_create_tmp(record.destination_workload_href, '*DELETED*')
+            else:
+                destination = record.destination_ip
+
+            cache_key = (source, destination, record.service_protocol, record.service_port)
+            result = results_cache.get(cache_key)
+            if result is None:
+                result = self.evaluate(source, destination, record.service_protocol, record.service_port)
+                results_cache[cache_key] = result
+
+            if set_draft_mode_policy_decision:
+                record.set_draft_mode_policy_decision(result.decision)
+            results.append(result)
+
+        return results
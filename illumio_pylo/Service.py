@@ -1,3 +1,5 @@
+from bisect import bisect_right
+
 import illumio_pylo as pylo
 from .API.JsonPayloadTypes import ServiceHrefRef
 from illumio_pylo import log
@@ -70,6 +72,27 @@ class PortMap:
 
         return result
 
+    def matches(self, protocol: int, port: Optional[int] = None) -> bool:
+        """
+        Check if a protocol/port is covered by this map. Protocol -1 (All Services) covers everything. TCP and UDP
+        lookups rely on merge_overlapping_maps() having been called after the last addition.
+        """
+        if -1 in self._protocol_map:
+            return True
+
+        if protocol == 6:
+            port_ranges = self._tcp_map
+        elif protocol == 17:
+            port_ranges = self._udp_map
+        else:
+            return protocol in self._protocol_map
+
+        if port is None:
+            return False
+
+        index = bisect_right(port_ranges, [port, 65536])
+        return index > 0 and port_ranges[index - 1][1] >= port
+
     def merge_overlapping_maps(self):
         self._sort_maps()
 
@@ -82,7 +105,8 @@ class PortMap:
                     continue
 
                 if entry[0] <= current[1] + 1:
-                    current[1] = entry[1]
+                    if entry[1] > current[1]:
+                        current[1] = entry[1]
                 else:
                     new_list.append(current)
                     current = entry
@@ -190,10 +190,7 @@ class Workload(pylo.ReferenceTracker, pylo.Referencer, LabeledObject):
         Calculate and return a map of all IP4 covered by the Workload interfaces
         """
         result = IP4Map()
-
-        for interface in self.interfaces:
-            if interface.ip is not None:
-                result.add_from_text(interface.ip)
+        result.add_many_from_text(interface.ip for interface in self.interfaces if interface.ip is not None)
 
         return result
 
@@ -220,6 +217,7 @@ class Workload(pylo.ReferenceTracker, pylo.Referencer, LabeledObject):
 
         self.raw_json.update(data)
         self.description = new_description
+        self.owner._workload_updated(self)
 
     def api_update_hostname(self, new_hostname: str):
         if new_hostname is None or len(new_hostname) == 0:
@@ -236,7 +234,9 @@ class Workload(pylo.ReferenceTracker, pylo.Referencer, LabeledObject):
             self._batch_update_stack.add_payload(data)
 
         self.raw_json.update(data)
+        self.owner._unindex_workload(self)
         self.hostname = new_hostname
+        self.owner._index_workload(self)
 
     def api_update_forced_name(self, name: str):
         if name is None or len(name) == 0:
@@ -253,7 +253,9 @@ class Workload(pylo.ReferenceTracker, pylo.Referencer, LabeledObject):
             self._batch_update_stack.add_payload(data)
 
         self.raw_json.update(data)
+        self.owner._unindex_workload(self)
         self.forced_name = name
+        self.owner._index_workload(self)
 
     def api_update_labels(self, list_of_labels: Optional[List[Label]] = None, missing_label_type_means_no_change=False):
         """
@@ -453,7 +455,9 @@ class Workload(pylo.ReferenceTracker, pylo.Referencer, LabeledObject):
         if original_label_set == new_labels_set:
             return False
 
+        self.owner._unindex_workload(self)
         self._labels = dict_for_replacement
+        self.owner._index_workload(self)
 
         return True
 
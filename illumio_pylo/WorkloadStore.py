@@ -3,19 +3,46 @@ from dataclasses import dataclass
 from illumio_pylo import log, IP4Map, PyloEx, Workload, nice_json, Label, LabelGroup
 from .Helpers import *
 from .Organization import Organization
-from typing import Optional, List, Union, Set, Iterable
+from typing import Optional, List, Union, Set, Iterable, Literal, Tuple
+from collections import OrderedDict
+import bisect
+import ipaddress
 
 from .WorkloadStoreSubClasses import UnmanagedWorkloadDraft, UnmanagedWorkloadDraftMultiCreatorManager
-from .FilterQuery import FilterQuery, get_workload_filter_registry
+from .FilterQuery import FilterQuery, ColumnarTable, get_workload_filter_registry
+
+
+NameIndexSource = Literal['forced_name', 'hostname', 'hostname_or_forced_name']
 
 
 class WorkloadStore:
 
-    __slots__ = ['owner', 'itemsByHRef']
+    __slots__ = ['owner', 'itemsByHRef', '_name_indexes', '_ip_index', '_ip_sorted_index', '_label_index',
+                 '_flag_index', 'generation', '_query_results_cache', '_positions']
 
     def __init__(self, owner: 'Organization'):
         self.owner: Organization = owner
         self.itemsByHRef: Dict[str, Workload] = {}
+        # indexes of workloads by normalized name, keyed by (source, case_sensitive, strip_fqdn). They are built on first
+        # lookup and then kept in sync by _index_workload() and _unindex_workload()
+        self._name_indexes: Dict[tuple, Dict[str, List[Workload]]] = {}
+        # index of workloads by interface IP address, built on first lookup
+        self._ip_index: Optional[Dict[str, List[Workload]]] = None
+        # interface IP addresses as sorted integers (with matching workloads) by IP version, for range lookups
+        self._ip_sorted_index: Optional[Dict[int, Tuple[List[int], List[Workload]]]] = None
+        # posting lists of workloads (by href) for each Label, built on first lookup
+        self._label_index: Optional[Dict[Label, Dict[str, Workload]]] = None
+        # workloads (by id(), as used by FilterQuery planner) for each value of boolean flags (managed, unmanaged,
+        # deleted), built on first lookup
+        self._flag_index: Optional[Dict[Tuple[str, bool], Dict[int, Workload]]] = None
+        # bumped whenever workloads are added or changed through the library, used to invalidate caches
+        self.generation: int = 0
+        # results of find_workloads_matching_query(use_cache=True) by (query, include_deleted), with the generations
+        # of workloads and labels they were computed at
+        self._query_results_cache: OrderedDict[Tuple[str, bool], Tuple[Tuple[int, int], List[Workload]]] = OrderedDict()
+        # position of each workload (by href) in itemsByHRef, so results found through indexes can be returned in the
+        # same order as a full scan. Rebuilt on first use after workloads were added
+        self._positions: Dict[str, int] = {}
 
     def load_workloads_from_json(self, json_list):
         for json_item in json_list:
@@ -43,9 +70,177 @@ class WorkloadStore:
             raise PyloEx("A Workload with href '%s' already exists in the table", new_item_href)
 
         self.itemsByHRef[new_item_href] = new_item
+        self._index_workload(new_item)
 
         return new_item
 
+    def _index_workload(self, workload: Workload):
+        """
+        Adds a Workload to all indexes built so far. Must be called when a Workload is added to the store or after one
+        of its indexed properties was changed.
+        """
+        self.generation += 1
+
+        for (source, case_sensitive, strip_fqdn), index in self._name_indexes.items():
+            key = self._name_index_key(workload, source, case_sensitive, strip_fqdn)
+            if key is not None:
+                index.setdefault(key, []).append(workload)
+
+        if self._ip_index is not None:
+            for ip in self._workload_ips(workload):
+                workloads = self._ip_index.setdefault(ip, [])
+                if workload not in workloads:
+                    workloads.append(workload)
+        # sorted index is cheaper to rebuild on next range lookup than to keep sorted here
+        self._ip_sorted_index = None
+
+        if self._label_index is not None:
+            for label in workload.get_labels():
+                self._label_index.setdefault(label, {})[workload.href] = workload
+
+        if self._flag_index is not None:
+            for flag_and_value in self._workload_flags(workload):
+                self._flag_index[flag_and_value][id(workload)] = workload
+
+        self._invalidate_label_resolution_cache()
+
+    def _unindex_workload(self, workload: Workload):
+        """
+        Removes a Workload from all indexes built so far. Must be called before one of its indexed properties is changed.
+        """
+        self.generation += 1
+
+        for (source, case_sensitive, strip_fqdn), index in self._name_indexes.items():
+            key = self._name_index_key(workload, source, case_sensitive, strip_fqdn)
+            if key is None:
+                continue
+            workloads = index.get(key)
+            if workloads is not None and workload in workloads:
+                workloads.remove(workload)
+                if len(workloads) == 0:
+                    del index[key]
+
+        if self._ip_index is not None:
+            for ip in self._workload_ips(workload):
+                workloads = self._ip_index.get(ip)
+                if workloads is not None and workload in workloads:
+                    workloads.remove(workload)
+                    if len(workloads) == 0:
+                        del self._ip_index[ip]
+        self._ip_sorted_index = None
+
+        if self._label_index is not None:
+            for label in workload.get_labels():
+                workloads = self._label_index.get(label)
+                if workloads is not None:
+                    workloads.pop(workload.href, None)
+
+        if self._flag_index is not None:
+            for flag_and_value in self._workload_flags(workload):
+                self._flag_index[flag_and_value].pop(id(workload), None)
+
+        self._invalidate_label_resolution_cache()
+
+    def _workload_updated(self, workload: Workload):
+        """
+        Must be called after a property of a Workload which is not indexed (ie: description) was changed, so cached
+        query results are invalidated.
+        """
+        self.generation += 1
+
+    def _invalidate_label_resolution_cache(self):
+        label_store = self.owner.LabelStore
+        if label_store.label_resolution_cache is not None:
+            label_store.label_resolution_cache = None
+
+    @staticmethod
+    def _workload_ips(workload: Workload) -> Set[str]:
+        return {interface.ip for interface in workload.interfaces if interface.ip is not None}
+
+    def _get_ip_index(self) -> Dict[str, List[Workload]]:
+        if self._ip_index is None:
+            index: Dict[str, List[Workload]] = {}
+            for workload in self.itemsByHRef.values():
+                for ip in self._workload_ips(workload):
+                    index.setdefault(ip, []).append(workload)
+            self._ip_index = index
+        return self._ip_index
+
+    def _get_label_index(self) -> Dict[Label, Dict[str, Workload]]:
+        if self._label_index is None:
+            index: Dict[Label, Dict[str, Workload]] = {}
+            for href, workload in self.itemsByHRef.items():
+                for label in workload.get_labels():
+                    index.setdefault(label, {})[href] = workload
+            self._label_index = index
+        return self._label_index
+
+    @staticmethod
+    def _workload_flags(workload: Workload) -> Tuple[Tuple[str, bool], ...]:
+        return ('managed', not workload.unmanaged), ('unmanaged', workload.unmanaged), ('deleted', workload.deleted)
+
+    def _get_flag_index(self) -> Dict[Tuple[str, bool], Dict[int, Workload]]:
+        if self._flag_index is None:
+            index: Dict[Tuple[str, bool], Dict[int, Workload]] = {}
+            for flag in ('managed', 'unmanaged', 'deleted'):
+                index[(flag, True)] = {}
+                index[(flag, False)] = {}
+            for workload in self.itemsByHRef.values():
+                for flag_and_value in self._workload_flags(workload):
+                    index[flag_and_value][id(workload)] = workload
+            self._flag_index = index
+        return self._flag_index
+
+    def _get_ip_sorted_index(self) -> Dict[int, Tuple[List[int], List[Workload]]]:
+        if self._ip_sorted_index is None:
+            entries_by_version: Dict[int, List[Tuple[int, Workload]]] = {4: [], 6: []}
+            for ip, workloads in self._get_ip_index().items():
+                try:
+                    ip_object = ipaddress.ip_address(ip)
+                except ValueError:
+                    log.warning("Workload(s) {} have an invalid IP address '{}' which cannot be indexed".format(
+                        string_list_to_text([w.get_name() for w in workloads]), ip))
+                    continue
+                ip_int = int(ip_object)
+                entries = entries_by_version[ip_object.version]
+                for workload in workloads:
+                    entries.append((ip_int, workload))
+
+            self._ip_sorted_index = {}
+            for version, entries in entries_by_version.items():
+                entries.sort(key=lambda entry: entry[0])
+                self._ip_sorted_index[version] = ([entry[0] for entry in entries], [entry[1] for entry in entries])
+
+        return self._ip_sorted_index
+
+    @staticmethod
+    def _name_index_key(workload: Workload, source: NameIndexSource, case_sensitive: bool, strip_fqdn: bool) -> Optional[str]:
+        if source == 'forced_name':
+            name = workload.forced_name
+        else:
+            name = workload.hostname
+            if name is None and source == 'hostname_or_forced_name':
+                name = workload.forced_name
+        if name is None:
+            return None
+        if strip_fqdn:
+            name = Workload.static_name_stripped_fqdn(name)
+        if not case_sensitive:
+            name = name.lower()
+        return name
+
+    def _get_name_index(self, source: NameIndexSource, case_sensitive: bool, strip_fqdn: bool) -> Dict[str, List[Workload]]:
+        index_id = (source, case_sensitive, strip_fqdn)
+        index = self._name_indexes.get(index_id)
+        if index is None:
+            index = {}
+            for workload in self.itemsByHRef.values():
+                key = self._name_index_key(workload, source, case_sensitive, strip_fqdn)
+                if key is not None:
+                    index.setdefault(key, []).append(workload)
+            self._name_indexes[index_id] = index
+        return index
+
 
     def find_by_href_or_die(self, href: str) -> 'Workload':
         """
@@ -78,23 +273,27 @@ class WorkloadStore:
         new_tmp_item.temporary = True
 
         self.itemsByHRef[href] = new_tmp_item
+        self._index_workload(new_tmp_item)
 
         return new_tmp_item
 
-    def find_workloads_matching_label(self, label: 'Label') -> Dict[str, 'Workload']:
+    def find_workloads_matching_label(self, label: Union['Label', 'LabelGroup']) -> Dict[str, 'Workload']:
         """
-        Find all Workloads which are using a specific Label.
+        Find all Workloads which are using a specific Label. If a LabelGroup is provided, Workloads using any of its
+        (nested) members are returned.
 
         :param label: Label you want to match on
         :return: a dictionary of all matching Workloads using their HREF as key
         """
-        result = {}
+        index = self._get_label_index()
 
-        for href, workload in self.itemsByHRef.items():
-            if workload.is_using_label(label):
-                result[href] = workload
+        if isinstance(label, LabelGroup):
+            result = {}
+            for member in label.expand_nested_to_dict_by_href().values():
+                result.update(index.get(member, {}))
+            return result
 
-        return result
+        return dict(index.get(label, {}))
 
     def find_workloads_matching_all_labels(self, labels: Union[Iterable[Label|LabelGroup], Dict[str,Label|LabelGroup]])\
             -> Dict[str, 'Workload']:
@@ -106,7 +305,7 @@ class WorkloadStore:
         :param labels: list of Labels you want to match on
         :return: a dictionary of all matching Workloads using their HREF as key
         """
-        unique_labels: Set[Union[Label, LabelGroup]] = set()
+        unique_labels: Set[Label] = set()
 
         if isinstance(labels, dict):
             for label in labels.values():
@@ -127,11 +326,22 @@ class WorkloadStore:
                 else:
                     unique_labels.add(label)
 
-        result = {}
+        if len(unique_labels) == 0:
+            return dict(self.itemsByHRef)
+
+        index = self._get_label_index()
 
-        for workload in self.itemsByHRef.values():
-            if workload.uses_all_labels(unique_labels):
-                result[workload.href] = workload
+        # union of posting lists within each label type, then intersection across types, smallest first
+        candidates_by_type: Dict[str, Dict[str, Workload]] = {}
+        for label in unique_labels:
+            candidates_by_type.setdefault(label.type, {}).update(index.get(label, {}))
+
+        candidates_list = sorted(candidates_by_type.values(), key=len)
+        result = candidates_list[0]
+        for candidates in candidates_list[1:]:
+            if len(result) == 0:
+                break
+            result = {href: workload for href, workload in result.items() if href in candidates}
 
         return result
 
@@ -148,18 +358,11 @@ class WorkloadStore:
         if not case_sensitive:
             name = name.lower()
 
-        for workload in self.itemsByHRef.values():
-            wkl_name = workload.forced_name
-            if strip_fqdn:
-                wkl_name = Workload.static_name_stripped_fqdn(wkl_name)
-            if case_sensitive:
-                if wkl_name == name:
-                    return workload
-            else:
-                if wkl_name.lower() == name:
-                    return workload
+        workloads = self._get_name_index('forced_name', case_sensitive, strip_fqdn).get(name)
+        if workloads is None:
+            return None
 
-        return None
+        return workloads[0]
 
     def find_workload_matching_hostname(self, name: str, case_sensitive: bool = True, strip_fqdn: bool = False, fall_back_to_name: bool = False) -> Optional[Workload]:
         """
@@ -171,28 +374,11 @@ class WorkloadStore:
         :param fall_back_to_name: if True, will fall back to the forced name if no hostname is found
         :return: the Workload it found, None otherwise
         """
-        if not case_sensitive:
-            name = name.lower()
-
-        for workload in self.itemsByHRef.values():
-            wkl_name = workload.hostname
-            if wkl_name is None:
-                if fall_back_to_name:
-                    wkl_name = workload.forced_name
-                    if wkl_name is None:
-                        continue
-                else:
-                    continue
-            if strip_fqdn:
-                wkl_name = Workload.static_name_stripped_fqdn(wkl_name)
-            if case_sensitive:
-                if wkl_name == name:
-                    return workload
-            else:
-                if wkl_name.lower() == name:
-                    return workload
+        workloads = self.find_all_workloads_matching_hostname(name, case_sensitive, strip_fqdn, fall_back_to_name)
+        if len(workloads) == 0:
+            return None
 
-        return None
+        return workloads[0]
 
     def find_all_workloads_matching_hostname(self, name: str, case_sensitive: bool = True, strip_fqdn: bool = False, fall_back_to_name: bool = False) -> List[Workload]:
         """
@@ -203,30 +389,72 @@ class WorkloadStore:
         :param fall_back_to_name: if True, will fall back to the forced name if no hostname is found
         :return: list of matching Workloads
         """
-        result = []
-
         if not case_sensitive:
             name = name.lower()
 
-        for workload in self.itemsByHRef.values():
-            wkl_name = workload.hostname
-            if wkl_name is None:
-                if fall_back_to_name:
-                    wkl_name = workload.forced_name
-                    if wkl_name is None:
-                        continue
-                else:
-                    continue
-            if strip_fqdn:
-                wkl_name = Workload.static_name_stripped_fqdn(wkl_name)
-            if case_sensitive:
-                if wkl_name == name:
-                    result.append(workload)
+        source = 'hostname_or_forced_name' if fall_back_to_name else 'hostname'
+        workloads = self._get_name_index(source, case_sensitive, strip_fqdn).get(name)
+        if workloads is None:
+            return []
+
+        return list(workloads)
+
+    def find_workloads_matching_ip(self, ip: str) -> List[Workload]:
+        """
+        Find all Workloads which have an interface with this exact IP address
+        :param ip: the IP address you are looking for
+        :return: list of matching Workloads
+        """
+        workloads = self._get_ip_index().get(ip)
+        if workloads is None:
+            return []
+        return list(workloads)
+
+    def find_workloads_matching_ips(self, ips: Iterable[str]) -> Dict[str, List[Workload]]:
+        """
+        Batch version of find_workloads_matching_ip(), meant to resolve large numbers of IPs (ie: from traffic flows)
+        :param ips: the IP addresses you are looking for
+        :return: a dict of matching Workloads lists by IP, IPs with no match are not included
+        """
+        index = self._get_ip_index()
+        results: Dict[str, List[Workload]] = {}
+        for ip in ips:
+            workloads = index.get(ip)
+            if workloads is not None:
+                results[ip] = list(workloads)
+        return results
+
+    def find_workloads_in_ip_range(self, ip_range: str) -> Dict[str, Workload]:
+        """
+        Find all Workloads which have at least one interface IP address within a range.
+        :param ip_range: a CIDR (ie: 10.0.0.0/8), a range (ie: 10.0.0.10-10.0.0.20) or a single IP address
+        :return: a dictionary of all matching Workloads using their HREF as key
+        """
+        ip_range = ip_range.strip()
+        try:
+            if '-' in ip_range:
+                start_text, end_text = ip_range.split('-', 1)
+                start = ipaddress.ip_address(start_text.strip())
+                end = ipaddress.ip_address(end_text.strip())
+                if start.version != end.version:
+                    raise PyloEx("IP range '{}' mixes IPv4 and IPv6 addresses".format(ip_range))
+                version, start, end = start.version, int(start), int(end)
+            elif '/' in ip_range:
+                network = ipaddress.ip_network(ip_range, strict=False)
+                version, start, end = network.version, int(network.network_address), int(network.broadcast_address)
             else:
-                if wkl_name.lower() == name:
-                    result.append(workload)
+                address = ipaddress.ip_address(ip_range)
+                version, start, end = address.version, int(address), int(address)
+        except ValueError as e:
+            raise PyloEx("Invalid IP range '{}': {}".format(ip_range, e))
 
-        return result
+        ints, workloads = self._get_ip_sorted_index()[version]
+        results: Dict[str, Workload] = {}
+        for position in range(bisect.bisect_left(ints, start), bisect.bisect_right(ints, end)):
+            workload = workloads[position]
+            results[workload.href] = workload
+
+        return results
 
     def count_workloads(self) -> int:
         return len(self.itemsByHRef)
@@ -298,7 +526,10 @@ class WorkloadStore:
     def new_unmanaged_workload_multi_creator_manager(self) -> UnmanagedWorkloadDraftMultiCreatorManager:
         return UnmanagedWorkloadDraftMultiCreatorManager(self)
 
-    def find_workloads_matching_query(self, query: str, include_deleted: bool = False) -> List['Workload']:
+    # number of results kept by find_workloads_matching_query(use_cache=True)
+    query_results_cache_size = 64
+
+    def find_workloads_matching_query(self, query: str, include_deleted: bool = False, use_cache: bool = False) -> List['Workload']:
         """
         Find all workloads matching a filter query expression.
 
@@ -328,21 +559,78 @@ class WorkloadStore:
 
         :param query: filter query expression
         :param include_deleted: whether to include deleted workloads in the search
+        :param use_cache: reuse results of a previous identical query if no workloads nor labels were added or changed
+            through the library since then. Changes made by other means (ie: reference_count after rulesets were
+            modified) are not detected.
         :return: list of matching Workload objects
         """
+        if use_cache:
+            cache_key = (query, include_deleted)
+            generations = (self.generation, self.owner.LabelStore.generation)
+            cached = self._query_results_cache.get(cache_key)
+            if cached is not None and cached[0] == generations:
+                self._query_results_cache.move_to_end(cache_key)
+                return list(cached[1])
+
+            results = self.find_workloads_matching_query(query, include_deleted)
+            self._query_results_cache[cache_key] = (generations, results)
+            self._query_results_cache.move_to_end(cache_key)
+            if len(self._query_results_cache) > self.query_results_cache_size:
+                self._query_results_cache.popitem(last=False)
+            return list(results)
+
         # Pass owner (Organization) to get registry with all configured label types
         registry = get_workload_filter_registry(self.owner)
-        filter_query = FilterQuery(registry)
+        filter_query = FilterQuery(registry).parse(query)
+        predicate = filter_query.compile()
+
+        # conditions served by indexes (labels, names, IPs, flags...) narrow down the workloads to evaluate
+        candidates = filter_query.plan(self)
+        if candidates is None:
+            candidates = self.itemsByHRef.values()
+        else:
+            # indexes return workloads in no particular order, results must follow the store's order like a full scan
+            candidates = [w for w in candidates if self.itemsByHRef.get(w.href) is w]
+            positions = self._get_positions()
+            candidates.sort(key=lambda w: positions[w.href])
+
+        if include_deleted:
+            return [w for w in candidates if predicate(w)]
+        return [w for w in candidates if not w.deleted and predicate(w)]
+
+    def _get_positions(self) -> Dict[str, int]:
+        # workloads are never removed from the store so its size tells whether some were added since the last build
+        if len(self._positions) != len(self.itemsByHRef):
+            self._positions = {href: position for position, href in enumerate(self.itemsByHRef)}
+        return self._positions
 
-        # Get workloads to filter
+    def get_columnar_snapshot(self, include_deleted: bool = False, preload_fields: Optional[Iterable[str]] = None)\
+            -> ColumnarTable['Workload']:
+        """
+        Export workloads as a column oriented table (label names, timestamps, flags, versions... interned per column)
+        for analytic queries, see FilterQuery.execute_columnar() and find_workloads_matching_query_columnar().
+
+        :param include_deleted: whether to include deleted workloads in the snapshot
+        :param preload_fields: filter fields to build columns for now, others are built on first use
+        """
+        registry = get_workload_filter_registry(self.owner)
         if include_deleted:
-            workloads = list(self.itemsByHRef.values())
+            workloads = self.itemsByHRef.values()
         else:
-            workloads = [w for w in self.itemsByHRef.values() if not w.deleted]
+            workloads = (w for w in self.itemsByHRef.values() if not w.deleted)
+        return ColumnarTable(registry, workloads, preload_fields=preload_fields)
 
-        return filter_query.execute(query, workloads)
+    def find_workloads_matching_query_columnar(self, query: str, snapshot: ColumnarTable['Workload']) -> List['Workload']:
+        """
+        Find all workloads of a columnar snapshot matching a filter query expression. Conditions are evaluated once
+        per distinct value of a field and combined as bitmasks, which is faster than find_workloads_matching_query()
+        for non-selective queries or when the same snapshot is queried many times.
+
+        See find_workloads_matching_query() for query syntax and available fields.
+        """
+        return FilterQuery(snapshot.registry).execute_columnar(query, snapshot)
 
-    def find_workloads_matching_query_as_dict(self, query: str, include_deleted: bool = False) -> Dict[str, 'Workload']:
+    def find_workloads_matching_query_as_dict(self, query: str, include_deleted: bool = False, use_cache: bool = False) -> Dict[str, 'Workload']:
         """
         Find all workloads matching a filter query expression, returned as a dict with HREF as key.
 
@@ -350,9 +638,10 @@ class WorkloadStore:
 
         :param query: filter query expression
         :param include_deleted: whether to include deleted workloads in the search
+        :param use_cache: see find_workloads_matching_query()
         :return: dict of matching Workload objects with HREF as key
         """
-        matching = self.find_workloads_matching_query(query, include_deleted)
+        matching = self.find_workloads_matching_query(query, include_deleted, use_cache)
         return {w.href: w for w in matching}
 
 
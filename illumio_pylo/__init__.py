@@ -5,11 +5,14 @@ from typing import Callable
 from .tmp import *
 from .Helpers import *
 
-from .Exception import PyloEx, PyloApiEx, PyloApiTooManyRequestsEx, PyloApiUnexpectedSyntax, PyloObjectNotFound, PyloApiRequestForbiddenEx
+from .Exception import PyloEx, PyloApiEx, PyloApiTooManyRequestsEx, PyloApiUnexpectedSyntax, PyloObjectNotFound, PyloApiRequestForbiddenEx, \
+    PyloApiObjectNotFoundEx
 from .SoftwareVersion import SoftwareVersion
-from .IPMap import IP4Map
+from .IPMap import IP4Map, IP4ArrayMap
 from .ReferenceTracker import ReferenceTracker, Referencer, Pathable
 from .API.APIConnector import APIConnector, ObjectTypes
+from .API.AsyncAPIConnector import AsyncAPIConnector
+from .API.RateLimiter import APIRateLimiter
 from .API.RuleSearchQuery import RuleSearchQuery, RuleSearchQueryResolvedResultSet
 from .API.ClusterHealth import ClusterHealth
 from .API.Explorer import (ExplorerResultSetV1, ExplorerResultSetV2, RuleCoverageQueryManager, ExplorerFilterSetV1,
@@ -33,8 +36,10 @@ from .Ruleset import Ruleset, RulesetScope, RulesetScopeEntry
 from .RulesetStore import RulesetStore
 from .SecurityPrincipal import SecurityPrincipal, SecurityPrincipalStore
 from .Organization import Organization
+from .PolicyEvaluator import PolicyEvaluator
+from .PceCacheFile import PceCacheFile
 from .FilterQuery import (
-    FilterQuery, FilterRegistry, FilterField, ValueType,
+    FilterQuery, FilterRegistry, FilterField, ValueType, ColumnarTable,
     WorkloadFilterRegistry, get_workload_filter_registry,
     QueryLexer, QueryParser, QueryNode, AndNode, OrNode, NotNode, ConditionNode
 )
@@ -103,7 +103,8 @@ def run(forced_command_name: Optional[str] = None):
             raise pylo.PyloEx("The --pce argument is required for this command")
         if settings_use_cache:
             print(" * Loading objects from cached PCE '{}' data... ".format(credential_profile_name), end="", flush=True)
-            org = pylo.Organization.get_from_cache_file(credential_profile_name)
+            org = pylo.Organization.get_from_cache_file(credential_profile_name, list_of_objects_to_load=selected_command.load_specific_objects_only,
+                                                        lazy=selected_command.lazy_pce_config_loading)
             print("OK! (execution time: {:.2f} seconds)".format(time.perf_counter() - timer_start))
             connector = pylo.APIConnector.create_from_credentials_in_file(credential_profile_name, request_if_missing=False)
             if connector is not None:
@@ -124,7 +125,8 @@ def run(forced_command_name: Optional[str] = None):
             if not selected_command.skip_pce_config_loading:
                 print(" * Loading objects from PCE '{}' via API... ".format(credential_profile_name), end="", flush=True)
                 org.pce_version = connector.get_software_version()
-                org.load_from_json(config_data, list_of_objects_to_load=selected_command.load_specific_objects_only)
+                org.load_from_json(config_data, list_of_objects_to_load=selected_command.load_specific_objects_only,
+                                   lazy=selected_command.lazy_pce_config_loading)
                 print("OK! (execution time: {:.2f} seconds)".format(time.perf_counter() - timer_download_finished))
 
         print()
@@ -5,7 +5,8 @@ class Command:
     def __init__(self, name: str, main_func, parser_func, load_specific_objects_only: Optional[List[str]] = None,
                  skip_pce_config_loading: bool = False,
                  native_parsers_as_class: Optional = None,
-                 credentials_manager_mode: bool = False):
+                 credentials_manager_mode: bool = False,
+                 lazy_pce_config_loading: bool = False):
         self.name: str = name
         self.main = main_func
         self.fill_parser = parser_func
@@ -13,6 +14,9 @@ class Command:
         self.skip_pce_config_loading = skip_pce_config_loading
         self.native_parsers = native_parsers_as_class
         self.credentials_manager_mode = credentials_manager_mode
+        # stores are only built when the command accesses them, commands relying on references between objects
+        # (ie: workloads used in rules) must not use it
+        self.lazy_pce_config_loading = lazy_pce_config_loading
         available_commands[name] = self
 
 
@@ -1,6 +1,6 @@
 import argparse
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Set, Tuple
 
 import illumio_pylo as pylo
 from . import Command
@@ -27,26 +27,25 @@ def __main(args, org: pylo.Organization, **kwargs):
     csv_report: pylo.ArrayToExport = pylo.ArrayToExport(csv_report_headers)
 
     # <editor-fold desc="Building Workloads ip4 Cache">
-    workloads_ip4maps_cache: Dict[pylo.Workload, pylo.IP4Map] = {}
     print(" * Building Workloads IP4 mapping... ", end='')
-    for workload in org.WorkloadStore.get_managed_workloads_list():
-        ip_map = workload.get_ip4map_from_interfaces()
-        workloads_ip4maps_cache[workload] = ip_map
+    workloads = org.WorkloadStore.get_managed_workloads_list()
     print("OK")
     # </editor-fold>
 
     # <editor-fold desc="Building IPLists ip4 Cache">
-    iplists_ip4maps_cache: Dict[pylo.IPList, pylo.IP4Map] = {}
     print(" * Building IPLists IP4 mapping... ", end='')
-    for iplist in org.IPListStore.items_by_href.values():
-        ip_map = iplist.get_ip4map()
-        iplists_ip4maps_cache[iplist] = ip_map
+    iplists = list(org.IPListStore.items_by_href.values())
+    for iplist in iplists:
+        iplist.get_ip4map()
     print("OK")
     # </editor-fold>
 
-    print(" * Now analyzing IPLists:", flush=True)
-    for (iplist, ip_map) in iplists_ip4maps_cache.items():
-        add_iplist_to_report(iplist, workloads_ip4maps_cache, csv_report)
+    print(" * Now analyzing IPLists coverage... ", end='', flush=True)
+    coverage_by_iplist = compute_iplists_coverage(iplists, workloads)
+    print("OK")
+
+    for iplist in iplists:
+        add_iplist_to_report(iplist, coverage_by_iplist[iplist], csv_report)
 
     print(" ** DONE **")
     print()
@@ -64,8 +63,85 @@ def __main(args, org: pylo.Organization, **kwargs):
 command_object = Command(command_name, __main, fill_parser, objects_load_filter)
 
 
-def add_iplist_to_report(iplist: pylo.IPList, workloads_ip4maps_cache: Dict[pylo.Workload, pylo.IP4Map],
-                         csv_report: pylo.ArrayToExport):
+class IPListCoverage:
+    """
+    Workloads whose IPs are part of an IPList, and how many of the IPList's IPs are used by these workloads
+    """
+    __slots__ = ['workloads', 'covered_ips_count']
+
+    def __init__(self):
+        self.workloads: List[pylo.Workload] = []
+        self.covered_ips_count: int = 0
+
+
+# event kinds, sorted so that at the same position intervals are closed before others are opened. Intervals are
+# half-open [start, end + 1) so intervals ending right before another one starts don't overlap it
+_event_interval_end = 0
+_event_iplist_start = 1
+_event_workload_start = 2
+
+
+def compute_iplists_coverage(iplists: List[pylo.IPList], workloads: List[pylo.Workload]) -> Dict[pylo.IPList, IPListCoverage]:
+    """
+    Finds which workloads are covered by each IPList with a single sweep over the sorted boundaries of all IPList and
+    workload intervals (interfaces may hold ranges or CIDRs). While sweeping, the IPLists and workloads whose intervals
+    contain the current position are maintained:
+     - an interval starting overlaps all intervals of the other kind which are active at that position
+     - between two positions, IPs are covered if at least one workload interval is active, and they're counted once for
+       each active IPList
+    """
+    events: List[Tuple[int, int, bool, int]] = []
+
+    for iplist_index, iplist in enumerate(iplists):
+        for entry_start, entry_end in iplist.get_ip4map().ranges():
+            events.append((entry_start, _event_iplist_start, True, iplist_index))
+            events.append((entry_end + 1, _event_interval_end, True, iplist_index))
+
+    for workload_index, workload in enumerate(workloads):
+        for entry_start, entry_end in workload.get_ip4map_from_interfaces().ranges():
+            events.append((entry_start, _event_workload_start, False, workload_index))
+            events.append((entry_end + 1, _event_interval_end, False, workload_index))
+
+    events.sort()
+
+    # workloads are collected as indexes so they can be reported in their original order
+    covered_workloads_indexes: List[Set[int]] = [set() for _ in iplists]
+    covered_ips_count: List[int] = [0] * len(iplists)
+    # number of intervals of each IPList/workload containing the current position
+    active_iplists: Dict[int, int] = {}
+    active_workloads: Dict[int, int] = {}
+
+    for event_index, (position, kind, is_iplist, index) in enumerate(events):
+        if kind == _event_interval_end:
+            active = active_iplists if is_iplist else active_workloads
+            active[index] -= 1
+            if active[index] == 0:
+                del active[index]
+        elif kind == _event_iplist_start:
+            active_iplists[index] = active_iplists.get(index, 0) + 1
+            covered_workloads_indexes[index].update(active_workloads)
+        else:
+            active_workloads[index] = active_workloads.get(index, 0) + 1
+            for iplist_index in active_iplists:
+                covered_workloads_indexes[iplist_index].add(index)
+
+        if len(active_workloads) > 0 and event_index + 1 < len(events):
+            covered_length = events[event_index + 1][0] - position
+            if covered_length > 0:
+                for iplist_index in active_iplists:
+                    covered_ips_count[iplist_index] += covered_length
+
+    results: Dict[pylo.IPList, IPListCoverage] = {}
+    for iplist_index, iplist in enumerate(iplists):
+        coverage = IPListCoverage()
+        coverage.workloads = [workloads[workload_index] for workload_index in sorted(covered_workloads_indexes[iplist_index])]
+        coverage.covered_ips_count = covered_ips_count[iplist_index]
+        results[iplist] = coverage
+
+    return results
+
+
+def add_iplist_to_report(iplist: pylo.IPList, coverage: IPListCoverage, csv_report: pylo.ArrayToExport):
 
     appgroup_tracker: Dict[str, bool] = {}
 
@@ -81,17 +157,13 @@ def add_iplist_to_report(iplist: pylo.IPList, workloads_ip4maps_cache: Dict[pylo
         'ip4_count': ip_map.count_ips()
     }
 
-    matched_workloads: List[pylo.Workload] = []
+    matched_workloads: List[pylo.Workload] = coverage.workloads
 
-    for workload, wkl_map in workloads_ip4maps_cache.items():
-        affected_rows = ip_map.substract(wkl_map)
-        if affected_rows > 0:
-            print("matched workload   {}".format(workload.get_name()))
-            matched_workloads.append(workload)
-            appgroup_tracker[workload.get_appgroup_str()] = True
-        # print(ip_map.print_to_std(header="after subtraction", padding="     "))
+    for workload in matched_workloads:
+        print("matched workload   {}".format(workload.get_name()))
+        appgroup_tracker[workload.get_appgroup_str()] = True
 
-    new_row['ip4_uncovered_count'] = ip_map.count_ips()
+    new_row['ip4_uncovered_count'] = new_row['ip4_count'] - coverage.covered_ips_count
     new_row['covered_workloads_count'] = len(matched_workloads)
     new_row['covered_workloads_list'] = pylo.string_list_to_text(matched_workloads, "\n")
     new_row['covered_workloads_appgroups'] = pylo.string_list_to_text(appgroup_tracker.keys(), "\n")
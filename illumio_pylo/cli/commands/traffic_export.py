@@ -152,13 +152,10 @@ def __main(args: Dict, org: pylo.Organization, **kwargs):
     _apply_filters(settings_destination_filters, explorer_query.filters, 'destination')
 
     print("Executing and downloading traffic export query... ", flush=True, end='')
-    query_results = explorer_query.execute()
+    # results are streamed to a temporary file and parsed one record at a time while they're exported
+    query_results = explorer_query.execute(stream_to_file=True)
     print("DONE")
 
-    print("Processing traffic records... ", flush=True, end='')
-    records: List[ExplorerResultV2] = query_results.get_all_records()
-    print(f"DONE - {len(records)} records retrieved")
-
     # Get label types from the organization
     label_types = org.LabelStore.label_types
 
@@ -294,52 +291,57 @@ def __main(args: Dict, org: pylo.Organization, **kwargs):
             return None
         return ','.join(sorted(set(names), key=str.lower))
 
-    for record in records:
-        # Build a full record with all columns
-        full_record_to_export = {
-            'src_ip': record.source_ip,
-            'src_iplist': _format_iplists(record.get_source_iplists(org)),
-            'src_workload': record.source_workload_hostname,
-            'dst_ip': record.destination_ip,
-            'dst_iplist': _format_iplists(record.get_destination_iplists(org)),
-            'dst_workload': record.destination_workload_hostname,
-            'protocol': _protocol_display(record.service_protocol) if settings_protocol_names else record.service_protocol,
-            'port': record.service_port,
-            'policy_decision': record.policy_decision_string,
-            'draft_policy_decision': record.draft_mode_policy_decision_to_str() if settings_draft_mode_enabled else None,
-            'first_detected': _convert_timestamp(record.first_detected, target_timezone),
-            'last_detected': _convert_timestamp(record.last_detected, target_timezone),
-        }
-
-        # Add source workload labels
-        if settings_consolidate_labels:
-            # Consolidate all labels into a single comma-separated string, ordered by label types
-            if record.source_workload_href:
-                src_label_values = [record.source_workload_labels_by_type.get(label_type) for label_type in label_types]
-                src_label_values = [lv for lv in src_label_values if lv is not None]
-                full_record_to_export['src_labels'] = settings_label_separator.join(src_label_values) if src_label_values else None
+    print("Processing traffic records... ", flush=True, end='')
+    records_count = 0
+    with query_results:
+        for record in query_results.iter_records():
+            # Build a full record with all columns
+            full_record_to_export = {
+                'src_ip': record.source_ip,
+                'src_iplist': _format_iplists(record.get_source_iplists(org)),
+                'src_workload': record.source_workload_hostname,
+                'dst_ip': record.destination_ip,
+                'dst_iplist': _format_iplists(record.get_destination_iplists(org)),
+                'dst_workload': record.destination_workload_hostname,
+                'protocol': _protocol_display(record.service_protocol) if settings_protocol_names else record.service_protocol,
+                'port': record.service_port,
+                'policy_decision': record.policy_decision_string,
+                'draft_policy_decision': record.draft_mode_policy_decision_to_str() if settings_draft_mode_enabled else None,
+                'first_detected': _convert_timestamp(record.first_detected, target_timezone),
+                'last_detected': _convert_timestamp(record.last_detected, target_timezone),
+            }
+
+            # Add source workload labels
+            if settings_consolidate_labels:
+                # Consolidate all labels into a single comma-separated string, ordered by label types
+                if record.source_workload_href:
+                    src_label_values = [record.source_workload_labels_by_type.get(label_type) for label_type in label_types]
+                    src_label_values = [lv for lv in src_label_values if lv is not None]
+                    full_record_to_export['src_labels'] = settings_label_separator.join(src_label_values) if src_label_values else None
+                else:
+                    full_record_to_export['src_labels'] = None
             else:
-                full_record_to_export['src_labels'] = None
-        else:
-            for label_type in label_types:
-                full_record_to_export[f'src_{label_type}'] = record.source_workload_labels_by_type.get(label_type) if record.source_workload_href else None
-
-        # Add destination workload labels
-        if settings_consolidate_labels:
-            # Consolidate all labels into a single comma-separated string, ordered by label types
-            if record.destination_workload_href:
-                dst_label_values = [record.destination_workload_labels_by_type.get(label_type) for label_type in label_types]
-                dst_label_values = [lv for lv in dst_label_values if lv is not None]
-                full_record_to_export['dst_labels'] = settings_label_separator.join(dst_label_values) if dst_label_values else None
+                for label_type in label_types:
+                    full_record_to_export[f'src_{label_type}'] = record.source_workload_labels_by_type.get(label_type) if record.source_workload_href else None
+
+            # Add destination workload labels
+            if settings_consolidate_labels:
+                # Consolidate all labels into a single comma-separated string, ordered by label types
+                if record.destination_workload_href:
+                    dst_label_values = [record.destination_workload_labels_by_type.get(label_type) for label_type in label_types]
+                    dst_label_values = [lv for lv in dst_label_values if lv is not None]
+                    full_record_to_export['dst_labels'] = settings_label_separator.join(dst_label_values) if dst_label_values else None
+                else:
+                    full_record_to_export['dst_labels'] = None
             else:
-                full_record_to_export['dst_labels'] = None
-        else:
-            for label_type in label_types:
-                full_record_to_export[f'dst_{label_type}'] = record.destination_workload_labels_by_type.get(label_type) if record.destination_workload_href else None
-
-        # Filter to include only selected columns
-        csv_record = {col: full_record_to_export[col] for col in columns_to_include}
-        sheet.add_line_from_object(csv_record)
+                for label_type in label_types:
+                    full_record_to_export[f'dst_{label_type}'] = record.destination_workload_labels_by_type.get(label_type) if record.destination_workload_href else None
+
+            # Filter to include only selected columns
+            csv_record = {col: full_record_to_export[col] for col in columns_to_include}
+            sheet.add_line_from_object(csv_record)
+            records_count += 1
+    print(f"DONE - {records_count} records retrieved")
 
     if sheet.lines_count() < 1:
         print("No traffic records matched the filters; nothing to export.")
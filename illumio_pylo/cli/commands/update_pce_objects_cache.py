@@ -3,34 +3,55 @@ import argparse
 import illumio_pylo as pylo
 import os
 import datetime
-import json
 
 from illumio_pylo import log
 from . import Command
 
 
 command_name = "pce-objects-cache-updater"
-objects_load_filter = None
+objects_load_filter = []  # objects are downloaded by the command itself, so it can skip them in delta mode
 
 
 def fill_parser(parser: argparse.ArgumentParser):
-    pass  # All options are now handled by the global CLI arguments
+    parser.add_argument('--format', type=str, required=False, default='json', choices=['json', 'binary'],
+                        help='Format of the cache file. Binary is compressed and a lot faster to load')
+    parser.add_argument('--delta', action='store_true',
+                        help='Only download objects which changed since the existing cache file was generated and merge them into it')
 
 
 def __main(args, org: pylo.Organization = None, connector: pylo.APIConnector = None, config_data=None, **kwargs):
 
-    # filename should be like 'cache_xxx.yyy.zzz.json'
-    filename = 'cache_' + connector.name + '.json'
+    file_format = args['format']
+    filename = pylo.PceCacheFile.get_filename(connector.name, file_format)
 
+    # taken before downloading so changes made during the download will be picked up by the next delta refresh
     timestamp = datetime.datetime.now(datetime.timezone.utc)
 
+    previous_cache_filename = pylo.PceCacheFile.find_most_recent_file(connector.name) if args['delta'] else None
+
+    if previous_cache_filename is not None:
+        print(" * Loading existing cache file '{}'... ".format(previous_cache_filename), end='', flush=True)
+        previous_cache = pylo.PceCacheFile.read(previous_cache_filename)
+        print("OK! (generated on {})".format(previous_cache.get('generation_date')))
+        print(" * Downloading objects which changed since then... ", end='', flush=True)
+        config_data = pylo.Organization.get_config_delta_from_api(connector, previous_cache,
+                                                                  include_deleted_workloads=args['include_deleted_workloads'],
+                                                                  force_async_mode=args['force_async_mode'])
+        print("OK!")
+    else:
+        if args['delta']:
+            print(" * No existing cache file found for '{}', all objects will be downloaded".format(connector.name))
+        print(" * Downloading all objects... ", end='', flush=True)
+        config_data = connector.get_pce_objects(include_deleted_workloads=args['include_deleted_workloads'],
+                                                force_async_mode=args['force_async_mode'])
+        print("OK!")
+
     json_content = {'generation_date': timestamp.isoformat(),
                     'pce_version': connector.get_software_version_string(),
                     'data': config_data,
                     }
 
-    with open(filename, 'w') as outfile:
-        json.dump(json_content, outfile)
+    pylo.PceCacheFile.write(filename, json_content, file_format)
 
     size = os.path.getsize(filename)
 
@@ -39,4 +60,5 @@ def __main(args, org: pylo.Organization = None, connector: pylo.APIConnector = N
     print()
 
 
-command_object = Command(command_name, __main, fill_parser, skip_pce_config_loading=True)
+command_object = Command(command_name, __main, fill_parser, skip_pce_config_loading=True,
+                         load_specific_objects_only=objects_load_filter)
@@ -5,7 +5,6 @@ from datetime import datetime
 
 import illumio_pylo as pylo
 from illumio_pylo import ArraysToExcel, ExcelHeader, ExcelHeaderSet
-from illumio_pylo.FilterQuery import FilterQuery, get_workload_filter_registry
 from .utils.misc import make_filename_with_timestamp
 from . import Command
 
@@ -132,14 +131,8 @@ def __main(args, org: pylo.Organization, **kwargs):
     if filter_query_string is not None:
         print(" * Applying filter query: '{}'".format(filter_query_string))
         try:
-            # Pass org to get registry with all configured label types for this PCE
-            registry = get_workload_filter_registry(org)
-            filter_query = FilterQuery(registry)
-
-            matching_workloads = filter_query.execute(filter_query_string, list(all_workloads.values()))
-
-            # Convert back to dict by href
-            all_workloads = {w.href: w for w in matching_workloads}
+            all_workloads = org.WorkloadStore.find_workloads_matching_query_as_dict(filter_query_string,
+                                                                                   include_deleted=True)
             print("   - Filter query matched {} workload(s)".format(len(all_workloads)))
         except pylo.PyloEx as e:
             pylo.log.error("Filter query error: {}".format(e))
@@ -284,4 +277,4 @@ def __main(args, org: pylo.Organization, **kwargs):
         print("\n** WARNING: no entry matched your filters so reports are empty !\n")
 
 
-command_object = Command(command_name, __main, fill_parser)
+command_object = Command(command_name, __main, fill_parser, lazy_pce_config_loading=True)
@@ -301,15 +301,6 @@ def detect_ip_collisions(csv_data, org: pylo.Organization, ignore_all_sorts_coll
     indent = "    "
     ip_cache: Dict[str, WorkloadCollisionItem] = {}
     count_duplicate_ip_addresses_in_csv = 0
-    for workload in org.WorkloadStore.itemsByHRef.values():
-        for interface in workload.interfaces:
-            if interface.ip not in ip_cache:
-                ip_cache[interface.ip] = WorkloadCollisionItem(from_pce=True, workload_object=workload,
-                                                               managed=not workload.unmanaged)
-            else:
-                pylo.log.warn(indent+"- Warning duplicate IPs found in the PCE between 2 workloads ({} and {}) for IP: {}".format(
-                    workload.get_name(), ip_cache[interface.ip].workload_object.get_name(), interface.ip))
-
     for csv_object in csv_data.objects():
         if '**not_created_reason**' in csv_object:
             continue
@@ -340,6 +331,16 @@ def detect_ip_collisions(csv_data, org: pylo.Organization, ignore_all_sorts_coll
 
             csv_object['**ip_array**'].append(ip)
 
+            if ip not in ip_cache:
+                # PCE workloads are looked up through the WorkloadStore IP index
+                pce_workloads = org.WorkloadStore.find_workloads_matching_ip(ip)
+                if len(pce_workloads) > 0:
+                    ip_cache[ip] = WorkloadCollisionItem(from_pce=True, workload_object=pce_workloads[0],
+                                                         managed=not pce_workloads[0].unmanaged)
+                    for workload in pce_workloads[1:]:
+                        pylo.log.warn(indent+"- Warning duplicate IPs found in the PCE between 2 workloads ({} and {}) for IP: {}".format(
+                            workload.get_name(), pce_workloads[0].get_name(), ip))
+
             if ip not in ip_cache:
                 ip_cache[ip] = WorkloadCollisionItem(from_pce=False, csv_object=csv_object, managed=False)
             else:
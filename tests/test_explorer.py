@@ -0,0 +1,237 @@
+"""
+Test script for Explorer result sets and time sliced queries.
+
+Explorer queries are answered by a fake poller aggregating a list of flows, so no PCE connection is needed.
+"""
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import illumio_pylo as pylo
+
+base_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_record_json(source_ip: str, port: int, num_connections: int, first_detected: datetime, last_detected: datetime):
+    return {'src': {'ip': source_ip}, 'dst': {'ip': '10.1.1.1'}, 'service': {'proto': 6, 'port': port},
+            'num_connections': num_connections, 'policy_decision': 'allowed',
+            'timestamp_range': {'first_detected': first_detected.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                                'last_detected': last_detected.strftime('%Y-%m-%dT%H:%M:%SZ')}}
+
+
+class FakeConnector:
+    """
+    Answers explorer queries from a list of (timestamp, source_ip, port) flows, aggregated like the PCE does: one record
+    per source/service with its connections count, truncated to max_results
+    """
+
+    class Poller:
+        def __init__(self, connector: 'FakeConnector'):
+            self.connector = connector
+            self.filters_by_name = {}
+
+        def submit(self, name, filters, draft_mode_enabled=False):
+            self.filters_by_name[name] = filters
+            self.connector.submitted_slices.append((filters._time_from, filters._time_to))
+
+        def wait_for_all(self, max_running_time_seconds=1800):
+            return {name: pylo.ExplorerResultSetV2(self.connector.query(filters))
+                    for name, filters in self.filters_by_name.items()}
+
+    def __init__(self, flows):
+        self.flows = flows
+        self.submitted_slices = []
+
+    def new_explorer_queries_poller(self, max_poll_interval_seconds=10, max_concurrent_downloads=4):
+        return FakeConnector.Poller(self)
+
+    def query(self, filters: pylo.ExplorerFilterSetV2):
+        aggregated = {}
+        for timestamp, source_ip, port in self.flows:
+            # the API works with a 1 second resolution and both ends are inclusive
+            if filters._time_from <= timestamp <= filters._time_to:
+                entry = aggregated.setdefault((source_ip, port), [0, timestamp, timestamp])
+                entry[0] += 1
+                entry[1] = min(entry[1], timestamp)
+                entry[2] = max(entry[2], timestamp)
+        records = [make_record_json(source_ip, port, *entry) for (source_ip, port), entry in sorted(aggregated.items())]
+        return records[:filters.max_results]
+
+
+def make_query(connector: FakeConnector, max_results: int, time_from: datetime, time_to: datetime) -> pylo.ExplorerQueryV2:
+    query = pylo.ExplorerQueryV2(connector, max_results=max_results)
+    query.filters.set_time_from(time_from)
+    query.filters.set_time_to(time_to)
+    return query
+
+
+def total_connections(result_set: pylo.ExplorerResultSetV2) -> int:
+    return sum(record.num_connections for record in result_set.iter_records())
+
+
+def test_time_slices_are_contiguous():
+    """Test that slices cover the whole time window without overlapping"""
+    flows = [(base_time + timedelta(seconds=second), '10.0.0.1', 80) for second in range(0, 1001, 50)]
+    connector = FakeConnector(flows)
+    result = make_query(connector, 1000, base_time, base_time + timedelta(seconds=1000)).execute_with_time_slices(slices_count=4)
+
+    slices = connector.submitted_slices
+    assert len(slices) == 4
+    assert slices[0][0] == base_time and slices[-1][1] == base_time + timedelta(seconds=1000)
+    for (_, previous_to), (next_from, _) in zip(slices, slices[1:]):
+        assert next_from == previous_to + timedelta(seconds=1)
+
+    # flows on slices boundaries are counted once
+    records = result.get_all_records()
+    assert len(records) == 1 and records[0].num_connections == len(flows)
+    assert records[0].first_detected == '2024-01-01T00:00:00Z' and records[0].last_detected == '2024-01-01T00:16:40Z'
+
+
+def test_saturated_slices_are_split():
+    """Test that slices reaching max_results are queried again with smaller slices, until all flows are retrieved"""
+    flows = [(base_time + timedelta(seconds=second), '10.0.{}.{}'.format(second % 7, second % 13), 80 + second % 3)
+             for second in range(0, 86400, 97)]
+    connector = FakeConnector(flows)
+    result = make_query(connector, 20, base_time, base_time + timedelta(days=1)).execute_with_time_slices(
+        slices_count=4, min_slice_seconds=10)
+
+    assert len(connector.submitted_slices) > 4
+    assert total_connections(result) == len(flows)
+    assert result.count_records() == len({(source_ip, port) for _, source_ip, port in flows})
+
+
+def test_min_slice_seconds_floor():
+    """Test that saturated slices no longer than min_slice_seconds are not split"""
+    flows = [(base_time + timedelta(seconds=500), '10.0.0.{}'.format(index), 80) for index in range(10)]
+    connector = FakeConnector(flows)
+    make_query(connector, 5, base_time, base_time + timedelta(seconds=3600)).execute_with_time_slices(
+        slices_count=4, min_slice_seconds=100)
+
+    slices = connector.submitted_slices
+    for slice_from, slice_to in slices:
+        duration = (slice_to - slice_from).total_seconds() + 1
+        children = [other for other in slices if other != (slice_from, slice_to)
+                    and slice_from <= other[0] and other[1] <= slice_to]
+        if len(children) > 0:
+            assert duration > 100
+    # the saturated slice holding all flows ended up no longer than min_slice_seconds
+    assert min((slice_to - slice_from).total_seconds() + 1 for slice_from, slice_to in slices
+               if slice_from <= flows[0][0] <= slice_to) <= 100
+
+
+def test_merge_sums_connections_without_modifying_inputs():
+    """Test that merging deduplicates flows by summing their connections and widening timestamps"""
+    first = pylo.ExplorerResultSetV2([
+        make_record_json('10.0.0.1', 80, 3, base_time, base_time + timedelta(seconds=10)),
+        make_record_json('10.0.0.2', 80, 1, base_time, base_time),
+    ])
+    second = pylo.ExplorerResultSetV2([
+        make_record_json('10.0.0.1', 80, 4, base_time + timedelta(seconds=20), base_time + timedelta(seconds=30)),
+        make_record_json('10.0.0.1', 443, 2, base_time, base_time),
+    ])
+
+    merged = pylo.ExplorerResultSetV2.merge([first, second])
+    records = {(record.source_ip, record.service_port): record for record in merged.get_all_records()}
+    assert len(records) == 3 and merged.count_records() == 3 and len(merged.raw_json) == 3
+    assert records[('10.0.0.1', 80)].num_connections == 7
+    assert records[('10.0.0.1', 80)].first_detected == '2024-01-01T00:00:00Z'
+    assert records[('10.0.0.1', 80)].last_detected == '2024-01-01T00:00:30Z'
+    assert records[('10.0.0.1', 80)].raw_json['num_connections'] == 7
+
+    assert first.records[0].num_connections == 3 and first.records[0].raw_json['num_connections'] == 3
+    assert first.records[0].last_detected == '2024-01-01T00:00:10Z'
+    assert first.raw_json[0]['timestamp_range']['last_detected'] == '2024-01-01T00:00:10Z'
+    assert second.records[0].num_connections == 4
+
+
+def write_records_to_temporary_file(records_json) -> str:
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(records_json, f)
+    return f.name
+
+
+def test_result_set_from_file():
+    """Test that a file backed result set gives the same records as an in-memory one, and only deletes files it owns"""
+    records_json = [make_record_json('10.0.0.{}'.format(index), 80 + index % 5, index + 1, base_time, base_time)
+                    for index in range(200)]
+    in_memory = pylo.ExplorerResultSetV2(records_json)
+
+    filename = write_records_to_temporary_file(records_json)
+    try:
+        from_file = pylo.ExplorerResultSetV2.create_from_file(filename)
+        assert from_file.count_records() == 200 and not from_file.is_loaded()
+        assert [record.raw_json for record in from_file.iter_records(chunk_size=100)] == \
+            [record.raw_json for record in in_memory.iter_records()]
+        assert [record.source_ip for record in from_file.iter_records()] == \
+            [record.source_ip for record in in_memory.get_all_records()]
+        assert not from_file.is_loaded()
+
+        from_file.close()
+        assert os.path.exists(filename)
+
+        assert len(from_file.get_all_records()) == 200 and from_file.is_loaded() and from_file.raw_json == records_json
+    finally:
+        os.remove(filename)
+
+    filename = write_records_to_temporary_file(records_json)
+    with pylo.ExplorerResultSetV2.create_from_file(filename, delete_file_on_close=True) as from_file:
+        assert total_connections(from_file) == sum(range(1, 201))
+    assert not os.path.exists(filename)
+
+
+def test_result_set_from_invalid_file():
+    """Test that parse errors of a file backed result set are raised as PyloEx"""
+    filename = write_records_to_temporary_file([])
+    with open(filename, 'w') as f:
+        f.write('[' + json.dumps(make_record_json('10.0.0.1', 80, 1, base_time, base_time)) + ', {"src": ')
+    try:
+        for call in (lambda result_set: list(result_set.iter_records()), lambda result_set: result_set.count_records(),
+                     lambda result_set: result_set.get_all_records()):
+            try:
+                call(pylo.ExplorerResultSetV2.create_from_file(filename))
+            except pylo.PyloEx as e:
+                assert filename in str(e)
+            else:
+                raise AssertionError("no PyloEx was raised")
+    finally:
+        os.remove(filename)
+
+
+def test_download_to_temporary_file():
+    """Test that a streamed download is written as-is to a temporary file"""
+    content = json.dumps([make_record_json('10.0.0.1', 80, 1, base_time, base_time)]).encode('utf-8')
+
+    class FakeResponse:
+        closed = False
+
+        def iter_content(self, chunk_size):
+            for index in range(0, len(content), 7):
+                yield content[index:index + 7]
+
+        def close(self):
+            FakeResponse.closed = True
+
+    connector = pylo.APIConnector('pce.example.com', 443, 'user', 'key')
+    connector._do_get_call_streamed = lambda path, include_org_id=True: FakeResponse()
+    filename = connector._do_get_call_to_temporary_file('/traffic_flows/async_queries/1/download', include_org_id=False)
+    try:
+        with open(filename, 'rb') as f:
+            assert f.read() == content
+        assert FakeResponse.closed
+    finally:
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+    test_time_slices_are_contiguous()
+    test_saturated_slices_are_split()
+    test_min_slice_seconds_floor()
+    test_merge_sums_connections_without_modifying_inputs()
+    test_result_set_from_file()
+    test_result_set_from_invalid_file()
+    test_download_to_temporary_file()
+    print("All Explorer tests completed successfully!")
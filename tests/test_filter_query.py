@@ -291,6 +291,54 @@ def test_filter_execution():
     return failed == 0
 
 
+def test_compiled_query():
+    """Test that compiled queries return the same results as AST evaluation"""
+    print("\n" + "=" * 60)
+    print("Testing Compiled Queries")
+    print("=" * 60)
+
+    from datetime import datetime
+
+    workloads = [
+        MockWorkload(name='SRV158', description='Production web server', online=True,
+                     interfaces=[MockInterface('192.168.2.54'), MockInterface('10.0.0.1')],
+                     labels={'env': MockLabel('Production', 'env')},
+                     ven_agent=MockVENAgent(datetime(2022, 9, 10, 12, 0, 0), mode='enforced')),
+        MockWorkload(name='SRV48889', online=True, interfaces=[MockInterface('192.168.3.100')],
+                     ven_agent=MockVENAgent(datetime(2022, 9, 15, 12, 0, 0), mode='build')),
+        MockWorkload(name='UNMANAGED001', unmanaged=True, interfaces=[MockInterface('192.168.5.50')]),
+    ]
+
+    registry = get_workload_filter_registry()
+
+    queries = [
+        "name == 'srv158' or name != 'SRV48889'",
+        "description contains 'web' and not online == false",
+        "name matches '^srv[0-9]+$'",
+        "env == 'Production' or env == none",
+        "last_heartbeat <= '2022-09-12'",
+        "last_heartbeat > '2022-09-12T00:00:00'",
+        "mode != 'enforced'",
+        "ip_address == '10.0.0.1' or ip != '192.168.5.50'",
+    ]
+
+    for query in queries:
+        filter_query = FilterQuery(registry).parse(query)
+        expected = [w.get_name() for w in workloads if filter_query._ast.evaluate(w, registry)]
+        result = [w.get_name() for w in filter_query.execute(query, workloads)]
+        print(f"Query: {query} -> {result}")
+        assert result == expected, f"Compiled query '{query}' returned {result} instead of {expected}"
+
+    # invalid regex patterns are reported when the query is compiled
+    try:
+        FilterQuery(registry).parse("name matches '[a-'").compile()
+        assert False, "Invalid regex should have raised an exception"
+    except pylo.PyloEx as e:
+        print(f"OK: Correctly raised: {e}")
+
+    print("\n✓ Compiled query tests completed!")
+
+
 def test_error_handling():
     """Test error handling for invalid queries"""
     print("\n" + "=" * 60)
@@ -326,6 +374,199 @@ def test_error_handling():
     print("\n✓ Error handling tests completed!")
 
 
+def make_org(workloads_json) -> pylo.Organization:
+    """Builds an Organization from JSON with the given workloads and a few labels"""
+    data = pylo.Organization.create_fake_empty_config()
+    data['label_dimensions'] = [{'href': '/orgs/1/label_dimensions/{}'.format(index), 'key': key,
+                                 'display_name': key.capitalize()}
+                                for index, key in enumerate(['role', 'app', 'env', 'loc'])]
+    data['labels'] = [{'href': '/orgs/1/labels/1', 'key': 'role', 'value': 'Web'},
+                      {'href': '/orgs/1/labels/2', 'key': 'role', 'value': 'DB'},
+                      {'href': '/orgs/1/labels/3', 'key': 'env', 'value': 'Prod'},
+                      {'href': '/orgs/1/labels/4', 'key': 'env', 'value': 'Dev'}]
+    data['workloads'] = workloads_json
+    org = pylo.Organization(1)
+    org.pce_version = pylo.SoftwareVersion('23.2.0')
+    org.load_from_json(data)
+    return org
+
+
+def make_workload_json(workload_id: int, name, hostname: str, ips, label_ids, managed=True, deleted=False):
+    agent = {}
+    if managed:
+        agent = {'href': '/orgs/1/agents/{}'.format(workload_id), 'status': {'agent_version': '22.5.0'},
+                 'config': {'mode': 'idle'}}
+    return {'href': '/orgs/1/workloads/{}'.format(workload_id), 'name': name, 'hostname': hostname,
+            'description': '', 'labels': [{'href': '/orgs/1/labels/{}'.format(label_id)} for label_id in label_ids],
+            'interfaces': [{'name': 'eth{}'.format(index), 'address': ip} for index, ip in enumerate(ips)],
+            'online': managed, 'deleted': deleted, 'os_id': 'centos-x86_64-7', 'os_detail': '',
+            'created_at': '2023-01-01T00:00:00.000Z', 'agent': agent}
+
+
+def test_planned_execution():
+    """Test that queries served by indexes give the same results as a full scan, across two Organizations"""
+    print("\n" + "=" * 60)
+    print("Testing planned execution")
+    print("=" * 60)
+
+    org_a = make_org([
+        make_workload_json(1, 'WKL1', 'wkl1.a.example.com', ['10.0.0.1'], [1, 3]),
+        make_workload_json(2, None, 'wkl2.a.example.com', ['10.0.0.2', '10.0.1.2'], [2, 3]),
+        make_workload_json(3, 'WKL3', 'wkl3.a.example.com', ['10.0.0.3'], [1, 4], managed=False),
+        make_workload_json(4, 'WKL4', 'wkl4.a.example.com', ['10.0.0.4'], [2], deleted=True),
+    ])
+    # same org id and hrefs as org_a, so both share the same cached registry
+    org_b = make_org([
+        make_workload_json(1, 'WKL1', 'wkl1.b.example.com', ['10.9.9.9'], [2, 4]),
+        make_workload_json(2, 'WKL2', 'wkl2.b.example.com', ['10.0.0.1'], [1, 3], managed=False),
+        make_workload_json(5, None, 'wkl5.b.example.com', ['10.0.0.5'], [1, 4]),
+    ])
+
+    queries = [
+        "label.role == 'Web'",
+        "role == 'db'",
+        "env == 'Prod' and role == 'Web'",
+        "env == 'Dev' or role == 'DB'",
+        "role == 'DB' or env == 'Prod'",
+        "not role == 'Web'",
+        "name == 'WKL1'",
+        "name == 'wkl2.a.example.com'",
+        "hostname == 'wkl5.b.example.com' or hostname == 'wkl1.a.example.com'",
+        "ip_address == '10.0.0.1'",
+        "ip_address == '10.9.9.9'",
+        "ip_address contains '10.0.1.2' and role == 'DB'",
+        "href == '/orgs/1/workloads/1'",
+        "href == '/orgs/1/workloads/5' or href == '/orgs/1/workloads/4'",
+        "managed == true",
+        "managed == false",
+        "managed != true and env == 'Prod'",
+        "(managed == true or role == 'Web') and not env == 'Dev'",
+        "name == 'WKL1' and not managed == false",
+    ]
+
+    all_passed = True
+    for org in (org_a, org_b, org_a):
+        store = org.WorkloadStore
+        registry = get_workload_filter_registry(org)
+        workloads = list(store.itemsByHRef.values())
+        for query in queries:
+            for include_deleted in (False, True):
+                expected = [w for w in FilterQuery(registry).execute(query, workloads) if include_deleted or not w.deleted]
+                result = store.find_workloads_matching_query(query, include_deleted=include_deleted)
+                if list(map(id, result)) != list(map(id, expected)):
+                    print(f"FAIL: {query} (include_deleted={include_deleted}) returned "
+                          f"{[w.href for w in result]} instead of {[w.href for w in expected]}")
+                    all_passed = False
+
+    # results must be objects of the queried Organization
+    result = org_b.WorkloadStore.find_workloads_matching_query("name == 'WKL1'")
+    assert len(result) == 1 and result[0] is org_b.WorkloadStore.itemsByHRef['/orgs/1/workloads/1']
+    assert [w.href for w in org_b.WorkloadStore.find_workloads_matching_query("ip_address == '10.9.9.9'")] == \
+        ['/orgs/1/workloads/1']
+    assert FilterQuery(get_workload_filter_registry(org_b)).parse("managed == false").plan(org_b.WorkloadStore) \
+        == [org_b.WorkloadStore.itemsByHRef['/orgs/1/workloads/2']]
+
+    assert all_passed
+    print("\n✓ Planned execution tests passed!")
+
+
+def test_cached_query_after_update():
+    """Test that cached query results are invalidated when workloads are updated"""
+    org = make_org([
+        make_workload_json(1, 'WKL1', 'wkl1.example.com', ['10.0.0.1'], [1, 3]),
+        make_workload_json(2, 'WKL2', 'wkl2.example.com', ['10.0.0.2'], [2, 3]),
+    ])
+    store = org.WorkloadStore
+    workload = store.itemsByHRef['/orgs/1/workloads/1']
+    # stacked updates are not pushed to the PCE so no connector is needed
+    workload.api_stacked_updates_start()
+
+    assert store.find_workloads_matching_query("description == 'foo'", use_cache=True) == []
+    workload.api_update_description('foo')
+    assert store.find_workloads_matching_query("description == 'foo'", use_cache=True) == [workload]
+
+    assert store.find_workloads_matching_query("hostname == 'new.example.com'", use_cache=True) == []
+    workload.api_update_hostname('new.example.com')
+    assert store.find_workloads_matching_query("hostname == 'new.example.com'", use_cache=True) == [workload]
+
+    assert store.find_workloads_matching_query("role == 'DB'", use_cache=True) == \
+        [store.itemsByHRef['/orgs/1/workloads/2']]
+    workload.api_update_labels([org.LabelStore.find_by_href('/orgs/1/labels/2')])
+    assert store.find_workloads_matching_query("role == 'DB'", use_cache=True) == \
+        [workload, store.itemsByHRef['/orgs/1/workloads/2']]
+
+
+def test_columnar_execution():
+    """Test that bitmask evaluation over a columnar snapshot matches row by row evaluation"""
+    print("\n" + "=" * 60)
+    print("Testing columnar execution")
+    print("=" * 60)
+
+    workloads_json = [
+        make_workload_json(1, 'WKL1', 'wkl1.example.com', ['10.0.0.1'], [1, 3]),
+        make_workload_json(2, None, 'wkl2.example.com', ['10.0.0.2', '10.0.1.2'], [2, 3]),
+        make_workload_json(3, 'WKL3', 'wkl3.example.com', ['10.0.0.3'], [1, 4], managed=False),
+        make_workload_json(4, 'WKL4', 'wkl4.example.com', ['10.0.0.4'], [2], deleted=True),
+        make_workload_json(5, 'WKL5', None, [], [], managed=False),
+    ]
+    # enough rows to have masks spanning several bytes
+    for workload_id in range(6, 40):
+        workloads_json.append(make_workload_json(workload_id, 'SRV{}'.format(workload_id),
+                                                 'srv{}.example.com'.format(workload_id),
+                                                 ['10.0.2.{}'.format(workload_id)],
+                                                 [1 + workload_id % 2, 3 + workload_id % 3 // 2],
+                                                 managed=workload_id % 4 != 0))
+    org = make_org(workloads_json)
+    store = org.WorkloadStore
+    registry = get_workload_filter_registry(org)
+
+    queries = [
+        "role == 'Web'",
+        "role != 'Web'",
+        "env == 'prod' and role == 'DB'",
+        "env == 'Dev' or role == 'DB'",
+        "not (env == 'Dev' or role == 'DB')",
+        "not role == 'Web' and not env == 'Prod'",
+        "name == 'WKL1' or name == 'wkl2.example.com'",
+        "hostname contains 'srv1'",
+        "name matches 'SRV[0-9]$'",
+        "ip_address == '10.0.1.2'",
+        "ip_address contains '10.0.2.'",
+        "managed == true",
+        "managed == false or deleted == true",
+        "online == true and not managed == false",
+        "reference_count >= 0",
+        "reference_count > 0",
+        "created_at > '2022-01-01'",
+        "created_at < '2022-01-01'",
+        "description == ''",
+    ]
+
+    for include_deleted in (False, True):
+        workloads = [w for w in store.itemsByHRef.values() if include_deleted or not w.deleted]
+        snapshot = store.get_columnar_snapshot(include_deleted=include_deleted, preload_fields=['role', 'env'])
+        # same snapshot evaluated by scanning row codes rather than OR'ing per value masks
+        scanned_snapshot = store.get_columnar_snapshot(include_deleted=include_deleted)
+        scanned_snapshot.max_distinct_values_for_masks = 1
+        for query in queries:
+            expected = FilterQuery(registry).execute(query, workloads)
+            result = store.find_workloads_matching_query_columnar(query, snapshot)
+            assert list(map(id, result)) == list(map(id, expected)), \
+                f"{query} (include_deleted={include_deleted}) returned {[w.href for w in result]} " \
+                f"instead of {[w.href for w in expected]}"
+            result = FilterQuery(registry).execute_columnar(query, scanned_snapshot)
+            assert list(map(id, result)) == list(map(id, expected)), query
+
+    snapshot = store.get_columnar_snapshot()
+    try:
+        store.find_workloads_matching_query_columnar("unknown_field == 'x'", snapshot)
+        assert False, "unknown fields should be rejected"
+    except pylo.PyloEx:
+        pass
+
+    print("\n✓ Columnar execution tests passed!")
+
+
 if __name__ == '__main__':
     print("FilterQuery Test Suite")
     print("=" * 60)
@@ -334,6 +575,10 @@ if __name__ == '__main__':
     test_parser()
     test_workload_registry()
     success = test_filter_execution()
+    test_compiled_query()
+    test_planned_execution()
+    test_cached_query_after_update()
+    test_columnar_execution()
     test_error_handling()
 
     print("\n" + "=" * 60)
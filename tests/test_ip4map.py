@@ -0,0 +1,108 @@
+"""
+Test script for IP4Map and IP4ArrayMap.
+
+Array backed maps are checked against plain sets of IPs built from small random entries.
+"""
+import ipaddress
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import illumio_pylo as pylo
+
+
+def random_entries(rnd: random.Random, count: int):
+    entries = []
+    for _ in range(count):
+        ip = 0x0A000000 + rnd.randrange(4096)
+        kind = rnd.random()
+        if kind < 0.3:
+            entries.append(str(ipaddress.IPv4Address(ip)))
+        elif kind < 0.6:
+            entries.append(str(ipaddress.IPv4Network((ip, rnd.randint(26, 32)), strict=False)))
+        else:
+            entries.append('{}-{}'.format(ipaddress.IPv4Address(ip), ipaddress.IPv4Address(ip + rnd.randrange(200))))
+    return entries
+
+
+def map_to_set(ip_map: pylo.IP4ArrayMap):
+    result = set()
+    for range_start, range_end in ip_map.ranges():
+        result.update(range(range_start, range_end + 1))
+    return result
+
+
+def test_ip4map_batch():
+    """Test that batch additions give the same map as one by one additions"""
+    rnd = random.Random(1)
+    for _ in range(50):
+        entries = random_entries(rnd, rnd.randint(0, 20))
+        one_by_one = pylo.IP4Map()
+        for entry in entries:
+            one_by_one.add_from_text(entry)
+        batch = pylo.IP4Map()
+        batch.add_many_from_text(entries)
+        assert batch.to_list_of_string() == one_by_one.to_list_of_string()
+
+    skipped = pylo.IP4Map()
+    skipped.add_from_text('10.0.0.0/24', skip_recalculation=True)
+    skipped.add_from_text('10.0.0.128-10.0.1.10', skip_recalculation=True)
+    skipped.sort_and_recalculate()
+    assert skipped.to_list_of_string() == ['10.0.0.0-10.0.1.10']
+
+
+def test_ip4_array_map_operations():
+    """Test IP4ArrayMap set operations against sets of IPs"""
+    rnd = random.Random(2)
+    for _ in range(200):
+        entries_a = random_entries(rnd, rnd.randint(0, 10))
+        entries_b = random_entries(rnd, rnd.randint(0, 10))
+        map_a = pylo.IP4ArrayMap.from_text_entries(entries_a)
+        map_b = pylo.IP4ArrayMap.from_text_entries(entries_b)
+        set_a, set_b = map_to_set(map_a), map_to_set(map_b)
+
+        legacy_map = pylo.IP4Map()
+        legacy_map.add_many_from_text(entries_a)
+        assert legacy_map.count_ips() == map_a.count_ips() == len(set_a)
+        assert pylo.IP4ArrayMap.from_ip4map(legacy_map) == map_a
+
+        assert map_to_set(map_a.union(map_b)) == set_a | set_b
+        assert map_to_set(map_a.intersection(map_b)) == set_a & set_b
+        assert map_to_set(map_a.subtract(map_b)) == set_a - set_b
+        assert map_a.overlaps(map_b) == (len(set_a & set_b) > 0)
+        assert map_a.contains(map_b) == (len(set_a) > 0 and len(set_b) > 0 and set_b <= set_a)
+
+        for ip in rnd.sample(range(0x0A000000, 0x0A000000 + 4400), 10):
+            assert map_a.match_single_ip(ip) == (ip in set_a)
+            assert map_a.match_single_ip(str(ipaddress.IPv4Address(ip))) == (ip in set_a)
+
+
+def test_cidr_decomposition():
+    """Test CIDR decomposition against ipaddress.summarize_address_range()"""
+    rnd = random.Random(3)
+    for _ in range(500):
+        range_start = rnd.randrange(1 << 32)
+        range_end = min((1 << 32) - 1, range_start + rnd.choice([0, 1, 7, 300, 70000, 1 << 28]))
+        expected = [str(network) for network in ipaddress.summarize_address_range(
+            ipaddress.IPv4Address(range_start), ipaddress.IPv4Address(range_end))]
+        assert pylo.IPMap.ip4_range_to_cidr_strings(range_start, range_end) == expected
+
+    ip_map = pylo.IP4Map()
+    ip_map.add_many_from_text(['0.0.0.0/0'])
+    assert ip_map.to_list_of_cidr_string() == ['0.0.0.0/0']
+
+    ip_map = pylo.IP4Map()
+    ip_map.add_many_from_text(['10.0.0.0/24', '10.0.1.1-10.0.1.2', '192.168.0.1'])
+    expected = ['10.0.0.0/24', '10.0.1.1/32', '10.0.1.2/32', '192.168.0.1/32']
+    assert ip_map.to_list_of_cidr_string() == expected
+    assert ip_map.to_list_of_cidr_string(skip_netmask_for_32=True) == ['10.0.0.0/24', '10.0.1.1', '10.0.1.2', '192.168.0.1']
+    assert pylo.IP4Map.batch_to_list_of_cidr_string([ip_map, ip_map.to_array_map()]) == [expected, expected]
+
+
+if __name__ == '__main__':
+    test_ip4map_batch()
+    test_ip4_array_map_operations()
+    test_cidr_decomposition()
+    print("All IP4Map tests completed successfully!")
@@ -0,0 +1,97 @@
+"""
+Test script for the coverage computed by iplist-analyzer.
+
+The single sweep is checked against the subtraction of workloads IP maps from IPLists, as the command used to do.
+"""
+import copy
+import ipaddress
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import illumio_pylo as pylo
+from illumio_pylo.cli.commands.iplist_analyzer import compute_iplists_coverage
+
+
+def random_entry(rnd: random.Random) -> str:
+    ip = 0x0A000000 + rnd.randrange(2048)
+    kind = rnd.random()
+    if kind < 0.5:
+        return str(ipaddress.IPv4Address(ip))
+    if kind < 0.8:
+        return str(ipaddress.IPv4Network((ip, rnd.randint(24, 31)), strict=False))
+    return '{}-{}'.format(ipaddress.IPv4Address(ip), ipaddress.IPv4Address(ip + rnd.randrange(300)))
+
+
+def make_org(rnd: random.Random, iplists_count: int, workloads_count: int) -> pylo.Organization:
+    data = pylo.Organization.create_fake_empty_config()
+    data['iplists'] = [{'href': '/orgs/1/sec_policy/draft/ip_lists/{}'.format(index), 'name': 'IPL{}'.format(index),
+                        'ip_ranges': [{'from_ip': random_entry(rnd), 'exclusion': rnd.random() < 0.1}
+                                      for _ in range(rnd.randint(0, 4))]}
+                       for index in range(iplists_count)]
+    data['workloads'] = [{'href': '/orgs/1/workloads/{}'.format(index), 'name': 'WKL{}'.format(index),
+                          'hostname': 'wkl{}'.format(index), 'description': '', 'labels': [],
+                          'interfaces': [{'name': 'eth{}'.format(if_index), 'address': random_entry(rnd)}
+                                         for if_index in range(rnd.randint(0, 3))],
+                          'online': True, 'deleted': False, 'os_id': 'centos-x86_64-7', 'os_detail': '',
+                          'created_at': '2023-01-01T00:00:00.000Z',
+                          'agent': {'href': '/orgs/1/agents/{}'.format(index), 'status': {'agent_version': '22.5.0'},
+                                    'config': {'mode': 'idle'}}}
+                         for index in range(workloads_count)]
+    org = pylo.Organization(1)
+    org.pce_version = pylo.SoftwareVersion('23.2.0')
+    org.load_from_json(data)
+    return org
+
+
+def test_coverage_matches_subtraction():
+    """Test covered workloads and uncovered IPs against subtraction of workloads IP maps from each IPList"""
+    rnd = random.Random(1)
+    for _ in range(30):
+        org = make_org(rnd, rnd.randint(1, 8), rnd.randint(0, 15))
+        iplists = list(org.IPListStore.items_by_href.values())
+        workloads = list(org.WorkloadStore.itemsByHRef.values())
+        coverage_by_iplist = compute_iplists_coverage(iplists, workloads)
+
+        for iplist in iplists:
+            coverage = coverage_by_iplist[iplist]
+            ip_map = copy.deepcopy(iplist.get_ip4map())
+            iplist_array_map = pylo.IP4ArrayMap.from_ip4map(iplist.get_ip4map())
+            expected_workloads = []
+            for workload in workloads:
+                workload_map = workload.get_ip4map_from_interfaces()
+                ip_map.substract(workload_map)
+                if iplist_array_map.overlaps(pylo.IP4ArrayMap.from_ip4map(workload_map)):
+                    expected_workloads.append(workload)
+
+            assert iplist.get_ip4map().count_ips() - coverage.covered_ips_count == ip_map.count_ips()
+            assert coverage.workloads == expected_workloads
+
+
+def test_coverage_large_ranges():
+    """Test that interfaces holding large CIDRs are handled as intervals"""
+    data = pylo.Organization.create_fake_empty_config()
+    data['iplists'] = [{'href': '/orgs/1/sec_policy/draft/ip_lists/1', 'name': 'IPL1',
+                        'ip_ranges': [{'from_ip': '10.0.0.0/16'}, {'from_ip': '11.0.0.0-11.0.0.9'}]}]
+    org = pylo.Organization(1)
+    org.pce_version = pylo.SoftwareVersion('23.2.0')
+    org.load_from_json(data)
+    iplist = org.IPListStore.items_by_href['/orgs/1/sec_policy/draft/ip_lists/1']
+
+    class FakeInterface:
+        def __init__(self, ip: str):
+            self.ip = ip
+
+    workload = pylo.Workload('WKL1', '/orgs/1/workloads/1', org.WorkloadStore)
+    workload.interfaces = [FakeInterface('10.0.0.0/8'), FakeInterface('11.0.0.5')]
+    coverage = compute_iplists_coverage([iplist], [workload])[iplist]
+    assert coverage.workloads == [workload]
+    assert coverage.covered_ips_count == 65536 + 1
+
+
+if __name__ == '__main__':
+    test_coverage_matches_subtraction()
+    test_coverage_large_ranges()
+    print("All iplist-analyzer tests completed successfully!")
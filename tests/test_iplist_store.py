@@ -0,0 +1,181 @@
+"""
+Test script for the IPListStore IP index.
+
+Lookups are checked against a direct evaluation of the IPLists entries, without requiring a PCE connection.
+"""
+import ipaddress
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import illumio_pylo as pylo
+
+
+def make_iplist_json(iplist_id: int, ranges):
+    """ranges are (from_ip, to_ip, exclusion) tuples, to_ip can be None"""
+    ip_ranges = []
+    for from_ip, to_ip, exclusion in ranges:
+        ip_range = {'from_ip': from_ip, 'exclusion': exclusion}
+        if to_ip is not None:
+            ip_range['to_ip'] = to_ip
+        ip_ranges.append(ip_range)
+    return {'href': '/orgs/1/sec_policy/draft/ip_lists/{}'.format(iplist_id), 'name': 'IPL{}'.format(iplist_id),
+            'ip_ranges': ip_ranges}
+
+
+def make_org(iplists_json) -> pylo.Organization:
+    data = pylo.Organization.create_fake_empty_config()
+    data['iplists'] = iplists_json
+    org = pylo.Organization(1)
+    org.pce_version = pylo.SoftwareVersion('23.2.0')
+    org.load_from_json(data)
+    return org
+
+
+def entry_contains(entry: str, ip: ipaddress.IPv4Address) -> bool:
+    if '-' in entry:
+        start, end = entry.split('-')
+        start, end = ipaddress.ip_address(start), ipaddress.ip_address(end)
+        return start.version == 4 and start <= ip <= end
+    network = ipaddress.ip_network(entry, strict=False)
+    return network.version == 4 and ip in network
+
+
+def scan_iplists_containing_ip(org: pylo.Organization, ip: str):
+    ip = ipaddress.ip_address(ip)
+    results = set()
+    if ip.version != 4:
+        return results
+    for iplist in org.IPListStore.items_by_href.values():
+        # entries are applied in order, like IPList.ip4map does: an exclusion only removes IPs of previous entries
+        included = False
+        for entry in iplist.raw_entries:
+            if entry[0] == '!':
+                if entry_contains(entry[1:], ip):
+                    included = False
+            elif entry_contains(entry, ip):
+                included = True
+        if included:
+            results.add(iplist.href)
+    return results
+
+
+def sample_org() -> pylo.Organization:
+    return make_org([
+        make_iplist_json(1, [('10.0.0.0/24', None, False), ('10.0.0.128/25', None, True)]),
+        make_iplist_json(2, [('10.0.0.100', '10.0.1.10', False), ('10.0.0.200', None, True)]),
+        make_iplist_json(3, [('0.0.0.0/0', None, False), ('10.0.0.0/8', None, True), ('fe80::/64', None, False)]),
+        make_iplist_json(4, [('10.0.0.255', None, False), ('10.0.0.255', None, False)]),
+        make_iplist_json(5, [('fe80::1', None, False)]),
+        make_iplist_json(6, [('10.0.0.50', '10.0.0.60', False), ('10.0.0.0/16', None, True)]),
+    ])
+
+
+def test_ip_index_boundaries():
+    """Test lookups on both sides of every range boundary, with exclusions and overlapping IPLists"""
+    print("\n" + "=" * 60)
+    print("Testing IPListStore.IPIndex boundaries")
+    print("=" * 60)
+
+    org = sample_org()
+    store = org.IPListStore
+
+    boundaries = ['0.0.0.0', '255.255.255.255', '9.255.255.255', '10.0.0.0', '10.0.0.1', '10.0.0.49', '10.0.0.50',
+                  '10.0.0.60', '10.0.0.61', '10.0.0.99', '10.0.0.100', '10.0.0.127', '10.0.0.128', '10.0.0.199',
+                  '10.0.0.200', '10.0.0.201', '10.0.0.254', '10.0.0.255', '10.0.1.0', '10.0.1.10', '10.0.1.11',
+                  '10.255.255.255', '11.0.0.0']
+    for ip in boundaries:
+        expected = scan_iplists_containing_ip(org, ip)
+        found = store.find_iplists_containing_ip(ip)
+        assert len(found) == len(set(found)), "duplicates for {}".format(ip)
+        assert {iplist.href for iplist in found} == expected, \
+            "{}: {} != {}".format(ip, sorted(iplist.href for iplist in found), sorted(expected))
+        assert store.find_iplists_containing_ip(int(ipaddress.ip_address(ip))) == found, ip
+
+    href = '/orgs/1/sec_policy/draft/ip_lists/{}'.format
+    assert [iplist.href for iplist in store.find_iplists_containing_ip('10.0.0.127')] == [href(1), href(2)]
+    assert [iplist.href for iplist in store.find_iplists_containing_ip('10.0.0.128')] == [href(2)]
+    assert [iplist.href for iplist in store.find_iplists_containing_ip('10.0.0.200')] == []
+    assert [iplist.href for iplist in store.find_iplists_containing_ip('10.0.0.255')] == [href(2), href(4)]
+    assert [iplist.href for iplist in store.find_iplists_containing_ip('11.0.0.0')] == [href(3)]
+
+    # IPLists are only indexed for IPv4
+    assert store.find_iplists_containing_ip('fe80::1') == ()
+    assert store.find_iplists_containing_ip('not an ip') == ()
+
+    batch = store.find_iplists_containing_ips(boundaries + ['fe80::1', '10.0.0.1'])
+    assert set(batch.keys()) == set(boundaries + ['fe80::1'])
+    for ip in boundaries:
+        assert batch[ip] == store.find_iplists_containing_ip(ip), ip
+    assert batch['fe80::1'] == ()
+
+    print("\n✓ IPIndex boundary tests passed!")
+
+
+def test_ip_index_random():
+    """Test lookups of random IPs and of all range boundaries of random IPLists against a direct evaluation"""
+    print("\n" + "=" * 60)
+    print("Testing IPListStore.IPIndex against random IPLists")
+    print("=" * 60)
+
+    rnd = random.Random(17)
+    base = int(ipaddress.ip_address('192.168.0.0'))
+
+    def random_range():
+        start = base + rnd.randrange(1024)
+        kind = rnd.random()
+        if kind < 0.4:
+            return str(ipaddress.IPv4Address(start)), None
+        if kind < 0.7:
+            return str(ipaddress.IPv4Network((start, rnd.randint(24, 31)), strict=False)), None
+        return str(ipaddress.IPv4Address(start)), str(ipaddress.IPv4Address(start + rnd.randrange(200)))
+
+    iplists_json = []
+    for iplist_id in range(40):
+        ranges = []
+        for _ in range(rnd.randint(1, 5)):
+            from_ip, to_ip = random_range()
+            ranges.append((from_ip, to_ip, rnd.random() < 0.25))
+        iplists_json.append(make_iplist_json(iplist_id, ranges))
+    org = make_org(iplists_json)
+    store = org.IPListStore
+
+    ips = set()
+    for iplist in store.items_by_href.values():
+        for start, end in iplist.get_ip4map().ranges():
+            ips.update((start - 1, start, end, end + 1))
+    ips.update(base + rnd.randrange(1400) for _ in range(300))
+    ips = [str(ipaddress.IPv4Address(ip)) for ip in sorted(ips)]
+
+    batch = store.find_iplists_containing_ips(ips)
+    for ip in ips:
+        expected = scan_iplists_containing_ip(org, ip)
+        assert {iplist.href for iplist in store.find_iplists_containing_ip(ip)} == expected, ip
+        assert {iplist.href for iplist in batch[ip]} == expected, ip
+
+    print("\n✓ IPIndex random tests passed!")
+
+
+def test_ip_index_reset_on_load():
+    """Test that the index is rebuilt when more IPLists are loaded"""
+    org = sample_org()
+    store = org.IPListStore
+    assert store.find_iplists_containing_ip('172.16.0.1') == (store.find_by_href('/orgs/1/sec_policy/draft/ip_lists/3'),)
+
+    store.load_iplists_from_json([make_iplist_json(7, [('172.16.0.0', '172.16.0.1', False)])])
+    assert {iplist.href for iplist in store.find_iplists_containing_ip('172.16.0.1')} == \
+        {'/orgs/1/sec_policy/draft/ip_lists/3', '/orgs/1/sec_policy/draft/ip_lists/7'}
+    assert {iplist.href for iplist in store.find_iplists_containing_ip('172.16.0.2')} == \
+        {'/orgs/1/sec_policy/draft/ip_lists/3'}
+
+
+if __name__ == '__main__':
+    test_ip_index_boundaries()
+    test_ip_index_random()
+    test_ip_index_reset_on_load()
+
+    print("\n" + "=" * 60)
+    print("All IPListStore tests completed successfully!")
+    print("=" * 60)
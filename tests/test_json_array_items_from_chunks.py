@@ -0,0 +1,69 @@
+"""
+Test script for json_array_items_from_chunks().
+
+Valid arrays are split into chunks at every possible position and must give the same items as json.loads().
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import illumio_pylo as pylo
+
+
+def parse(chunks):
+    return list(pylo.json_array_items_from_chunks(chunks))
+
+
+def expect_error(chunks, message_part: str):
+    try:
+        parse(chunks)
+    except ValueError as e:
+        assert message_part in str(e), "unexpected error for {!r}: {}".format(chunks, e)
+        return
+    raise AssertionError("no error was raised for {!r}".format(chunks))
+
+
+def test_split_at_every_position():
+    """Test that items are the same wherever chunks are split, including inside numbers, literals and strings"""
+    text = ' [1.5, -2e-3, 10, 3E+2, true, false, null, "a\\"b\\u00e9", {"k": [1, {"x": 0.25}], "v": "é"}, [], {}, 7 ] \n'
+    expected = json.loads(text)
+    for split in range(len(text) + 1):
+        assert parse([text[:split], text[split:]]) == expected, "split at {}".format(split)
+        data = text.encode('utf-8')
+        assert parse([data[:split], data[split:]]) == expected, "bytes split at {}".format(split)
+
+    assert parse([c for c in text]) == expected
+    assert parse([bytes([b]) for b in text.encode('utf-8')]) == expected
+    assert parse(['[1.', '5]']) == [1.5]
+    assert parse(['[1', 'e', '-', '3]']) == [1e-3]
+    assert parse(['[]']) == [] and parse([' [ ', ' ] ', '\n']) == []
+
+
+def test_invalid_arrays():
+    """Test that malformed arrays are reported with a meaningful error, as soon as possible"""
+    expect_error(['[1,]'], "Unexpected ']' after ','")
+    expect_error(['[1,', ']'], "Unexpected ']' after ','")
+    expect_error(['[,1]'], "Invalid item")
+    expect_error(['[1] x'], "Unexpected data after the end")
+    expect_error(['[1]', ',[2]'], "Unexpected data after the end")
+    expect_error(['[1 2]'], "Unexpected character '2'")
+    expect_error(['{"a": 1}'], "not an array")
+    expect_error(['[1, 2'], "incomplete")
+    expect_error(['[1.'], "Unexpected character '.'")
+    expect_error(['[1, tru'], "Invalid item")
+    expect_error([''], "incomplete")
+
+    # malformed items must be reported right away rather than after buffering all the remaining data
+    def chunks_then_fail():
+        yield '[{"a": 1}, {"a": x, "b": 2}, '
+        yield ' ' * 100
+        raise AssertionError("data was read past a malformed item")
+    expect_error(chunks_then_fail(), "Invalid item")
+
+
+if __name__ == '__main__':
+    test_split_at_every_position()
+    test_invalid_arrays()
+    print("All json_array_items_from_chunks tests completed successfully!")
@@ -0,0 +1,89 @@
+"""
+Test script for PceCacheFile.
+
+Cache files are written to a temporary directory in both formats and read back.
+"""
+import json
+import marshal
+import os
+import struct
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import illumio_pylo as pylo
+
+
+def make_cache_content():
+    data = pylo.Organization.create_fake_empty_config()
+    data['labels'] = [{'href': '/orgs/1/labels/{}'.format(index), 'key': 'app', 'value': 'app{}'.format(index)}
+                      for index in range(50)]
+    data['workloads'] = [{'href': '/orgs/1/workloads/{}'.format(index), 'name': None, 'hostname': 'wkl{}'.format(index),
+                          'interfaces': [{'name': 'eth0', 'address': '10.0.0.{}'.format(index)}], 'online': index % 2 == 0,
+                          'labels': [{'href': '/orgs/1/labels/{}'.format(index % 50)}], 'description': 'é ü'}
+                         for index in range(200)]
+    data['label_dimensions'] = [{'href': '/orgs/1/label_dimensions/1', 'key': 'app', 'display_name': 'Application'}]
+    return {'pce_version': '23.2.0', 'generation_date': '2024-01-01T00:00:00Z', 'data': data}
+
+
+def write_binary_with_header(filename: str, header: dict):
+    header_bytes = json.dumps(header).encode('utf-8')
+    with open(filename, 'wb') as f:
+        f.write(pylo.PceCacheFile.binary_magic)
+        f.write(struct.pack('<I', len(header_bytes)))
+        f.write(header_bytes)
+
+
+def expect_error(filename: str, message_part: str):
+    try:
+        pylo.PceCacheFile.read(filename)
+    except pylo.PyloEx as e:
+        assert message_part in str(e), str(e)
+        return
+    raise AssertionError("no PyloEx was raised")
+
+
+def test_round_trip():
+    """Test that both formats give back the same content, and that binary files can be partially loaded"""
+    content = make_cache_content()
+    with tempfile.TemporaryDirectory() as directory:
+        for file_format in ('binary', 'json'):
+            filename = os.path.join(directory, pylo.PceCacheFile.get_filename('pce', file_format))
+            pylo.PceCacheFile.write(filename, content, file_format)
+            assert pylo.PceCacheFile.is_binary_file(filename) == (file_format == 'binary')
+            assert pylo.PceCacheFile.read(filename) == content
+
+        filename = os.path.join(directory, pylo.PceCacheFile.get_filename('pce', 'binary'))
+        partial = pylo.PceCacheFile.read(filename, ['labels'])
+        assert partial['pce_version'] == '23.2.0' and partial['generation_date'] == '2024-01-01T00:00:00Z'
+        assert partial['data']['labels'] == content['data']['labels']
+        assert partial['data']['label_dimensions'] == content['data']['label_dimensions']
+        assert partial['data']['workloads'] == []
+
+
+def test_version_mismatch():
+    """Test that binary files from another schema or a more recent Python are rejected"""
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'cache.bin')
+
+        write_binary_with_header(filename, {'schema_version': pylo.PceCacheFile.binary_schema_version + 1,
+                                            'marshal_version': marshal.version, 'sections': {}})
+        expect_error(filename, 'schema version')
+
+        write_binary_with_header(filename, {'schema_version': pylo.PceCacheFile.binary_schema_version,
+                                            'marshal_version': marshal.version + 1, 'sections': {}})
+        expect_error(filename, 'more recent Python version')
+
+        try:
+            pylo.PceCacheFile.write(filename, make_cache_content(), 'xml')
+        except pylo.PyloEx:
+            pass
+        else:
+            raise AssertionError("no PyloEx was raised for an unsupported format")
+
+
+if __name__ == '__main__':
+    test_round_trip()
+    test_version_mismatch()
+    print("All PceCacheFile tests completed successfully!")
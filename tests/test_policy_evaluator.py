@@ -0,0 +1,133 @@
+"""
+Test script for PolicyEvaluator.
+
+A small Organization is loaded from JSON so draft policy decisions can be checked without a PCE connection.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import illumio_pylo as pylo
+
+
+def make_label(label_id: int, key: str, value: str):
+    return {'href': '/orgs/1/labels/{}'.format(label_id), 'key': key, 'value': value}
+
+
+def make_workload(workload_id: int, ip: str, label_ids):
+    return {'href': '/orgs/1/workloads/{}'.format(workload_id), 'name': 'WKL{}'.format(workload_id),
+            'hostname': 'wkl{}.example.com'.format(workload_id), 'description': '',
+            'labels': [{'href': '/orgs/1/labels/{}'.format(label_id)} for label_id in label_ids],
+            'interfaces': [{'name': 'eth0', 'address': ip}], 'online': True, 'deleted': False,
+            'os_id': 'centos-x86_64-7', 'os_detail': '', 'created_at': '2023-01-01T00:00:00.000Z', 'agent': {}}
+
+
+def make_rule(rule_id: int, consumers, providers, services, unscoped_consumers=False, enabled=True):
+    return {'href': '/orgs/1/sec_policy/draft/rule_sets/1/sec_rules/{}'.format(rule_id), 'enabled': enabled,
+            'unscoped_consumers': unscoped_consumers, 'description': '', 'consumers': consumers,
+            'providers': providers, 'ingress_services': services, 'sec_connect': False, 'stateless': False,
+            'machine_auth': False, 'consuming_security_principals': []}
+
+
+def make_org() -> pylo.Organization:
+    data = pylo.Organization.create_fake_empty_config()
+    data['label_dimensions'] = [{'href': '/orgs/1/label_dimensions/{}'.format(index), 'key': key,
+                                 'display_name': key.capitalize()}
+                                for index, key in enumerate(['role', 'app', 'env', 'loc'])]
+    data['labels'] = [make_label(1, 'role', 'web'), make_label(2, 'role', 'db'), make_label(3, 'app', 'shop'),
+                      make_label(4, 'app', 'crm'), make_label(5, 'env', 'prod')]
+    data['labelgroups'] = [{'href': '/orgs/1/sec_policy/draft/label_groups/1', 'key': 'app', 'name': 'all apps',
+                            'labels': [{'href': '/orgs/1/labels/3'}, {'href': '/orgs/1/labels/4'}], 'sub_groups': []}]
+    data['iplists'] = [{'href': '/orgs/1/sec_policy/draft/ip_lists/1', 'name': 'admins',
+                        'ip_ranges': [{'from_ip': '192.168.0.0/24'}, {'from_ip': '192.168.0.128/25', 'exclusion': True}]},
+                       {'href': '/orgs/1/sec_policy/draft/ip_lists/2', 'name': 'backup',
+                        'ip_ranges': [{'from_ip': '172.16.0.10'}]}]
+    data['services'] = [{'href': '/orgs/1/sec_policy/draft/services/1', 'name': 'https', 'description': '',
+                         'process_name': None, 'deleted_at': None,
+                         'service_ports': [{'proto': 6, 'port': 8000, 'to_port': 8100}, {'proto': 6, 'port': 8443}]}]
+    data['workloads'] = [make_workload(1, '10.0.0.1', [1, 3, 5]),  # web shop prod
+                         make_workload(2, '10.0.0.2', [2, 3, 5]),  # db shop prod
+                         make_workload(3, '10.0.0.3', [1, 4, 5]),  # web crm prod
+                         make_workload(4, '10.0.0.4', [2, 4, 5])]  # db crm prod
+    rules = [
+        # web -> db on https, inside each app
+        make_rule(1, [{'label': {'href': '/orgs/1/labels/1'}}], [{'label': {'href': '/orgs/1/labels/2'}}],
+                  [{'href': '/orgs/1/sec_policy/draft/services/1'}]),
+        # admins -> all workloads on ssh, inside each app
+        make_rule(2, [{'ip_list': {'href': '/orgs/1/sec_policy/draft/ip_lists/1'}}], [{'actors': 'ams'}],
+                  [{'proto': 6, 'port': 22}]),
+        # web workloads of any app (extra-scope) -> db of the scope on 5432
+        make_rule(3, [{'label': {'href': '/orgs/1/labels/1'}},
+                      {'label_group': {'href': '/orgs/1/sec_policy/draft/label_groups/1'}}],
+                  [{'label': {'href': '/orgs/1/labels/2'}}],
+                  [{'proto': 6, 'port': 5432}], unscoped_consumers=True),
+        # workloads -> backup IPList
+        make_rule(4, [{'actors': 'ams'}], [{'ip_list': {'href': '/orgs/1/sec_policy/draft/ip_lists/2'}}],
+                  [{'proto': 17, 'port': 514}]),
+        make_rule(5, [{'actors': 'ams'}], [{'actors': 'ams'}], [{'proto': 6, 'port': 80}], enabled=False),
+    ]
+    data['rulesets'] = [{'href': '/orgs/1/sec_policy/draft/rule_sets/1', 'name': 'RS1', 'enabled': True,
+                         'description': '', 'rules': rules,
+                         'scopes': [[{'label': {'href': '/orgs/1/labels/3'}}, {'label': {'href': '/orgs/1/labels/5'}}],
+                                    [{'label': {'href': '/orgs/1/labels/4'}}, {'label': {'href': '/orgs/1/labels/5'}}]]}]
+
+    org = pylo.Organization(1)
+    org.pce_version = pylo.SoftwareVersion('23.2.0')
+    org.load_from_json(data)
+    return org
+
+
+def test_policy_evaluator():
+    """Test draft policy decisions and matching rules"""
+    org = make_org()
+    evaluator = pylo.PolicyEvaluator(org)
+    workloads = {workload.name: workload for workload in org.WorkloadStore.workloads}
+    web_shop, db_shop, web_crm, db_crm = workloads['WKL1'], workloads['WKL2'], workloads['WKL3'], workloads['WKL4']
+
+    def rule_ids(result: pylo.PolicyEvaluator.Result):
+        return sorted(int(href.split('/')[-1]) for href in result.get_rules_href())
+
+    # intra-scope: consumer and provider must be in the same scope
+    assert rule_ids(evaluator.evaluate(web_shop, db_shop, 6, 8443)) == [1]
+    assert rule_ids(evaluator.evaluate(web_shop, db_shop, 6, 8050)) == [1]
+    assert evaluator.evaluate(web_shop, db_shop, 6, 9000).decision == 'blocked'
+    assert evaluator.evaluate(web_shop, db_crm, 6, 8443).decision == 'blocked'
+    assert evaluator.evaluate(db_shop, web_shop, 6, 8443).decision == 'blocked'
+
+    # extra-scope: consumers can be outside of the scope
+    assert rule_ids(evaluator.evaluate(web_crm, db_shop, 6, 5432)) == [3]
+    assert evaluator.evaluate(db_crm, db_shop, 6, 5432).decision == 'blocked'
+
+    # IPLists, exclusions included
+    assert rule_ids(evaluator.evaluate('192.168.0.5', db_crm, 6, 22)) == [2]
+    assert evaluator.evaluate('192.168.0.200', db_crm, 6, 22).decision == 'blocked'
+    assert rule_ids(evaluator.evaluate(web_crm, '172.16.0.10', 17, 514)) == [4]
+    assert evaluator.evaluate(web_crm, '172.16.0.11', 17, 514).decision == 'blocked'
+
+    # disabled rules are ignored
+    assert evaluator.evaluate(web_shop, db_shop, 6, 80).decision == 'blocked'
+
+
+def test_port_map_matches():
+    """Test PortMap lookups, including ranges nested in other ranges"""
+    port_map = pylo.PortMap()
+    port_map.add(6, 100, 200, skip_recalculation=True)
+    port_map.add(6, 120, 130, skip_recalculation=True)
+    port_map.add(17, 53, skip_recalculation=True)
+    port_map.add(1, None)
+    port_map.merge_overlapping_maps()
+
+    assert port_map.matches(6, 100) and port_map.matches(6, 150) and port_map.matches(6, 200)
+    assert not port_map.matches(6, 99) and not port_map.matches(6, 201) and not port_map.matches(6, 53)
+    assert port_map.matches(17, 53) and not port_map.matches(17, 54)
+    assert port_map.matches(1) and not port_map.matches(50)
+
+    port_map.add(-1, None)
+    assert port_map.matches(50) and port_map.matches(6, 1)
+
+
+if __name__ == '__main__':
+    test_policy_evaluator()
+    test_port_map_matches()
+    print("All PolicyEvaluator tests completed successfully!")
@@ -0,0 +1,98 @@
+"""
+Test script for APIRateLimiter.
+
+A fake clock replaces time.monotonic() and time.sleep() so pacing can be checked instantly.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from illumio_pylo.API.RateLimiter import APIRateLimiter, default_rate_decrease_factor
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+def make_limiter(clock: FakeClock, **kwargs) -> APIRateLimiter:
+    return APIRateLimiter(clock=clock.time, sleep=clock.sleep, **kwargs)
+
+
+def test_budget_learnt_from_first_429():
+    """Test that there is no pacing until a 429, then the budget is estimated from calls of the last minute"""
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+    for _ in range(400):
+        limiter.acquire()
+        limiter.report_success()
+        clock.now += 0.1
+    assert limiter.calls_per_minute is None and abs(clock.now - 1040) < 1e-6
+
+    limiter.report_too_many_requests()
+    assert limiter.calls_per_minute == 400 * default_rate_decrease_factor
+    assert limiter.too_many_requests_count == 1
+
+    limiter.report_too_many_requests()
+    assert limiter.calls_per_minute == 400 * default_rate_decrease_factor ** 2
+
+
+def test_budget_grows_back_with_time():
+    """Test that the budget recovers by rate_increase_per_minute for each minute without 429, whatever the number of calls"""
+    clock = FakeClock()
+    limiter = make_limiter(clock, calls_per_minute=500, rate_increase_per_minute=20, maximum_calls_per_minute=500)
+    limiter.report_too_many_requests()
+    assert limiter.calls_per_minute == 375
+
+    # a single call after 2 minutes is enough
+    clock.now += 120
+    limiter.report_success()
+    assert abs(limiter.calls_per_minute - 415) < 1e-9
+
+    # many calls within the same instant don't raise it further
+    for _ in range(1000):
+        limiter.report_success()
+    assert abs(limiter.calls_per_minute - 415) < 1e-9
+
+    # a new 429 resets the recovery
+    limiter.report_too_many_requests()
+    clock.now += 30
+    limiter.report_success()
+    assert abs(limiter.calls_per_minute - (415 * default_rate_decrease_factor + 10)) < 1e-9
+
+    clock.now += 3600
+    limiter.report_success()
+    assert limiter.calls_per_minute == 500
+
+
+def test_bounds_and_retry_after():
+    """Test the minimum budget, pacing of calls and Retry-After delays"""
+    clock = FakeClock()
+    limiter = make_limiter(clock, calls_per_minute=12, minimum_calls_per_minute=10, burst_seconds=5)
+    limiter.report_too_many_requests()
+    assert limiter.calls_per_minute == 10
+
+    # the bucket is empty after a 429, then calls are spaced by 6 seconds
+    start = clock.now
+    for _ in range(5):
+        limiter.acquire()
+    assert abs(clock.now - start - 30) < 1e-6
+
+    limiter.report_too_many_requests(retry_after=50)
+    start = clock.now
+    limiter.acquire()
+    assert clock.now - start >= 50
+
+
+if __name__ == '__main__':
+    test_budget_learnt_from_first_429()
+    test_budget_grows_back_with_time()
+    test_bounds_and_retry_after()
+    print("All APIRateLimiter tests completed successfully!")
@@ -0,0 +1,130 @@
+"""
+Test script for the batching of rule_coverage queries.
+
+Batches are executed by fake query managers recording what they were given, so no PCE connection is needed.
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import illumio_pylo as pylo
+
+BatchSizeController = pylo.RuleCoverageQueryManager.BatchSizeController
+
+
+class FakeQueryManager:
+    """Records the batches it executes, raises when the batch number fail_on_batch (global count) is executed"""
+
+    def __init__(self, name: str, queries_count: int, calls: list, calls_lock: threading.Lock, fail_on_batch=None):
+        self.queries = {'{}-{}'.format(name, index): '{}-{}'.format(name, index) for index in range(queries_count)}
+        self.calls = calls
+        self.calls_lock = calls_lock
+        self.fail_on_batch = fail_on_batch
+
+    def execute_batch(self, connector, query_batch):
+        with self.calls_lock:
+            self.calls.append(list(query_batch))
+            batch_number = len(self.calls)
+        if batch_number == self.fail_on_batch:
+            raise pylo.PyloEx('rule_coverage call #{} failed'.format(batch_number))
+
+
+def test_batch_size_bounds():
+    """Test that batch sizes grow with quick calls, shrink with slow ones and stay within bounds"""
+    controller = BatchSizeController(initial_size=100, min_size=10, max_size=200, target_call_duration=10.0)
+    assert controller.batch_size == 100
+
+    # quick calls: grows by at most 2x at a time, never above max_size
+    controller.report_call(100, 1.0)
+    assert 100 < controller.batch_size <= 200
+    previous_size = controller.batch_size
+    for _ in range(10):
+        controller.report_call(controller.batch_size, 0.1)
+        assert previous_size <= controller.batch_size <= min(200, previous_size * 2)
+        previous_size = controller.batch_size
+    assert controller.batch_size == 200
+
+    # calls right on target keep the size stable
+    controller.report_call(200, 10.0)
+    assert controller.batch_size == 200
+
+    # slow calls: shrinks, never below min_size
+    controller.report_call(200, 40.0)
+    assert controller.batch_size == 125
+    for _ in range(20):
+        controller.report_call(controller.batch_size, 1000.0)
+        assert controller.batch_size >= 10
+    assert controller.batch_size == 10
+
+    # durations which cannot be measured are ignored
+    controller.report_call(10, 0)
+    assert controller.batch_size == 10
+
+    # initial size is clamped too
+    assert BatchSizeController(initial_size=5000, min_size=10, max_size=200).batch_size == 200
+    assert BatchSizeController(initial_size=1, min_size=10, max_size=200).batch_size == 10
+    assert BatchSizeController().batch_size == 100
+
+
+def test_execute_batches_covers_all_queries():
+    """Test that every query is executed exactly once, in batches no larger than the controller's size"""
+    for max_concurrent_batches in (1, 4):
+        calls = []
+        calls_lock = threading.Lock()
+        managers = [FakeQueryManager('a', 95, calls, calls_lock), FakeQueryManager('empty', 0, calls, calls_lock),
+                    FakeQueryManager('b', 31, calls, calls_lock)]
+        controller = BatchSizeController(initial_size=10, min_size=10, max_size=10)
+
+        pylo.RuleCoverageQueryManager.execute_batches(None, managers, controller, max_concurrent_batches)
+
+        executed = [query for batch in calls for query in batch]
+        assert sorted(executed) == sorted(list(managers[0].queries) + list(managers[2].queries))
+        assert len(executed) == len(set(executed))
+        assert all(0 < len(batch) <= 10 for batch in calls)
+        # a batch never mixes queries of several managers
+        assert all(len({query.split('-')[0] for query in batch}) == 1 for batch in calls)
+        assert len(calls) == 10 + 4
+
+    try:
+        pylo.RuleCoverageQueryManager.execute_batches(None, [], BatchSizeController(), 0)
+        assert False, "max_concurrent_batches of 0 should be rejected"
+    except pylo.PyloEx:
+        pass
+
+
+def test_execute_batches_stops_on_failure():
+    """Test that no new batch is started once one failed and that the error is raised"""
+    # sequential: nothing runs after the failed batch
+    calls = []
+    calls_lock = threading.Lock()
+    managers = [FakeQueryManager('a', 100, calls, calls_lock, fail_on_batch=3)]
+    try:
+        pylo.RuleCoverageQueryManager.execute_batches(None, managers, BatchSizeController(10, 10, 10), 1)
+        assert False, "the failure should have been raised"
+    except pylo.PyloEx as e:
+        assert 'call #3 failed' in str(e)
+    assert len(calls) == 3
+
+    # concurrent: batches already picked by other workers can still complete, but the remaining ones are skipped
+    max_concurrent_batches = 4
+    calls = []
+    managers = [FakeQueryManager('a', 1000, calls, calls_lock, fail_on_batch=5)]
+    try:
+        pylo.RuleCoverageQueryManager.execute_batches(None, managers, BatchSizeController(10, 10, 10),
+                                                      max_concurrent_batches)
+        assert False, "the failure should have been raised"
+    except pylo.PyloEx as e:
+        assert 'call #5 failed' in str(e)
+    assert 5 <= len(calls) < 50
+
+
+if __name__ == '__main__':
+    test_batch_size_bounds()
+    test_execute_batches_covers_all_queries()
+    test_execute_batches_stops_on_failure()
+
+    print("\n" + "=" * 60)
+    print("All rule coverage batching tests completed successfully!")
+    print("=" * 60)
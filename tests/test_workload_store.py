@@ -0,0 +1,408 @@
+"""
+Test script for the WorkloadStore lookup indexes.
+
+This script checks that indexed lookups give the same results as a linear scan of the Workloads, including after
+Workloads were changed, without requiring a PCE connection.
+"""
+import ipaddress
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import illumio_pylo as pylo
+
+
+def make_org(workloads_json) -> pylo.Organization:
+    """Builds an Organization from JSON with the given workloads and a few labels"""
+    data = pylo.Organization.create_fake_empty_config()
+    data['label_dimensions'] = [{'href': '/orgs/1/label_dimensions/{}'.format(index), 'key': key,
+                                 'display_name': key.capitalize()}
+                                for index, key in enumerate(['role', 'app', 'env', 'loc'])]
+    data['labels'] = [{'href': '/orgs/1/labels/1', 'key': 'role', 'value': 'Web'},
+                      {'href': '/orgs/1/labels/2', 'key': 'role', 'value': 'DB'},
+                      {'href': '/orgs/1/labels/3', 'key': 'env', 'value': 'Prod'},
+                      {'href': '/orgs/1/labels/4', 'key': 'env', 'value': 'Dev'},
+                      {'href': '/orgs/1/labels/5', 'key': 'app', 'value': 'Shop'}]
+    data['labelgroups'] = [{'href': '/orgs/1/sec_policy/draft/label_groups/1', 'key': 'role', 'name': 'All Roles',
+                            'labels': [{'href': '/orgs/1/labels/1'}, {'href': '/orgs/1/labels/2'}]}]
+    data['workloads'] = workloads_json
+    org = pylo.Organization(1)
+    org.pce_version = pylo.SoftwareVersion('23.2.0')
+    org.load_from_json(data)
+    return org
+
+
+def make_workload_json(workload_id: int, name, hostname, ips, label_ids, managed=True, deleted=False):
+    agent = {}
+    if managed:
+        agent = {'href': '/orgs/1/agents/{}'.format(workload_id), 'status': {'agent_version': '22.5.0'},
+                 'config': {'mode': 'idle'}}
+    return {'href': '/orgs/1/workloads/{}'.format(workload_id), 'name': name, 'hostname': hostname,
+            'description': '', 'labels': [{'href': '/orgs/1/labels/{}'.format(label_id)} for label_id in label_ids],
+            'interfaces': [{'name': 'eth{}'.format(index), 'address': ip} for index, ip in enumerate(ips)],
+            'online': managed, 'deleted': deleted, 'os_id': 'centos-x86_64-7', 'os_detail': '',
+            'created_at': '2023-01-01T00:00:00.000Z', 'agent': agent}
+
+
+def sample_org() -> pylo.Organization:
+    return make_org([
+        make_workload_json(1, 'WKL1', 'wkl1.example.com', ['10.0.0.1'], [1, 3]),
+        make_workload_json(2, None, 'WKL2.example.com', ['10.0.0.2', '10.0.1.2'], [2, 3]),
+        make_workload_json(3, 'WKL3', None, ['10.0.0.3', 'fe80::3'], [1, 4], managed=False),
+        make_workload_json(4, 'Wkl1', 'wkl4.example.com', ['10.0.0.255'], [2], deleted=True),
+        make_workload_json(5, 'WKL5', 'wkl1.other.com', ['10.0.1.0', '10.0.0.1'], [1, 5]),
+    ])
+
+
+def scan_forced_name(store: pylo.WorkloadStore, name: str, case_sensitive: bool, strip_fqdn: bool):
+    results = []
+    for workload in store.itemsByHRef.values():
+        candidate = workload.forced_name
+        if candidate is None:
+            continue
+        if strip_fqdn:
+            candidate = pylo.Workload.static_name_stripped_fqdn(candidate)
+        if not case_sensitive:
+            candidate, name = candidate.lower(), name.lower()
+        if candidate == name:
+            results.append(workload)
+    return results
+
+
+def scan_hostname(store: pylo.WorkloadStore, name: str, case_sensitive: bool, strip_fqdn: bool, fall_back_to_name: bool):
+    results = []
+    for workload in store.itemsByHRef.values():
+        candidate = workload.hostname
+        if candidate is None and fall_back_to_name:
+            candidate = workload.forced_name
+        if candidate is None:
+            continue
+        if strip_fqdn:
+            candidate = pylo.Workload.static_name_stripped_fqdn(candidate)
+        if not case_sensitive:
+            candidate, name = candidate.lower(), name.lower()
+        if candidate == name:
+            results.append(workload)
+    return results
+
+
+def check_name_lookups(store: pylo.WorkloadStore, names):
+    for name in names:
+        for case_sensitive in (True, False):
+            for strip_fqdn in (True, False):
+                expected = scan_forced_name(store, name, case_sensitive, strip_fqdn)
+                found = store.find_workload_matching_forced_name(name, case_sensitive, strip_fqdn)
+                assert found is (expected[0] if len(expected) > 0 else None), \
+                    "forced name '{}' case_sensitive={} strip_fqdn={}".format(name, case_sensitive, strip_fqdn)
+
+                for fall_back_to_name in (True, False):
+                    expected = scan_hostname(store, name, case_sensitive, strip_fqdn, fall_back_to_name)
+                    found = store.find_all_workloads_matching_hostname(name, case_sensitive, strip_fqdn,
+                                                                       fall_back_to_name)
+                    assert sorted(w.href for w in found) == sorted(w.href for w in expected), \
+                        "hostname '{}' case_sensitive={} strip_fqdn={} fall_back_to_name={}: {} != {}".format(
+                            name, case_sensitive, strip_fqdn, fall_back_to_name,
+                            [w.href for w in found], [w.href for w in expected])
+
+
+def test_name_indexes_follow_updates():
+    """Test that name lookups match a linear scan before and after hostnames and names are changed"""
+    print("\n" + "=" * 60)
+    print("Testing name indexes")
+    print("=" * 60)
+
+    org = sample_org()
+    store = org.WorkloadStore
+    names = ['WKL1', 'wkl1', 'wkl1.example.com', 'WKL2.example.com', 'wkl2', 'WKL3', 'wkl3', 'renamed',
+             'renamed.example.com', 'wkl5', 'WKL5', 'new.host.com', 'new']
+
+    # builds all indexes
+    check_name_lookups(store, names)
+
+    wkl1 = store.find_by_href_or_die('/orgs/1/workloads/1')
+    wkl3 = store.find_by_href_or_die('/orgs/1/workloads/3')
+    wkl5 = store.find_by_href_or_die('/orgs/1/workloads/5')
+    for workload in (wkl1, wkl3, wkl5):
+        workload.api_stacked_updates_start()
+
+    wkl1.api_update_hostname('renamed.example.com')
+    wkl1.api_update_forced_name('Renamed')
+    wkl3.api_update_hostname('new.host.com')
+    wkl5.api_update_forced_name('wkl3')
+
+    assert store.find_workload_matching_hostname('wkl1.example.com') is None
+    assert store.find_workload_matching_hostname('renamed', case_sensitive=False, strip_fqdn=True) is wkl1
+    # WKL3 now has a hostname, which takes precedence over its name
+    assert store.find_workload_matching_hostname('WKL3', fall_back_to_name=True) is None
+    assert store.find_workload_matching_forced_name('wkl3') is wkl5
+    check_name_lookups(store, names)
+
+    # workloads added after the indexes were built must be found too
+    store.load_workloads_from_json([make_workload_json(6, 'WKL6', 'wkl1.example.com', ['10.0.2.6'], [])])
+    wkl6 = store.find_by_href_or_die('/orgs/1/workloads/6')
+    assert store.find_workload_matching_hostname('wkl1.example.com') is wkl6
+    check_name_lookups(store, names + ['WKL6', 'wkl6'])
+
+    print("\n✓ Name index tests passed!")
+
+
+def scan_ip_range(store: pylo.WorkloadStore, start: str, end: str):
+    start, end = ipaddress.ip_address(start), ipaddress.ip_address(end)
+    results = set()
+    for workload in store.itemsByHRef.values():
+        for interface in workload.interfaces:
+            ip = ipaddress.ip_address(interface.ip)
+            if ip.version == start.version and start <= ip <= end:
+                results.add(workload.href)
+    return results
+
+
+def check_ip_lookups(store: pylo.WorkloadStore):
+    ips = ['10.0.0.0', '10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.255', '10.0.1.0', '10.0.1.2', '10.0.2.6',
+           'fe80::3', '192.168.0.1']
+    for ip in ips:
+        expected = scan_ip_range(store, ip, ip)
+        assert sorted(w.href for w in store.find_workloads_matching_ip(ip)) == sorted(expected), ip
+        assert len(store.find_workloads_matching_ip(ip)) == len(expected), "duplicates for {}".format(ip)
+    batch = store.find_workloads_matching_ips(ips)
+    for ip in ips:
+        expected = scan_ip_range(store, ip, ip)
+        if len(expected) == 0:
+            assert ip not in batch, ip
+        else:
+            assert sorted(w.href for w in batch[ip]) == sorted(expected), ip
+
+    ranges = {
+        '10.0.0.0/24': ('10.0.0.0', '10.0.0.255'),
+        '10.0.0.1/32': ('10.0.0.1', '10.0.0.1'),
+        '10.0.0.2/31': ('10.0.0.2', '10.0.0.3'),
+        '10.0.0.1-10.0.0.2': ('10.0.0.1', '10.0.0.2'),
+        '10.0.0.4-10.0.0.254': ('10.0.0.4', '10.0.0.254'),
+        '10.0.0.255-10.0.1.0': ('10.0.0.255', '10.0.1.0'),
+        '10.0.1.1 - 10.0.1.255': ('10.0.1.1', '10.0.1.255'),
+        '10.0.2.6': ('10.0.2.6', '10.0.2.6'),
+        '0.0.0.0/0': ('0.0.0.0', '255.255.255.255'),
+        'fe80::/64': ('fe80::', 'fe80::ffff:ffff:ffff:ffff'),
+        'fe80::4-fe80::ff': ('fe80::4', 'fe80::ff'),
+    }
+    for ip_range, (start, end) in ranges.items():
+        assert set(store.find_workloads_in_ip_range(ip_range).keys()) == scan_ip_range(store, start, end), ip_range
+
+
+def test_ip_indexes_follow_updates():
+    """Test that IP lookups match a linear scan at range boundaries, also after Workloads were changed or added"""
+    print("\n" + "=" * 60)
+    print("Testing IP indexes")
+    print("=" * 60)
+
+    org = sample_org()
+    store = org.WorkloadStore
+
+    # builds the exact and sorted indexes
+    check_ip_lookups(store)
+
+    # re-indexing a Workload after a change must not duplicate or lose its IP addresses
+    wkl5 = store.find_by_href_or_die('/orgs/1/workloads/5')
+    wkl5.api_stacked_updates_start()
+    wkl5.api_update_hostname('wkl5.example.com')
+    wkl5.update_labels([org.LabelStore.find_by_href('/orgs/1/labels/2')])
+    check_ip_lookups(store)
+
+    store.load_workloads_from_json([make_workload_json(6, 'WKL6', 'wkl6.example.com', ['10.0.2.6', '10.0.0.0'], [])])
+    wkl6 = store.find_by_href_or_die('/orgs/1/workloads/6')
+    assert store.find_workloads_matching_ip('10.0.2.6') == [wkl6]
+    assert wkl6.href in store.find_workloads_in_ip_range('10.0.0.0-10.0.0.0')
+    check_ip_lookups(store)
+
+    try:
+        store.find_workloads_in_ip_range('10.0.0.1-fe80::1')
+        assert False, "mixed IP versions should be rejected"
+    except pylo.PyloEx:
+        pass
+    try:
+        store.find_workloads_in_ip_range('10.0.0/8x')
+        assert False, "invalid range should be rejected"
+    except pylo.PyloEx:
+        pass
+
+    print("\n✓ IP index tests passed!")
+
+
+def scan_all_labels(store: pylo.WorkloadStore, labels):
+    labels_by_type = {}
+    for label in labels:
+        members = label.expand_nested_to_dict_by_href().values() if label.is_group() else [label]
+        labels_by_type.setdefault(label.type, set()).update(members)
+    return {workload.href for workload in store.itemsByHRef.values()
+            if all(workload.get_label(label_type) in members for label_type, members in labels_by_type.items())}
+
+
+def check_label_lookups(org: pylo.Organization):
+    store = org.WorkloadStore
+    label_store = org.LabelStore
+    labels = {label_id: label_store.find_by_href('/orgs/1/labels/{}'.format(label_id)) for label_id in range(1, 6)}
+    group = label_store.find_by_href('/orgs/1/sec_policy/draft/label_groups/1')
+
+    for label in labels.values():
+        expected = {w.href for w in store.itemsByHRef.values() if label in w.get_labels()}
+        assert set(store.find_workloads_matching_label(label).keys()) == expected, label.name
+    expected = {w.href for w in store.itemsByHRef.values() if w.get_label('role') is not None}
+    assert set(store.find_workloads_matching_label(group).keys()) == expected
+
+    combinations = [
+        [labels[1]],
+        [labels[1], labels[3]],
+        [labels[1], labels[2], labels[3]],
+        [labels[2], labels[4]],
+        [labels[1], labels[5]],
+        [group, labels[3]],
+        [group, labels[4], labels[5]],
+    ]
+    for combination in combinations:
+        expected = scan_all_labels(store, combination)
+        assert set(store.find_workloads_matching_all_labels(combination).keys()) == expected, \
+            [label.name for label in combination]
+        by_type = {label.type: label for label in combination}
+        if len(by_type) == len(combination):
+            assert set(store.find_workloads_matching_all_labels(by_type).keys()) == expected
+
+    assert set(store.find_workloads_matching_all_labels([None]).keys()) == set(store.itemsByHRef.keys())
+
+
+def test_label_index_follows_updates():
+    """Test that label lookups match a linear scan, including LabelGroups, after Workloads labels were changed"""
+    print("\n" + "=" * 60)
+    print("Testing label index")
+    print("=" * 60)
+
+    org = sample_org()
+    store = org.WorkloadStore
+    label_store = org.LabelStore
+    web = label_store.find_by_href('/orgs/1/labels/1')
+    db = label_store.find_by_href('/orgs/1/labels/2')
+    dev = label_store.find_by_href('/orgs/1/labels/4')
+    shop = label_store.find_by_href('/orgs/1/labels/5')
+
+    # builds the index
+    check_label_lookups(org)
+
+    wkl1 = store.find_by_href_or_die('/orgs/1/workloads/1')
+    wkl2 = store.find_by_href_or_die('/orgs/1/workloads/2')
+    wkl5 = store.find_by_href_or_die('/orgs/1/workloads/5')
+
+    assert wkl1.update_labels([db, dev])
+    assert wkl1.href not in store.find_workloads_matching_label(web)
+    assert wkl1.href in store.find_workloads_matching_all_labels([db, dev])
+    # only replaces the role, env label is kept
+    assert wkl2.update_labels([web], missing_label_type_means_no_change=True)
+    assert wkl5.update_labels([shop])
+    assert wkl5.href not in store.find_workloads_matching_label(web)
+    check_label_lookups(org)
+
+    store.load_workloads_from_json([make_workload_json(6, 'WKL6', 'wkl6.example.com', ['10.0.2.6'], [2, 4, 5])])
+    assert '/orgs/1/workloads/6' in store.find_workloads_matching_all_labels([db, dev, shop])
+    check_label_lookups(org)
+
+    print("\n✓ Label index tests passed!")
+
+
+def large_org() -> pylo.Organization:
+    """Enough workloads for rarely used labels to be stored as position arrays rather than bitsets"""
+    workloads_json = []
+    for workload_id in range(1, 101):
+        label_ids = []
+        if workload_id % 3 != 2:
+            label_ids.append(1 if workload_id % 3 == 0 else 2)
+        label_ids.append(3 if workload_id % 2 == 0 else 4)
+        if workload_id in (7, 8):
+            label_ids.append(5)
+        workloads_json.append(make_workload_json(workload_id, 'WKL{}'.format(workload_id), None,
+                                                 ['10.1.0.{}'.format(workload_id)], label_ids,
+                                                 deleted=workload_id % 10 == 0))
+    return make_org(workloads_json)
+
+
+def check_label_scopes(org: pylo.Organization):
+    label_store = org.LabelStore
+    labels = {label_id: label_store.find_by_href('/orgs/1/labels/{}'.format(label_id)) for label_id in range(1, 6)}
+    group = label_store.find_by_href('/orgs/1/sec_policy/draft/label_groups/1')
+    active_hrefs = {w.href for w in org.WorkloadStore.itemsByHRef.values() if not w.deleted}
+
+    scopes = [
+        [],
+        [labels[1]],
+        [labels[5]],
+        [labels[1], labels[3]],
+        [labels[1], labels[2], labels[4]],
+        [labels[5], labels[4]],
+        [labels[5], labels[1], labels[3]],
+        [group, labels[3]],
+        [group, labels[5], None],
+    ]
+    for scope in scopes:
+        expected = scan_all_labels(org.WorkloadStore, [label for label in scope if label is not None]) & active_hrefs
+        found = [w.href for w in label_store.get_workloads_matching_label_scope(scope)]
+        assert len(found) == len(set(found)), "duplicates for {}".format(scope)
+        assert set(found) == expected, [label.name for label in scope if label is not None]
+
+    expected = scan_all_labels(org.WorkloadStore, [labels[2], labels[5]]) & active_hrefs
+    found = label_store.get_workloads_by_label_scope(role=labels[2], app=labels[5])
+    assert {w.href for w in found} == expected
+    found = label_store.get_workloads_by_label_scope(env=labels[3], other_labels=[group])
+    assert {w.href for w in found} == scan_all_labels(org.WorkloadStore, [labels[3], group]) & active_hrefs
+
+
+def test_label_resolution_cache_invalidation():
+    """Test that label scopes resolution matches a linear scan, and is refreshed when Workloads are changed or added"""
+    print("\n" + "=" * 60)
+    print("Testing LabelResolutionCache")
+    print("=" * 60)
+
+    org = large_org()
+    store = org.WorkloadStore
+    label_store = org.LabelStore
+    web = label_store.find_by_href('/orgs/1/labels/1')
+    prod = label_store.find_by_href('/orgs/1/labels/3')
+    shop = label_store.find_by_href('/orgs/1/labels/5')
+
+    check_label_scopes(org)
+    cache = label_store.label_resolution_cache
+    assert cache is not None
+    # 'Shop' is rare enough to be stored as positions, 'Prod' is stored as a bitset
+    assert cache.label_ids[shop] in cache.postings
+    assert cache.label_ids[prod] in cache.bitsets
+    # the cache is reused as long as workloads don't change
+    label_store.get_workloads_matching_label_scope([web])
+    assert label_store.label_resolution_cache is cache
+
+    wkl9 = store.find_by_href_or_die('/orgs/1/workloads/9')
+    assert wkl9.update_labels([shop, prod])
+    assert label_store.label_resolution_cache is None
+    assert wkl9 in label_store.get_workloads_matching_label_scope([shop, prod])
+    assert wkl9 not in label_store.get_workloads_matching_label_scope([web])
+    check_label_scopes(org)
+
+    wkl7 = store.find_by_href_or_die('/orgs/1/workloads/7')
+    wkl7.api_stacked_updates_start()
+    wkl7.api_update_hostname('wkl7.example.com')
+    assert label_store.label_resolution_cache is None
+    check_label_scopes(org)
+
+    store.load_workloads_from_json([make_workload_json(101, 'WKL101', None, ['10.1.1.1'], [1, 3, 5])])
+    assert label_store.label_resolution_cache is None
+    assert '/orgs/1/workloads/101' in {w.href for w in label_store.get_workloads_matching_label_scope([web, prod, shop])}
+    check_label_scopes(org)
+
+    print("\n✓ LabelResolutionCache tests passed!")
+
+
+if __name__ == '__main__':
+    test_name_indexes_follow_updates()
+    test_ip_indexes_follow_updates()
+    test_label_index_follows_updates()
+    test_label_resolution_cache_invalidation()
+
+    print("\n" + "=" * 60)
+    print("All WorkloadStore tests completed successfully!")
+    print("=" * 60)